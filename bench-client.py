@@ -0,0 +1,250 @@
+import argparse
+import asyncio
+import json
+import platform
+import sys
+import time
+
+from xasync import open_connection
+from xconnection import connect
+from xdraw import DrawBatch
+from xextensions import ExtensionRegistry, enable_big_requests
+from xids import IdAllocator
+from ximage import image_format, put_image
+from xmockserver import MockXServer
+
+# End-to-end client benchmarks.
+#
+# Measures connection setup, ListExtensions / QueryExtension round trips,
+# void-request throughput, Poly* primitive rate and PutImage bandwidth against
+# an X server and prints one JSON document with percentiles for every
+# measurement, for comparing releases. Each measurement that has an older
+# pattern is run both ways: one request and one wait (or one send) at a time
+# the way the scripts used to work, and pipelined with a single flush and a
+# single round trip. Without --host an in-process xmockserver is started,
+# optionally with latency or a bandwidth cap:
+#
+#   python bench-client.py --latency 20 > before.json
+#   python bench-client.py --host 192.168.2.8 --display 0 --repeat 50
+
+def percentiles(samples):
+    ordered = sorted(samples)
+
+    def at(fraction):
+        position = (len(ordered) - 1) * fraction
+        low = int(position)
+        high = min(low + 1, len(ordered) - 1)
+        return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+    return {"n": len(ordered), "min": ordered[0], "p50": at(0.5), "p90": at(0.9),
+            "p99": at(0.99), "max": ordered[-1], "mean": sum(ordered) / len(ordered)}
+
+def timed(function, repeat):
+    # Seconds per call, one sample per repetition
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+def latency_ms(samples):
+    return percentiles([seconds * 1000 for seconds in samples])
+
+def rate(samples, amount):
+    # amount per second, one value per repetition
+    return percentiles([amount / seconds for seconds in samples])
+
+def bench_setup(host, display, repeat):
+    def run():
+        connect(host, display).close()
+    return {"unit": "ms", "setup": latency_ms(timed(run, repeat))}
+
+def bench_extensions(conn, repeat):
+    proto = conn.proto
+    names = ExtensionRegistry(conn).list()
+
+    def list_extensions():
+        conn.send_request(proto.ListExtensions()).result()
+
+    def query_one_by_one():
+        # Send, then wait for the reply, for every name
+        for name in names:
+            conn.send_request(proto.QueryExtension(name.encode('ascii'))).result()
+
+    def query_pipelined():
+        futures = [conn.send_request(proto.QueryExtension(name.encode('ascii')))
+                   for name in names]
+        for future in futures:
+            future.result()
+
+    return {
+        "unit": "ms",
+        "extensions": len(names),
+        "list_extensions": latency_ms(timed(list_extensions, repeat)),
+        "query_extension": latency_ms(timed(
+            lambda: conn.send_request(proto.QueryExtension(b'RENDER')).result(), repeat)),
+        "query_all_one_by_one": latency_ms(timed(query_one_by_one, repeat)),
+        "query_all_pipelined": latency_ms(timed(query_pipelined, repeat)),
+    }
+
+def bench_void(conn, count, repeat):
+    request = conn.proto.NoOperation()
+
+    def send_each():
+        # One send per request
+        for _ in range(count):
+            conn.send_void(request)
+            conn.flush()
+        conn.sync()
+
+    # A round trip per request is slow enough that a hundredth of the
+    # requests gives a stable number
+    waited = max(1, count // 100)
+
+    def wait_each():
+        for _ in range(waited):
+            conn.send_void(request)
+            conn.sync()
+
+    def pipelined():
+        for _ in range(count):
+            conn.send_void(request)
+        conn.sync()
+
+    return {
+        "unit": "requests/s",
+        "requests": count,
+        "send_each": rate(timed(send_each, repeat), count),
+        "round_trip_each": rate(timed(wait_each, repeat), waited),
+        "pipelined": rate(timed(pipelined, repeat), count),
+    }
+
+def bench_void_async(host, display, count, repeat):
+    async def run():
+        conn = await open_connection(host, display)
+        request = conn.proto.NoOperation()
+        samples = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            for _ in range(count):
+                conn.send_void(request)
+            await conn.sync()
+            samples.append(time.perf_counter() - started)
+        await conn.close()
+        return samples
+
+    return {"unit": "requests/s", "requests": count,
+            "pipelined": rate(asyncio.run(run()), count)}
+
+def bench_poly(conn, drawable, gc, count, repeat):
+    def draw(kind):
+        def run():
+            with DrawBatch(conn, drawable, gc) as batch:
+                add = getattr(batch, kind)
+                for i in range(count):
+                    add(i % 512, i % 256, 8, 8)
+            conn.sync()
+        return run
+
+    def one_request_each():
+        encode = conn.proto.PolyFillRectangle
+        for i in range(count):
+            conn.send_void(encode(drawable, gc, [(i % 512, i % 256, 8, 8)]))
+        conn.sync()
+
+    return {
+        "unit": "primitives/s",
+        "primitives": count,
+        "fill_rectangle_one_request_each": rate(timed(one_request_each, repeat), count),
+        "fill_rectangle_batched": rate(timed(draw('fill_rectangle'), repeat), count),
+        "rectangle_batched": rate(timed(draw('rectangle'), repeat), count),
+        "arc_batched": rate(timed(draw('arc'), repeat), count),
+    }
+
+def bench_put_image(conn, drawable, gc, width, height, repeat):
+    # Pixels already in the server's format, so only the transfer is measured
+    fmt = image_format(conn.setup)
+    size = fmt.stride(width) * height
+    pixels = bytes(size)
+
+    def run():
+        put_image(conn, drawable, gc, pixels, width=width, height=height, fmt=fmt)
+        conn.sync()
+
+    return {"unit": "MB/s", "width": width, "height": height,
+            "put_image": rate(timed(run, repeat), size / 1e6)}
+
+def run_benchmarks(host, display, repeat, void_count, poly_count):
+    results = {"setup": bench_setup(host, display, repeat)}
+    conn = connect(host, display)
+    setup = conn.setup
+    screen = setup.screens[0]
+    results["server"] = {"vendor": setup.vendor, "release": setup.release,
+                         "width": screen.width_pixels, "height": screen.height_pixels}
+    results["extensions"] = bench_extensions(conn, repeat)
+    results["void"] = bench_void(conn, void_count, repeat)
+    results["void_async"] = bench_void_async(host, display, void_count, repeat)
+
+    big_requests = enable_big_requests(conn)
+    ids = IdAllocator(conn)
+    window = ids()
+    gc = ids()
+    width = min(640, screen.width_pixels)
+    height = min(480, screen.height_pixels)
+    conn.send_void(conn.proto.CreateWindow(0, window, screen.root, 0, 0, width, height,
+                                           0, 1, 0, 0, []))
+    conn.send_void(conn.proto.CreateGC(gc, window, 0x00010000, [0]))
+    results["poly"] = bench_poly(conn, window, gc, poly_count, repeat)
+    results["put_image"] = bench_put_image(conn, window, gc, width, height, repeat)
+    results["put_image"]["big_requests"] = big_requests
+    conn.send_void(conn.proto.FreeGC(gc))
+    conn.send_void(conn.proto.DestroyWindow(window))
+    conn.sync()
+    conn.close()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the X11 client against a server")
+    parser.add_argument("--host", help="X server to measure (default: in-process stand-in)")
+    parser.add_argument("--display", type=int, default=90)
+    parser.add_argument("--repeat", type=int, default=20, help="samples per measurement")
+    parser.add_argument("--void-count", type=int, default=10000)
+    parser.add_argument("--poly-count", type=int, default=10000)
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="stand-in server only: added delay in ms")
+    parser.add_argument("--bandwidth", type=float,
+                        help="stand-in server only: bytes per second in each direction")
+    parser.add_argument("--output", help="write the JSON here instead of stdout")
+    args = parser.parse_args()
+
+    server = None
+    host = args.host
+    if host is None:
+        host = "127.0.0.1"
+        server = MockXServer(args.display, host, args.latency / 1000, args.bandwidth).start()
+    try:
+        results = run_benchmarks(host, args.display, args.repeat, args.void_count,
+                                 args.poly_count)
+    finally:
+        if server is not None:
+            server.stop()
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "target": {"host": host, "display": args.display, "stand_in": server is not None,
+                   "latency_ms": args.latency if server else None,
+                   "bandwidth": args.bandwidth if server else None},
+        "repeat": args.repeat,
+        **results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as output:
+            output.write(text + "\n")
+    else:
+        sys.stdout.write(text + "\n")
+
+if __name__ == "__main__":
+    main()
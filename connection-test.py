@@ -1,88 +1,44 @@
-import socket
 import struct
-import os
+
+from xatoms import AtomTable
+from xbackbuffer import BackBuffer
+from xconnection import connect, XError
+from xdamage import DamageTracker, Region
+from xextensions import ExtensionRegistry, enable_big_requests
+from xfonts import FontCache
+from xids import IdAllocator
+from xinput import BUTTON1_MASK, KEY_PRESS, MOTION_NOTIFY, InputDecoder
+from xsetup import SetupCache
+from xtrace import hexdump
 
 host = "192.168.1.101"  # Replace with your X server's IP address
 port = 6000
 
-def send_request(sock, request):
-    sock.send(request)
-    response = sock.recv(4096)  # Receive a large buffer
-    return response
-
-def parse_extensions(data):
-    if len(data) < 32:
-        return []
-    num_extensions = struct.unpack('!B', data[1:2])[0]
-    print(f"Number of extensions reported: {num_extensions}")
-    extensions = []
-    offset = 32  # Start after the standard reply header
-    while offset < len(data):
-        name_length = data[offset]
-        offset += 1
-        if offset + name_length > len(data):
-            break
-        name = data[offset:offset+name_length].decode('ascii', errors='ignore').strip()
-        if name:  # Only add non-empty names
-            extensions.append(name)
-        offset += name_length
-        # Pad to multiple of 4 bytes
-        offset = (offset + 3) & ~3
-    return extensions
-
-def parse_vendor_name(data):
-    try:
-        vendor_length = struct.unpack("!H", data[8:10])[0]
-        vendor_name = data[32:32+vendor_length].decode('ascii', errors='ignore').strip()
-        return vendor_name
-    except Exception as e:
-        print(f"Error parsing vendor name: {e}")
-        return "Unable to parse vendor name"
-
-def parse_screen_info(data):
+def parse_vendor_name(setup):
+    return setup.vendor.strip()
+
+def parse_screen_info(setup):
+    screen = setup.screens[0]
+    return {
+        "root_window": screen.root,
+        "width_pixels": screen.width_pixels,
+        "height_pixels": screen.height_pixels,
+        "width_mm": screen.width_mm,
+        "height_mm": screen.height_mm,
+        "root_depth": screen.root_depth
+    }
+
+def get_server_info(conn):
+    request = struct.pack(conn.byte_order + "BBH", 0, 0, 1)  # QueryVersion request
     try:
-        root_window = struct.unpack("!I", data[132:136])[0]
-        width_in_pixels = struct.unpack("!H", data[136:138])[0]
-        height_in_pixels = struct.unpack("!H", data[138:140])[0]
-        width_in_mm = struct.unpack("!H", data[140:142])[0]
-        height_in_mm = struct.unpack("!H", data[142:144])[0]
-        root_depth = struct.unpack("!B", data[144:145])[0]
-        return {
-            "root_window": root_window,
-            "width_pixels": width_in_pixels,
-            "height_pixels": height_in_pixels,
-            "width_mm": width_in_mm,
-            "height_mm": height_in_mm,
-            "root_depth": root_depth
-        }
-    except Exception as e:
-        print(f"Error parsing screen info: {e}")
-        return "Unable to parse screen info"
-
-def query_extension(sock, extension_name):
-    name_bytes = extension_name.encode('ascii')
-    pad_length = -len(name_bytes) & 3  # Calculate padding to make total length a multiple of 4
-    request = struct.pack("!BBHI" + str(len(name_bytes)) + "s" + str(pad_length) + "x",
-                          98, 0, 2 + (len(name_bytes) + pad_length) // 4, len(name_bytes),
-                          name_bytes)
-    response = send_request(sock, request)
-    if len(response) >= 32:
-        present, major_opcode, first_event, first_error = struct.unpack("!BBBB", response[8:12])
-        return {
-            "present": bool(present),
-            "major_opcode": major_opcode if present else None,
-            "first_event": first_event if present else None,
-            "first_error": first_error if present else None
-        }
-    return None
-
-def get_server_info(sock):
-    request = struct.pack("!BBHI", 0, 0, 1, 0)  # QueryVersion request
-    response = send_request(sock, request)
+        response = conn.send_request(request).result()
+    except XError as e:
+        print(f"Server info request failed: {e}")
+        return None
     print("Server info response:")
     print_hex_dump(response)
     if len(response) >= 32:
-        major_version, minor_version = struct.unpack("!HH", response[8:12])
+        major_version, minor_version = struct.unpack(conn.byte_order + "HH", response[8:12])
         return {
             "major_version": major_version,
             "minor_version": minor_version
@@ -90,117 +46,181 @@ def get_server_info(sock):
     return None
 
 def print_hex_dump(data, prefix=''):
-    for i in range(0, len(data), 16):
-        hex_values = ' '.join(f'{b:02x}' for b in data[i:i+16])
-        ascii_values = ''.join(chr(b) if 32 <= b < 127 else '.' for b in data[i:i+16])
-        print(f"{prefix}{i:04x}: {hex_values:<48} {ascii_values}")
-
-def create_window(sock, screen_info):
-    window_id = struct.unpack("!I", os.urandom(4))[0] & 0x7FFFFFFF
-    request = struct.pack("!BBHIIHHHHHHII", 1, 0, 13,
-                          window_id,
-                          screen_info['root_window'],  # parent window (root)
-                          0, 0,  # x, y
-                          screen_info['width_pixels'], screen_info['height_pixels'],
-                          0,  # border width
-                          1,  # window class (InputOutput)
-                          0,  # visual (CopyFromParent)
-                          0x00000002,  # value mask (background pixel)
-                          0xFFFFFF)  # background pixel (white)
-    send_request(sock, request)
+    print(hexdump(data, prefix))
+
+def create_window(conn, ids, screen_info):
+    window_id = ids.allocate()
+    request = conn.proto.CreateWindow(0,  # depth (CopyFromParent)
+                                      window_id,
+                                      screen_info['root_window'],  # parent window (root)
+                                      0, 0,  # x, y
+                                      screen_info['width_pixels'], screen_info['height_pixels'],
+                                      0,  # border width
+                                      1,  # window class (InputOutput)
+                                      0,  # visual (CopyFromParent)
+                                      0x00000802,  # value mask (background pixel, event mask)
+                                      [0xFFFFFF,  # background pixel (white)
+                                       0x0002A00D])  # event mask (Exposure, KeyPress, ButtonPress,
+                                                     # ButtonRelease, ButtonMotion, StructureNotify)
+    conn.send_void(request)
     return window_id
 
-def load_font(sock, font_name):
-    font_id = struct.unpack("!I", os.urandom(4))[0] & 0x7FFFFFFF
-    request = struct.pack("!BBHI", 45, 0, 2 + (len(font_name) + 3) // 4, font_id)
-    request += font_name.encode('ascii')
-    request += b'\0' * (-len(font_name) % 4)
-    send_request(sock, request)
-    return font_id
-
-def create_gc(sock, window_id, font_id):
-    gc_id = struct.unpack("!I", os.urandom(4))[0] & 0x7FFFFFFF
-    request = struct.pack("!BBHIIII", 55, 0, 6, gc_id, window_id,
-                          0x00000004,  # value mask (font)
-                          font_id)
-    send_request(sock, request)
+def load_font(fonts, font_name):
+    # OpenFont, plus one QueryFont the first time this server sees the font;
+    # returns the font ID and its metrics for measuring text locally
+    return fonts.open(font_name)
+
+def set_window_properties(conn, atoms, window_id, title):
+    # Title, and WM_PROTOCOLS so the window manager sends WM_DELETE_WINDOW
+    # instead of killing the connection; the atoms come from one InternAtom
+    # flight, or none once they are cached for this server
+    wm_atoms = atoms.intern_many(["WM_PROTOCOLS", "WM_DELETE_WINDOW", "_NET_WM_NAME", "UTF8_STRING"])
+    title = title.encode('utf-8')
+    conn.send_void(conn.proto.ChangeProperty(0, window_id, atoms["WM_NAME"], atoms["STRING"],
+                                             8, len(title), title))
+    conn.send_void(conn.proto.ChangeProperty(0, window_id, wm_atoms["_NET_WM_NAME"],
+                                             wm_atoms["UTF8_STRING"], 8, len(title), title))
+    conn.send_void(conn.proto.ChangeProperty(0, window_id, wm_atoms["WM_PROTOCOLS"], atoms["ATOM"],
+                                             32, 1, struct.pack(conn.byte_order + "I",
+                                                                wm_atoms["WM_DELETE_WINDOW"])))
+    return wm_atoms["WM_DELETE_WINDOW"]
+
+def create_gc(conn, ids, window_id, font_id):
+    gc_id = ids.allocate()
+    request = conn.proto.CreateGC(gc_id, window_id,
+                                  0x00004000,  # value mask (font)
+                                  [font_id])
+    conn.send_void(request)
+    return gc_id
+
+def create_fill_gc(conn, ids, window_id, pixel):
+    gc_id = ids.allocate()
+    conn.send_void(conn.proto.CreateGC(gc_id, window_id, 0x00000004, [pixel]))  # foreground
     return gc_id
 
-def draw_text(sock, window_id, gc_id, x, y, text):
-    request = struct.pack("!BBHIIIH", 74, 0, 6 + (len(text) + 3) // 4,
-                          window_id, gc_id, x, y, len(text))
-    request += text.encode('ascii')
-    request += b'\0' * (-len(text) % 4)
-    send_request(sock, request)
+def draw_text(batch, x, y, text):
+    # Queued on the batch; the caller flushes once per redraw
+    batch.text(x, y, text.encode('ascii'))
+
+def draw_centered(batch, font, width, y, text):
+    draw_text(batch, (width - font.width(text)) // 2, y, text)
 
 try:
-    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    sock.connect((host, port))
+    # Setup tables, font metrics and atoms are kept on disk between runs
+    cache = SetupCache()
+    try:
+        conn = connect(host, port - 6000, byte_order="server", setup_cache=cache)
+    except ConnectionError as e:
+        print(f"Handshake failed: {e}")
+        exit(1)
 
-    setup_message = struct.pack("!BxHHHHHI", ord('B'), 11, 0, 0, 0, 0, 0)
-    sock.send(setup_message)
-    handshake_response = sock.recv(4096)
+    handshake_response = conn.setup_data
     print(f"Handshake response size: {len(handshake_response)} bytes")
     print("Raw handshake response:")
     print_hex_dump(handshake_response)
 
-    if handshake_response[0] != 1:
-        print("Handshake failed")
-        sock.close()
-        exit(1)
-
-    vendor_name = parse_vendor_name(handshake_response)
+    vendor_name = parse_vendor_name(conn.setup)
     print(f"Vendor name from handshake: {vendor_name}")
 
-    screen_info = parse_screen_info(handshake_response)
+    screen_info = parse_screen_info(conn.setup)
     print(f"Screen info: {screen_info}")
 
-    extension_request = struct.pack("!BBHI", 99, 0, 1, 0)  # ListExtensions request
-    extension_response = send_request(sock, extension_request)
-    print(f"Extension response size: {len(extension_response)} bytes")
-    print("Raw extension response:")
-    print_hex_dump(extension_response)
-
-    extensions = parse_extensions(extension_response)
+    # ListExtensions, then every QueryExtension in a single flight
+    registry = ExtensionRegistry(conn)
+    extensions = registry.list()
+    print(f"Number of extensions reported: {len(extensions)}")
     print("Extensions:")
     for ext in extensions:
         print(f"- {ext}")
 
-    for ext in ["GLX", "RENDER", "SHAPE"]:
-        ext_info = query_extension(sock, ext)
+    for ext, ext_info in registry.probe(["GLX", "RENDER", "SHAPE"]).items():
         print(f"{ext} extension info: {ext_info}")
 
-    server_info = get_server_info(sock)
+    if enable_big_requests(conn, registry):
+        print(f"BIG-REQUESTS enabled, maximum request length: {conn.max_request_length * 4} bytes")
+
+    server_info = get_server_info(conn)
     print(f"Server info: {server_info}")
 
-    window_id = create_window(sock, screen_info)
+    # Resource IDs from the range the server assigned to this connection
+    ids = IdAllocator(conn, registry)
+    window_id = create_window(conn, ids, screen_info)
     
+    atoms = AtomTable(conn, cache)
+    wm_delete_window = set_window_properties(conn, atoms, window_id, "Hello, X11!")
+
     # Map the window (make it visible)
-    map_request = struct.pack("!BBHI", 8, 0, 2, window_id)
-    send_request(sock, map_request)
+    map_request = conn.proto.MapWindow(window_id)
+    conn.send_void(map_request)
 
     # Load a font (you may need to adjust the font name for your system)
-    font_id = load_font(sock, "fixed")
-
-    # Create a graphics context with the loaded font
-    gc_id = create_gc(sock, window_id, font_id)
-
-    # Event handling loop
+    fonts = FontCache(conn, ids, cache)
+    font_id, font = load_font(fonts, "fixed")
+
+    # Create a graphics context with the loaded font, and one to clear with
+    gc_id = create_gc(conn, ids, window_id, font_id)
+    clear_gc_id = create_fill_gc(conn, ids, window_id, 0xFFFFFF)
+
+    # Frames are drawn off-screen and shown with one CopyArea
+    back_buffer = BackBuffer(conn, window_id, screen_info['width_pixels'],
+                             screen_info['height_pixels'], ids.allocate)
+
+    def redraw(window, region):
+        # One redraw per burst of Expose events; the frame is rebuilt
+        # off-screen and only what was uncovered is copied to the window
+        with back_buffer.batch(clear_gc_id) as batch:
+            batch.fill_rectangle(0, 0, back_buffer.width, back_buffer.height)
+        # With the font's widths, strings on one baseline share a request
+        with back_buffer.batch(gc_id, text_width=font.width) as batch:
+            draw_text(batch, 10, 50, "Hello, X11!")
+            draw_centered(batch, font, back_buffer.width, 50 + font.height,
+                          f"{vendor_name} {screen_info['width_pixels']}x{screen_info['height_pixels']}")
+        back_buffer.present(region)
+
+    damage = DamageTracker(conn, redraw)
+    # Key, button and motion events, with queued drag motion merged
+    input_events = InputDecoder(conn)
+
+    def draw_trail(x, y):
+        trail = Region()
+        trail.add(x - 2, y - 2, 4, 4)
+        with back_buffer.batch(gc_id) as batch:
+            batch.fill_rectangle(x - 2, y - 2, 4, 4)
+        back_buffer.present(trail)
+
+    # Event handling loop; next_event() flushes the queued requests above
     while True:
-        event = sock.recv(32)
-        if not event:
+        try:
+            event = conn.next_event()
+        except ConnectionError:
             break
 
-        event_type = event[0]
+        event_type = event[0] & 0x7F
         
-        if event_type == 12:  # Exposure
-            # Redraw the text
-            draw_text(sock, window_id, gc_id, 10, 50, "Hello, X11!")
-        elif event_type == 2:  # KeyPress
+        if damage.feed(event):  # Expose / GraphicsExpose
+            continue
+        elif back_buffer.handle_event(event):  # ConfigureNotify with a new size
+            # The server sends Expose events for whatever needs repainting
+            continue
+        elif event_type == 33:  # ClientMessage
+            if struct.unpack_from(conn.byte_order + "I", event, 12)[0] == wm_delete_window:
+                break
+            continue
+
+        record = input_events.feed(event)
+        if record is None:
+            continue
+        if record.code == KEY_PRESS:
             # Exit on any key press
+            print(f"Key pressed: keycode {record.keycode}, keysym 0x{record.keysym:x} "
+                  f"{record.text!r}")
             break
+        elif record.code == MOTION_NOTIFY and record.state & BUTTON1_MASK:
+            # Dragging paints a trail, once per batch of queued motion
+            draw_trail(record.x, record.y)
 
-    sock.close()
+    back_buffer.close()
+    conn.close()
 
 except Exception as e:
     print(f"Error: {e}")
@@ -0,0 +1,476 @@
+import argparse
+import array
+import heapq
+import json
+import mmap
+import struct
+import sys
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from xproto import REQUESTS, REQUEST_NAMES, TYPES, STRING, VALUES, BYTES
+from xtrace import MAGIC, RECORD, REQUEST, SETUP
+
+# Offline decoder for captured X11 traffic.
+#
+# Reads either a capture written by xtrace.WireTrace.export() or the two raw
+# byte streams of a TCP connection (e.g. "Follow TCP stream" saved as raw
+# data from each side), both through mmap, so multi-hundred-MB files are
+# never read into memory. Client data is split into requests, server data
+# into replies, events and errors; replies are matched to their requests by
+# sequence number, and extension opcodes are named from the QueryExtension
+# replies in the capture. The summary lists the top opcodes by count and by
+# bytes and, for WireTrace captures (which have timestamps), the longest gaps
+# between frames. --decode also prints every message with its fields.
+#
+# Splitting a raw client stream still takes one Python step per request
+# (about a microsecond), so the rate depends on the traffic: image
+# uploads go through at memory speed, a stream of nothing but 4-12 byte
+# requests at around 10 MB/s.
+#
+#   python decode-capture.py trace.xtr --top 15
+#   python decode-capture.py --client c2s.bin --server s2c.bin --json
+
+ERROR_NAMES = {1: 'Request', 2: 'Value', 3: 'Window', 4: 'Pixmap', 5: 'Atom', 6: 'Cursor',
+               7: 'Font', 8: 'Match', 9: 'Drawable', 10: 'Access', 11: 'Alloc',
+               12: 'Colormap', 13: 'GContext', 14: 'IDChoice', 15: 'Name', 16: 'Length',
+               17: 'Implementation'}
+
+EVENT_NAMES = {2: 'KeyPress', 3: 'KeyRelease', 4: 'ButtonPress', 5: 'ButtonRelease',
+               6: 'MotionNotify', 7: 'EnterNotify', 8: 'LeaveNotify', 9: 'FocusIn',
+               10: 'FocusOut', 11: 'KeymapNotify', 12: 'Expose', 13: 'GraphicsExpose',
+               14: 'NoExpose', 15: 'VisibilityNotify', 16: 'CreateNotify',
+               17: 'DestroyNotify', 18: 'UnmapNotify', 19: 'MapNotify', 20: 'MapRequest',
+               21: 'ReparentNotify', 22: 'ConfigureNotify', 23: 'ConfigureRequest',
+               24: 'GravityNotify', 25: 'ResizeRequest', 26: 'CirculateNotify',
+               27: 'CirculateRequest', 28: 'PropertyNotify', 29: 'SelectionClear',
+               30: 'SelectionRequest', 31: 'SelectionNotify', 32: 'ColormapNotify',
+               33: 'ClientMessage', 34: 'MappingNotify', 35: 'GenericEvent'}
+
+QUERY_EXTENSION = 98
+
+_RESOURCE_TYPES = {'WINDOW', 'PIXMAP', 'DRAWABLE', 'GCONTEXT', 'FONT', 'FONTABLE',
+                   'COLORMAP', 'CURSOR', 'BITMASK'}
+
+class Summary:
+    def __init__(self):
+        self.requests = [0] * 256
+        self.request_bytes = [0] * 256
+        self.replies = [0] * 256
+        self.reply_bytes = [0] * 256
+        self.events = [0] * 128
+        self.errors = {}
+        self.extensions = {}      # major opcode -> name
+        self.queries = {}         # sequence -> name of a QueryExtension request
+        self.opcodes = bytearray()  # opcode of every request, by sequence - 1
+        self.gaps = []            # heap of (gap, time, before, after)
+        self.bytes = 0
+        self.truncated = False
+
+    def opcode_name(self, opcode):
+        if opcode in self.extensions:
+            return self.extensions[opcode]
+        return REQUEST_NAMES.get(opcode, f"opcode {opcode}")
+
+    def opcode_of(self, sequence):
+        if 0 < sequence <= len(self.opcodes):
+            return self.opcodes[sequence - 1]
+        return None
+
+    def report(self, top):
+        def ranked(counts, sizes):
+            order = sorted(range(256), key=lambda opcode: counts[opcode], reverse=True)
+            return [{"opcode": opcode, "name": self.opcode_name(opcode),
+                     "count": counts[opcode], "bytes": sizes[opcode]}
+                    for opcode in order[:top] if counts[opcode]]
+
+        by_bytes = sorted(range(256), key=lambda opcode: self.request_bytes[opcode],
+                          reverse=True)
+        result = {
+            "bytes": self.bytes,
+            "requests": sum(self.requests),
+            "replies": sum(self.replies),
+            "events": sum(self.events),
+            "errors": sum(self.errors.values()),
+            "truncated": self.truncated,
+            "top_requests": ranked(self.requests, self.request_bytes),
+            "top_request_bytes": [{"opcode": opcode, "name": self.opcode_name(opcode),
+                                   "bytes": self.request_bytes[opcode],
+                                   "count": self.requests[opcode]}
+                                  for opcode in by_bytes[:top] if self.request_bytes[opcode]],
+            "top_replies": ranked(self.replies, self.reply_bytes),
+            "event_counts": {EVENT_NAMES.get(code, f"event {code}"): count
+                             for code, count in enumerate(self.events) if count},
+            "error_counts": {f"{ERROR_NAMES.get(code, code)} in {self.opcode_name(major)}": count
+                             for (code, major), count in self.errors.items()},
+            "extensions": {name: opcode for opcode, name in sorted(self.extensions.items())},
+        }
+        if self.gaps:
+            result["longest_gaps"] = [{"gap_ms": round(gap * 1000, 3), "at": when,
+                                       "before": before, "after": after}
+                                      for gap, when, before, after in sorted(self.gaps,
+                                                                             reverse=True)]
+        return result
+
+class FieldDecoder:
+    # Symbolic rendering of requests from the xproto table, for --decode
+
+    def __init__(self, byte_order, summary):
+        self.byte_order = byte_order
+        self.summary = summary
+        self._requests = {request.opcode: request for request in REQUESTS}
+        self._layouts = {}
+        self._error = struct.Struct(byte_order + 'BBHIHB')
+
+    def _layout(self, request, big):
+        key = (request.opcode, big)
+        layout = self._layouts.get(key)
+        if layout is None:
+            formats = ''.join(TYPES[kind] for _, kind in request.fields)
+            fields = [(name, kind) for name, kind in request.fields if not kind.startswith('PAD')]
+            layout = self._layouts[key] = (
+                struct.Struct(self.byte_order + ('8x' if big else '4x') + formats), fields)
+        return layout
+
+    def request(self, sequence, data, length):
+        opcode = data[0]
+        name = self.summary.opcode_name(opcode)
+        request = self._requests.get(opcode)
+        parts = [f"#{sequence} -> {name}"]
+        if request is not None:
+            big = data[2] == 0 and data[3] == 0
+            layout, fields = self._layout(request, big)
+            if request.data and request.data[1] != 'STRLEN8':
+                parts.append(f"{request.data[0]}={data[1]}")
+            if len(data) >= layout.size:
+                values = layout.unpack_from(data)
+                size = data[1]
+                for (field, kind), value in zip(fields, values):
+                    if kind in _RESOURCE_TYPES:
+                        parts.append(f"{field}=0x{value:x}")
+                    elif kind == 'STRLEN16':
+                        size = value
+                    else:
+                        parts.append(f"{field}={value}")
+                rest = length - layout.size
+                if request.tail == STRING:
+                    text = bytes(data[layout.size:layout.size + size])
+                    parts.append(repr(text.decode('latin-1')))
+                elif request.tail == VALUES:
+                    parts.append(f"values={rest // 4}")
+                elif request.tail == BYTES:
+                    parts.append(f"data={rest} bytes")
+                elif request.tail is not None:
+                    parts.append(f"items={rest // (2 * len(request.tail))}")
+        elif opcode >= 128:
+            parts.append(f"minor={data[1]}")
+        parts.append(f"({length} bytes)")
+        return ' '.join(parts)
+
+    def message(self, sequence, data, length):
+        kind = data[0]
+        if kind == 0:
+            _, code, _, bad, minor, major = self._error.unpack_from(data)
+            return (f"#{sequence} <- error {ERROR_NAMES.get(code, code)} "
+                    f"in {self.summary.opcode_name(major)}.{minor}, value 0x{bad:x}")
+        if kind == 1:
+            opcode = self.summary.opcode_of(sequence)
+            name = self.summary.opcode_name(opcode) if opcode is not None else "?"
+            return f"#{sequence} <- reply to {name} ({length} bytes)"
+        code = kind & 0x7F
+        sent = " (SendEvent)" if kind & 0x80 else ""
+        return f"#{sequence} <- {EVENT_NAMES.get(code, f'event {code}')}{sent}"
+
+# Accounting shared by both input formats
+
+def count_request(summary, sequence, data, opcode, length, byte_order):
+    summary.requests[opcode] += 1
+    summary.request_bytes[opcode] += length
+    if opcode == QUERY_EXTENSION:
+        summary.queries[sequence] = _query_name(data, byte_order)
+
+def _query_name(data, byte_order):
+    size = struct.unpack_from(byte_order + 'H', data, 4)[0]
+    return bytes(data[8:8 + size]).decode('latin-1')
+
+def count_message(summary, sequence, data, length, byte_order):
+    kind = data[0]
+    if kind == 1:
+        opcode = summary.opcode_of(sequence)
+        if opcode is not None:
+            summary.replies[opcode] += 1
+            summary.reply_bytes[opcode] += length
+            if opcode == QUERY_EXTENSION and sequence in summary.queries and data[8]:
+                summary.extensions[data[9]] = summary.queries[sequence]
+    elif kind == 0:
+        opcode = summary.opcode_of(sequence)
+        key = (data[1], data[10] if opcode is None else opcode)
+        summary.errors[key] = summary.errors.get(key, 0) + 1
+    else:
+        summary.events[kind & 0x7F] += 1
+
+# Raw TCP streams
+
+def scan_client(buffer, summary, decoder, output):
+    if len(buffer) < 12:
+        return None
+    byte_order = '>' if buffer[0] == 0x42 else '<'
+    name_len, data_len = struct.unpack_from(byte_order + 'HH', buffer, 6)
+    offset = 12 + name_len + (-name_len % 4) + data_len + (-data_len % 4)
+    if decoder is None:
+        offset = _frame_requests(buffer, offset, byte_order, summary)
+        summary.bytes += offset
+        return byte_order
+
+    short = struct.Struct(byte_order + 'H').unpack_from
+    long = struct.Struct(byte_order + 'I').unpack_from
+    end = len(buffer)
+    sequence = 0
+    while offset + 4 <= end:
+        opcode = buffer[offset]
+        length = short(buffer, offset + 2)[0]
+        if length == 0:
+            if offset + 8 > end:
+                break
+            length = long(buffer, offset + 4)[0]
+        size = length * 4
+        if size < 4 or offset + size > end:
+            summary.truncated = True
+            break
+        sequence += 1
+        summary.opcodes.append(opcode)
+        data = buffer[offset:offset + min(size, 4096)]
+        count_request(summary, sequence, data, opcode, size, byte_order)
+        output.write(decoder.request(sequence, data, size) + '\n')
+        offset += size
+    summary.bytes += offset
+    return byte_order
+
+def _frame_requests(buffer, offset, byte_order, summary):
+    # The hot loop: requests are 4-byte aligned, so the stream is walked as
+    # 16-bit words (length = word 1 of each request) and only the opcode and
+    # size of every request are collected; counting happens afterwards in
+    # bulk. Returns the offset after the last complete request.
+    usable = (len(buffer) - offset) // 4 * 4
+    native = (byte_order == '<') == (sys.byteorder == 'little')
+    long = struct.Struct(byte_order + 'I').unpack_from
+    opcodes = summary.opcodes
+    first_sequence = len(opcodes)
+    add_opcode = opcodes.append
+    sizes = array.array('I')
+    add_size = sizes.append
+    with memoryview(buffer) as view, view[offset:offset + usable] as data, \
+            data.cast('H') as words:
+        count = len(words)
+        word = 0
+        while word + 2 <= count:
+            length = words[word + 1]
+            if not native:
+                length = (length & 0xFF) << 8 | length >> 8
+            if length == 0:
+                # BIG-REQUESTS form: the real length follows the header
+                if word + 4 > count:
+                    break
+                length = long(data, word * 2 + 4)[0]
+            if length == 0 or word + length * 2 > count:
+                summary.truncated = True
+                break
+            opcode = data[word * 2]
+            add_opcode(opcode)
+            add_size(length * 4)
+            if opcode == QUERY_EXTENSION:
+                summary.queries[len(opcodes)] = _query_name(data[word * 2:], byte_order)
+            word += length * 2
+    end = offset + word * 2
+    if end < len(buffer):
+        summary.truncated = True
+
+    if np is not None:
+        codes = np.frombuffer(opcodes, dtype=np.uint8)[first_sequence:]
+        counts = np.bincount(codes, minlength=256)
+        totals = np.bincount(codes, weights=np.frombuffer(sizes, dtype=np.uint32),
+                             minlength=256)
+        # Let go of the bytearray's buffer so it can grow again
+        del codes
+        for opcode in np.flatnonzero(counts).tolist():
+            summary.requests[opcode] += int(counts[opcode])
+            summary.request_bytes[opcode] += int(totals[opcode])
+    else:
+        for opcode, size in zip(opcodes[first_sequence:], sizes):
+            summary.requests[opcode] += 1
+            summary.request_bytes[opcode] += size
+    return end
+
+def scan_server(buffer, summary, byte_order, decoder, output):
+    if len(buffer) < 8:
+        return
+    short = struct.Struct(byte_order + 'H').unpack_from
+    long = struct.Struct(byte_order + 'I').unpack_from
+    offset = 8 + short(buffer, 6)[0] * 4
+    events = summary.events
+    end = len(buffer)
+    sequence = 0
+    while offset + 32 <= end:
+        kind = buffer[offset]
+        size = 32
+        if kind == 1 or kind & 0x7F == 35:
+            size += long(buffer, offset + 4)[0] * 4
+        if offset + size > end:
+            summary.truncated = True
+            break
+        if kind & 0x7F != 11:
+            # Server sequence numbers never go backwards
+            sequence += (short(buffer, offset + 2)[0] - sequence) & 0xFFFF
+        if kind > 1 and decoder is None:
+            events[kind & 0x7F] += 1
+        else:
+            data = buffer[offset:offset + 32]
+            count_message(summary, sequence, data, size, byte_order)
+            if decoder is not None:
+                output.write(decoder.message(sequence, data, size) + '\n')
+        offset += size
+    summary.bytes += offset
+
+def decode_streams(client_path, server_path, byte_order, summary, decode, output):
+    if client_path:
+        with open(client_path, 'rb') as client, _map(client) as buffer:
+            byte_order = scan_client(buffer, summary, None, output) or byte_order
+    if server_path:
+        with open(server_path, 'rb') as server, _map(server) as buffer:
+            scan_server(buffer, summary, byte_order, None, output)
+    if decode:
+        # Second pass that prints, now that the server side has named the
+        # extension opcodes; its counts (and its own table of request
+        # opcodes) are thrown away, the decoder looks replies up in summary
+        decoder = FieldDecoder(byte_order, summary)
+        counts = Summary()
+        counts.extensions = summary.extensions
+        if client_path:
+            with open(client_path, 'rb') as client, _map(client) as buffer:
+                scan_client(buffer, counts, decoder, output)
+        if server_path:
+            with open(server_path, 'rb') as server, _map(server) as buffer:
+                scan_server(buffer, counts, byte_order, decoder, output)
+
+# WireTrace captures
+
+def decode_trace(path, summary, top, decode, output):
+    with open(path, 'rb') as capture, _map(capture) as buffer:
+        if buffer[:8] != MAGIC:
+            raise ValueError(f"{path} is not a wire trace capture; "
+                             f"use --client/--server for raw streams")
+        byte_order = '>' if buffer[8:9] == b'B' else '<'
+        decoder = FieldDecoder(byte_order, summary) if decode else None
+        unpack = RECORD.unpack_from
+        record_size = RECORD.size
+        gaps = summary.gaps
+        end = len(buffer)
+        offset = 16
+        previous = None
+        last_label = None
+        while offset + record_size <= end:
+            when, kind, _, sequence, length, stored = unpack(buffer, offset)
+            start = offset + record_size
+            offset = start + stored
+            if offset > end:
+                summary.truncated = True
+                break
+            summary.bytes += length
+            if kind == SETUP:
+                continue
+            data = buffer[start:offset]
+            if kind == REQUEST:
+                opcode = data[0]
+                # Captures hold the ring only, so sequence numbers may start
+                # anywhere: pad the opcode table up to this request
+                missing = sequence - 1 - len(summary.opcodes)
+                if missing > 0:
+                    summary.opcodes.extend(bytes(missing))
+                if sequence == len(summary.opcodes) + 1:
+                    summary.opcodes.append(opcode)
+                count_request(summary, sequence, data, opcode, length, byte_order)
+                if decoder is not None:
+                    output.write(f"{when:.6f} {decoder.request(sequence, data, length)}\n")
+                label = f"#{sequence} {summary.opcode_name(opcode)}"
+            else:
+                count_message(summary, sequence, data, length, byte_order)
+                if decoder is not None:
+                    output.write(f"{when:.6f} {decoder.message(sequence, data, length)}\n")
+                label = f"#{sequence} {_MESSAGE_KINDS.get(data[0], 'event')}"
+            if previous is not None:
+                gap = when - previous
+                entry = (gap, previous, last_label, label)
+                if len(gaps) < top:
+                    heapq.heappush(gaps, entry)
+                elif gap > gaps[0][0]:
+                    heapq.heapreplace(gaps, entry)
+            previous = when
+            last_label = label
+
+_MESSAGE_KINDS = {0: 'error', 1: 'reply'}
+
+def _map(file):
+    return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+def print_report(report, output):
+    output.write(f"{report['bytes']:,} bytes, {report['requests']:,} requests, "
+                 f"{report['replies']:,} replies, {report['events']:,} events, "
+                 f"{report['errors']:,} errors\n")
+    if report['truncated']:
+        output.write("capture ends in the middle of a message\n")
+    sections = [("Top requests by count", report['top_requests']),
+                ("Top requests by bytes", report['top_request_bytes']),
+                ("Top replies", report['top_replies'])]
+    for title, rows in sections:
+        output.write(f"\n{title}:\n")
+        for row in rows:
+            output.write(f"  {row['name']:<28} {row['count']:>12,} {row['bytes']:>16,} bytes\n")
+    for title, key in (("Events", 'event_counts'), ("Errors", 'error_counts')):
+        if report[key]:
+            output.write(f"\n{title}:\n")
+            for name, count in sorted(report[key].items(), key=lambda item: -item[1]):
+                output.write(f"  {name:<40} {count:>12,}\n")
+    if report.get('longest_gaps'):
+        output.write("\nLongest gaps:\n")
+        for gap in report['longest_gaps']:
+            output.write(f"  {gap['gap_ms']:>10.3f} ms at {gap['at']:.6f}  "
+                         f"{gap['before']} -> {gap['after']}\n")
+
+def main():
+    parser = argparse.ArgumentParser(description="Decode and summarize captured X11 traffic")
+    parser.add_argument("capture", nargs="?", help="capture written by xtrace.WireTrace.export()")
+    parser.add_argument("--client", help="raw client-to-server byte stream")
+    parser.add_argument("--server", help="raw server-to-client byte stream")
+    parser.add_argument("--byte-order", choices=["msb", "lsb"], default="lsb",
+                        help="byte order of a server stream given without its client stream")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--decode", action="store_true", help="print every message")
+    parser.add_argument("--json", action="store_true", help="print the summary as JSON")
+    args = parser.parse_args()
+    if not args.capture and not (args.client or args.server):
+        parser.error("give a capture file or --client/--server streams")
+
+    output = sys.stdout
+    summary = Summary()
+    started = time.perf_counter()
+    if args.capture:
+        decode_trace(args.capture, summary, args.top, args.decode, output)
+    else:
+        decode_streams(args.client, args.server, '>' if args.byte_order == "msb" else '<',
+                       summary, args.decode, output)
+    elapsed = time.perf_counter() - started
+
+    report = summary.report(args.top)
+    if args.json:
+        output.write(json.dumps(report, indent=2) + "\n")
+    else:
+        print_report(report, output)
+    print(f"{summary.bytes / 1e6:.1f} MB in {elapsed:.2f}s "
+          f"({summary.bytes / 1e6 / max(elapsed, 1e-9):.0f} MB/s)", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
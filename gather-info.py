@@ -1,55 +1,38 @@
-import socket
-import struct
+from xconnection import connect
 
 # X11 connection parameters
 host = "192.168.2.8"  # XSDL display IP address
-port = 6000             # X server port
+display = 0             # X server port is 6000 + display
 
 try:
-    # Step 1: Connect to the X server using TCP
-    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    sock.connect((host, port))
+    # Step 1: Connect to the X server using TCP and run the setup handshake
+    conn = connect(host, display, byte_order='server')
+    setup = conn.setup
 
     print("Connected to X server.")
 
-    # Step 2: Send an initial setup message to the X server
-    # Byte order: 'B' (big-endian), protocol version 11.0
-    setup_message = struct.pack("=BxHHHHH", ord('B'), 11, 0, 0, 0, 0)
-    sock.send(setup_message)
+    # Step 2: Extract and print key information from the setup block
 
-    # Step 3: Receive the server response (small buffer)
-    response = sock.recv(1024)  # Increase buffer size slightly
-
-    # Step 4: Extract and print key information from the setup response
-
-    # Extract byte order (first byte in the response)
-    byte_order = struct.unpack_from("=B", response, 0)[0]
-    if byte_order == 0x42:
+    # Byte order the server uses for images
+    if setup.image_byte_order == 1:
         print("Byte order: Big-endian")
-    elif byte_order == 0x6C:
-        print("Byte order: Little-endian")
     else:
-        print(f"Unknown byte order: {byte_order}")
-
-    # Protocol version (2 bytes each for major and minor)
-    protocol_major, protocol_minor = struct.unpack_from("=HH", response, 2)
-    print(f"Protocol version: {protocol_major}.{protocol_minor}")
-
-    # Number of screens (2 bytes at offset 16)
-    num_screens = struct.unpack_from("=H", response, 16)[0]
-    print(f"Number of screens: {num_screens}")
+        print("Byte order: Little-endian")
 
-    # Extract root window ID (4 bytes at offset 24)
-    root_window_id = struct.unpack_from("=L", response, 24)[0]
-    print(f"Root window ID: {root_window_id}")
+    print(f"Protocol version: {setup.protocol_major}.{setup.protocol_minor}")
+    print(f"Vendor: {setup.vendor} (release {setup.release})")
+    print(f"Number of screens: {len(setup.screens)}")
 
-    # Extract screen dimensions (width and height, 2 bytes each, at offset 32 and 34)
-    screen_width = struct.unpack_from("=H", response, 32)[0]
-    screen_height = struct.unpack_from("=H", response, 34)[0]
-    print(f"Screen size: {screen_width}x{screen_height}")
+    for number, screen in enumerate(setup.screens):
+        print(f"Screen {number}:")
+        print(f"  Root window ID: {screen.root}")
+        print(f"  Screen size: {screen.width_pixels}x{screen.height_pixels} "
+              f"({screen.width_mm}x{screen.height_mm} mm)")
+        print(f"  Root depth: {screen.root_depth}")
+        print(f"  Depths: {sorted(screen.visuals_by_depth)}")
 
     # Close the socket connection
-    sock.close()
+    conn.close()
 
 except Exception as e:
     print(f"Failed to connect or gather information from X server: {e}")
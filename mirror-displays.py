@@ -0,0 +1,131 @@
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+from xconnection import connect
+from xdraw import DrawBatch
+from ximage import image_format, put_image
+from xmirror import open_mirror
+
+# Shows one dashboard on many displays.
+#
+# Connects to every display given as host:display at once, opens a window of
+# the first display's size on each and redraws a small dashboard (a progress
+# bar, a clock line and a scrolling colour band sent with PutImage) --fps
+# times a second. Every request is encoded once and fanned out; a display
+# that falls more than --high-water bytes behind skips frames instead of
+# slowing the rest down. Per-display frame and drop counts are printed as
+# JSON at the end. --stand-in N runs against N in-process stand-in servers,
+# the second one with another client already connected (so its resource IDs
+# differ) and the last one with a slow link:
+#
+#   python mirror-displays.py 192.168.2.8:0 192.168.2.9:0 --fps 10 --seconds 60
+#   python mirror-displays.py --stand-in 3 --seconds 5
+
+def parse_target(text):
+    host, _, display = text.rpartition(':')
+    return (host or text, int(display) if host else 0)
+
+def create_dashboard(session, width, height):
+    screen = session.setup.screens[0]
+    window = session.ids()
+    background = session.ids()
+    foreground = session.ids()
+    proto = session.proto
+    session.send_void(proto.CreateWindow(0, window, screen.root, 0, 0, width, height, 0, 1, 0,
+                                         0x00000002, [0x202020]))  # background pixel
+    session.send_void(proto.CreateGC(background, window, 0x00010004, [0x202020, 0]))
+    session.send_void(proto.CreateGC(foreground, window, 0x00010004, [0x40C0FF, 0]))
+    session.send_void(proto.MapWindow(window))
+    return window, background, foreground
+
+def color_ramp(fmt, width):
+    # Twice the band's width of a repeating colour ramp, so any scroll offset
+    # is one slice; 32-bit pixels in the server's byte order
+    ramp = bytearray()
+    for x in range(2 * width):
+        level = x * 4 % 512
+        level = level if level < 256 else 511 - level
+        ramp += (level | (255 - level) << 16).to_bytes(4, 'big' if fmt.byte_order == '>' else 'little')
+    return ramp
+
+async def run(session, fps, seconds):
+    width = min(640, session.setup.screens[0].width_pixels)
+    height = min(240, session.setup.screens[0].height_pixels)
+    window, background, foreground = create_dashboard(session, width, height)
+    fmt = image_format(session.setup)
+    band_rows = 32
+    ramp = color_ramp(fmt, width)
+    interval = 1.0 / fps
+    frames = int(seconds * fps)
+    started = time.monotonic()
+    for frame in range(frames):
+        with session.frame():
+            with DrawBatch(session, window, background) as batch:
+                batch.fill_rectangle(0, 0, width, height)
+            with DrawBatch(session, window, foreground) as batch:
+                batch.fill_rectangle(10, 20, (width - 20) * (frame % fps + 1) // fps, 16)
+                batch.text(10, 60, f"frame {frame}  {time.strftime('%H:%M:%S')}".encode('ascii'))
+            offset = frame * 8 % width * 4
+            row = bytes(ramp[offset:offset + width * 4])
+            put_image(session, window, foreground, row * band_rows, 0, height - band_rows,
+                      width, band_rows, fmt)
+        # Lets the connections write; slow ones keep their backlog
+        await asyncio.sleep(max(0.0, started + (frame + 1) * interval - time.monotonic()))
+    errors = await session.sync(timeout=30.0)
+    return {f"{display.host}:{display.display}": str(error) or type(error).__name__
+            for display, error in errors.items()}
+
+async def mirror(targets, fps, seconds, high_water):
+    session = await open_mirror(targets, high_water=high_water)
+    try:
+        errors = await run(session, fps, seconds)
+    finally:
+        stats = session.stats()
+        await session.close()
+    return {"displays": stats, "headers_patched": session.headers_patched,
+            "failed": {f"{host}:{display}": str(error) or type(error).__name__
+                       for (host, display), error in session.failed.items()},
+            "errors": errors}
+
+def main():
+    parser = argparse.ArgumentParser(description="Mirror a dashboard onto several X displays")
+    parser.add_argument("targets", nargs="*", help="host:display")
+    parser.add_argument("--fps", type=int, default=10)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--high-water", type=int, default=1 << 20,
+                        help="unsent bytes above which a display skips frames")
+    parser.add_argument("--stand-in", type=int, default=0, metavar="N",
+                        help="mirror onto N in-process stand-in servers (displays 70 and up)")
+    args = parser.parse_args()
+
+    servers = []
+    others = []
+    targets = [parse_target(target) for target in args.targets]
+    if args.stand_in:
+        # Only needed for the stand-in servers, not when mirroring real displays
+        from xmockserver import MockXServer
+    for index in range(args.stand_in):
+        slow = index == args.stand_in - 1 and args.stand_in > 1
+        servers.append(MockXServer(70 + index, bandwidth=250000 if slow else None).start())
+        targets.append(("127.0.0.1", 70 + index))
+        if index == 1:
+            # Another client first, so this display hands out a different
+            # resource-id-base and the mirrored requests must be patched
+            others.append(connect("127.0.0.1", 70 + index))
+    if not targets:
+        parser.error("no displays given")
+    try:
+        report = asyncio.run(mirror(targets, args.fps, args.seconds, args.high_water))
+    finally:
+        for conn in others:
+            conn.close()
+        for server in servers:
+            server.stop()
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+import argparse
+import asyncio
+import ipaddress
+import json
+import sys
+import time
+
+from xasync import open_connection
+
+# Finds XSDL displays on a subnet.
+#
+# Every host/display pair is probed by connecting to port 6000+N and running
+# the X11 setup handshake. A fixed pool of workers keeps at most
+# --max-in-flight probes open at once, and every result is written as a JSON
+# line as soon as it is known, e.g.
+#
+#   python scan-displays.py 192.168.1.0/24 --displays 0-2 > handsets.jsonl
+
+def parse_displays(text):
+    displays = []
+    for part in text.split(','):
+        if '-' in part:
+            first, last = part.split('-')
+            displays.extend(range(int(first), int(last) + 1))
+        else:
+            displays.append(int(part))
+    return displays
+
+def iter_targets(targets, displays):
+    for target in targets:
+        try:
+            network = ipaddress.ip_network(target, strict=False)
+        except ValueError:
+            # A host name, resolved when it is probed
+            hosts = [target]
+        else:
+            hosts = network.hosts() if network.num_addresses > 2 else iter(network)
+        for address in hosts:
+            for display in displays:
+                yield str(address), display
+
+async def probe(host, display, connect_timeout, handshake_timeout):
+    started = time.monotonic()
+    result = {"host": host, "display": display, "port": 6000 + display}
+    try:
+        conn = await open_connection(host, display, timeout=connect_timeout,
+                                     handshake_timeout=handshake_timeout)
+    except asyncio.TimeoutError:
+        result["status"] = "timeout"
+    except ConnectionRefusedError:
+        result["status"] = "closed"
+    except Exception as e:
+        # Whatever answers on the port, one probe never ends the sweep
+        result["status"] = "error"
+        result["error"] = str(e) or type(e).__name__
+    else:
+        setup = conn.setup
+        result["status"] = "open"
+        result["vendor"] = setup.vendor
+        result["release"] = setup.release
+        result["protocol"] = f"{setup.protocol_major}.{setup.protocol_minor}"
+        result["screens"] = [{
+            "root": screen.root,
+            "width": screen.width_pixels,
+            "height": screen.height_pixels,
+            "width_mm": screen.width_mm,
+            "height_mm": screen.height_mm,
+            "depth": screen.root_depth,
+        } for screen in setup.screens]
+        await conn.close()
+    result["elapsed_ms"] = round((time.monotonic() - started) * 1000, 1)
+    return result
+
+async def scan(targets, displays, max_in_flight=256, connect_timeout=1.0,
+               handshake_timeout=2.0, output=sys.stdout, show_all=False):
+    pending = iter_targets(targets, displays)
+    found = 0
+
+    async def worker():
+        nonlocal found
+        for host, display in pending:
+            result = await probe(host, display, connect_timeout, handshake_timeout)
+            if result["status"] == "open":
+                found += 1
+            if show_all or result["status"] == "open":
+                output.write(json.dumps(result) + "\n")
+                output.flush()
+
+    # The workers share one iterator, so no more than max_in_flight probes
+    # (and sockets) exist at any time however large the range is
+    await asyncio.gather(*[worker() for _ in range(max_in_flight)])
+    return found
+
+def main():
+    parser = argparse.ArgumentParser(description="Scan hosts for XSDL X11 displays")
+    parser.add_argument("targets", nargs="+",
+                        help="hosts or networks, e.g. tablet.lan or 192.168.1.0/24")
+    parser.add_argument("--displays", default="0", help="display numbers, e.g. 0-3 or 0,1,5")
+    parser.add_argument("--max-in-flight", type=int, default=256,
+                        help="maximum number of probes open at once")
+    parser.add_argument("--connect-timeout", type=float, default=1.0)
+    parser.add_argument("--handshake-timeout", type=float, default=2.0)
+    parser.add_argument("--all", action="store_true", help="also print closed and failed probes")
+    args = parser.parse_args()
+
+    started = time.monotonic()
+    found = asyncio.run(scan(args.targets, parse_displays(args.displays),
+                             max(1, args.max_in_flight), args.connect_timeout,
+                             args.handshake_timeout, show_all=args.all))
+    print(f"{found} display(s) found in {time.monotonic() - started:.1f}s", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+import importlib.util
+import itertools
+import os
+import socket
+import sys
+import threading
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from xconnection import connect
+from xmockserver import MockXServer
+
+# Every stand-in server gets a display number of its own, so the per-server
+# memos (extensions, atoms, fonts, keymaps, byte orders) never carry over
+# from one test to the next.
+_displays = itertools.count(120)
+
+@pytest.fixture
+def stand_in():
+    # stand_in(**options) starts a MockXServer; all are stopped afterwards
+    servers = []
+
+    def start(**options):
+        server = MockXServer(next(_displays), **options).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.stop()
+
+@pytest.fixture
+def open_conn():
+    # open_conn(server, **options) connects a blocking Connection to it
+    conns = []
+
+    def open_(server, **options):
+        conn = connect(server.host, server.display, **options)
+        conns.append(conn)
+        return conn
+
+    yield open_
+    for conn in conns:
+        try:
+            conn.close()
+        except OSError:
+            pass
+
+@pytest.fixture
+def not_x():
+    # A service that answers the setup request with 12 bytes starting with
+    # status 1, like some other protocol on an X port might
+    listener = socket.socket()
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind(('127.0.0.1', 0))
+    listener.listen()
+
+    def serve():
+        while True:
+            try:
+                sock, _ = listener.accept()
+            except OSError:
+                return
+            with sock:
+                sock.recv(64)
+                sock.sendall(bytes([1]) + bytes(11))
+
+    threading.Thread(target=serve, daemon=True).start()
+    yield listener.getsockname()[1] - 6000
+    listener.close()
+
+def load_script(name):
+    # The command line tools have hyphenated names and cannot be imported
+    spec = importlib.util.spec_from_file_location(name.replace('-', '_')[:-3],
+                                                  os.path.join(ROOT, name))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def create_window(conn, ids, event_mask=None, width=100, height=100):
+    window = ids()
+    root = conn.setup.screens[0].root
+    if event_mask is None:
+        conn.send_void(conn.proto.CreateWindow(0, window, root, 0, 0, width, height, 0, 1, 0,
+                                               0, []))
+    else:
+        conn.send_void(conn.proto.CreateWindow(0, window, root, 0, 0, width, height, 0, 1, 0,
+                                               0x800, [event_mask]))
+    return window
+
+class RecordingConnection:
+    # Just enough of a connection for encoders and batchers: records every
+    # request joined into bytes
+    def __init__(self, max_request_length=65535, byte_order='<', setup=None):
+        from xproto import protocol
+        self.proto = protocol(byte_order)
+        self.byte_order = byte_order
+        self.max_request_length = max_request_length
+        self.setup = setup
+        self.requests = []
+
+    def send_void(self, *buffers):
+        self.requests.append(b''.join(bytes(buffer) for buffer in buffers))
+        return len(self.requests)
+
+class QueueingConnection(RecordingConnection):
+    # Keeps the buffers of each request as they were passed, like the
+    # connections do until they write
+    def send_void(self, *buffers):
+        self.requests.append(buffers)
+        return len(self.requests)
+
+def request_words(request, byte_order='<'):
+    # Length of a request in 4-byte units, read from its header
+    length = int.from_bytes(request[2:4], 'little' if byte_order == '<' else 'big')
+    if length == 0:
+        length = int.from_bytes(request[4:8], 'little' if byte_order == '<' else 'big')
+    return length
@@ -0,0 +1,27 @@
+import json
+import sys
+
+from conftest import load_script
+
+def test_bench_client_reports_every_measurement(stand_in, tmp_path, monkeypatch):
+    bench = load_script('bench-client.py')
+    server = stand_in()
+    output = tmp_path / 'bench.json'
+    monkeypatch.setattr(sys, 'argv', [
+        'bench-client.py', '--host', server.host, '--display', str(server.display),
+        '--repeat', '2', '--void-count', '200', '--poly-count', '50',
+        '--output', str(output)])
+    bench.main()
+    report = json.loads(output.read_text())
+    assert {'timestamp', 'python', 'target', 'repeat', 'setup', 'server', 'extensions',
+            'void', 'void_async', 'poly', 'put_image'} <= set(report)
+    assert report['target']['stand_in'] is False
+    assert report['repeat'] == 2
+    assert report['setup']['setup']['n'] == 2
+    for key in ('send_each', 'round_trip_each', 'pipelined'):
+        assert report['void'][key]['p50'] > 0
+    assert {'fill_rectangle_one_request_each', 'fill_rectangle_batched', 'rectangle_batched',
+            'arc_batched'} <= set(report['poly'])
+    assert report['put_image']['big_requests']
+    # The window and GC came from the allocator and were freed again
+    assert not server.resources
@@ -0,0 +1,75 @@
+import io
+import struct
+
+from conftest import load_script
+from xmockserver import build_setup
+from xproto import protocol
+from xtrace import WireTrace
+
+decoder = load_script('decode-capture.py')
+
+def _streams(tmp_path):
+    # Client: setup request, InternAtom, QueryExtension, a BIG-REQUESTS
+    # PutImage and a GetAtomName that fails; server: the replies and error
+    proto = protocol('<')
+    requests = [proto.InternAtom(0, b'WM_STATE'), proto.QueryExtension(b'BIG-REQUESTS'),
+                b''.join(bytes(part) for part in proto.parts.PutImage(
+                    2, 0x200001, 0x200002, 1000, 70, 0, 0, 0, 24, bytes(280000))),
+                proto.GetAtomName(0xFFFFFF)]
+    client = struct.pack('<BxHHHH2x', 0x6C, 11, 0, 0, 0) + b''.join(requests)
+    server = (build_setup('<', 0x200000)
+              + struct.pack('<BxHIIxxxx16x', 1, 1, 0, 300)
+              + struct.pack('<BxHI?BBB20x', 1, 2, 0, True, 133, 0, 0)
+              + struct.pack('<BBHIHB21x', 0, 5, 4, 0xFFFFFF, 0, 17))
+    client_path = tmp_path / 'c2s.bin'
+    server_path = tmp_path / 's2c.bin'
+    client_path.write_bytes(client)
+    server_path.write_bytes(server)
+    return str(client_path), str(server_path), len(client) - 12
+
+def test_raw_streams_are_counted_once_with_decode(tmp_path):
+    client, server, request_bytes = _streams(tmp_path)
+    for decode in (False, True):
+        summary = decoder.Summary()
+        output = io.StringIO()
+        decoder.decode_streams(client, server, '<', summary, decode, output)
+        assert bytes(summary.opcodes) == bytes([16, 98, 72, 17])
+        report = summary.report(10)
+        assert (report['requests'], report['replies'], report['errors']) == (4, 2, 1)
+        assert sum(row['bytes'] for row in report['top_request_bytes']) == request_bytes
+        assert report['extensions'] == {'BIG-REQUESTS': 133}
+        assert report['error_counts'] == {'Atom in GetAtomName': 1}
+        assert not report['truncated']
+    lines = output.getvalue().splitlines()
+    assert len(lines) == 7
+    assert lines[0] == "#1 -> InternAtom only_if_exists=0 'WM_STATE' (16 bytes)"
+    assert lines[2].startswith("#3 -> PutImage format=2 drawable=0x200001")
+    assert lines[4] == "#1 <- reply to InternAtom (32 bytes)"
+    assert lines[6] == "#4 <- error Atom in GetAtomName.0, value 0xffffff"
+
+def test_truncated_client_stream(tmp_path):
+    client, _, _ = _streams(tmp_path)
+    with open(client, 'r+b') as stream:
+        stream.truncate(12 + 12 + 8)
+    summary = decoder.Summary()
+    decoder.decode_streams(client, None, '<', summary, False, io.StringIO())
+    assert bytes(summary.opcodes) == bytes([16])
+    assert summary.truncated
+
+def test_wire_trace_capture(tmp_path):
+    proto = protocol('<')
+    clock = iter([0.0, 0.001, 0.002, 0.050])
+    trace = WireTrace(clock=lambda: next(clock))
+    trace.request(1, (proto.InternAtom(0, b'WM_STATE'),), True)
+    trace.flushed()
+    trace.message(1, struct.pack('<BxHIIxxxx16x', 1, 1, 0, 300))
+    trace.message(1, struct.pack('<BxH28x', 12, 1))
+    path = tmp_path / 'trace.xtr'
+    trace.export(path)
+    summary = decoder.Summary()
+    output = io.StringIO()
+    decoder.decode_trace(str(path), summary, 2, True, output)
+    report = summary.report(2)
+    assert (report['requests'], report['replies'], report['events']) == (1, 1, 1)
+    assert [gap['after'] for gap in report['longest_gaps']] == ["#1 event", "#1 reply"]
+    assert output.getvalue().splitlines()[1] == "0.002000 #1 <- reply to InternAtom (32 bytes)"
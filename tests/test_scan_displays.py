@@ -0,0 +1,28 @@
+import asyncio
+import io
+import json
+
+from conftest import load_script
+
+def test_scan_reports_every_probe(stand_in, not_x):
+    scanner = load_script('scan-displays.py')
+    server = stand_in()
+    closed = server.display + 1000
+    output = io.StringIO()
+    found = asyncio.run(scanner.scan(['127.0.0.1', 'localhost'],
+                                     [server.display, not_x, closed],
+                                     max_in_flight=4, output=output, show_all=True))
+    results = [json.loads(line) for line in output.getvalue().splitlines()]
+    statuses = {(result['host'], result['display']): result['status'] for result in results}
+    assert found == 2
+    assert len(results) == 6
+    for host in ('127.0.0.1', 'localhost'):
+        assert statuses[(host, server.display)] == 'open'
+        assert statuses[(host, not_x)] == 'error'
+        assert statuses[(host, closed)] == 'closed'
+
+def test_networks_expand_to_hosts():
+    scanner = load_script('scan-displays.py')
+    targets = list(scanner.iter_targets(['10.0.0.0/30', 'tablet.lan'], [0, 1]))
+    assert targets == [('10.0.0.1', 0), ('10.0.0.1', 1), ('10.0.0.2', 0), ('10.0.0.2', 1),
+                       ('tablet.lan', 0), ('tablet.lan', 1)]
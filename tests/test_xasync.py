@@ -0,0 +1,36 @@
+import asyncio
+
+import pytest
+
+from conftest import create_window
+from xasync import open_connection
+from xconnection import XError, connect
+from xids import IdAllocator
+
+def test_requests_events_and_errors(stand_in):
+    server = stand_in()
+
+    async def run():
+        conn = await open_connection(server.host, server.display)
+        ids = IdAllocator(conn)
+        window = create_window(conn, ids, event_mask=0x8000)    # Exposure
+        conn.send_void(conn.proto.MapWindow(window))
+        expose = await conn.next_event(timeout=5)
+        reply = await conn.request(conn.proto.GetGeometry(window), timeout=5)
+        geometry = conn.proto.replies.GetGeometry(reply)
+        conn.send_void(conn.proto.MapWindow(ids.base | 0x1000))
+        with pytest.raises(XError):
+            await conn.sync(timeout=5)
+        await conn.close()
+        return expose[0], geometry.width
+
+    assert asyncio.run(run()) == (12, 100)
+
+def test_setup_from_a_non_x_service_is_a_connection_error(not_x):
+    async def run():
+        await open_connection('127.0.0.1', not_x, timeout=2)
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(run())
+    with pytest.raises(ConnectionError):
+        connect('127.0.0.1', not_x)
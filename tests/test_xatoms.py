@@ -0,0 +1,56 @@
+from xatoms import PREDEFINED_ATOMS, AtomTable
+from xmockserver import MockXServer
+from xsetup import SetupCache
+
+def test_intern_many_in_one_flight(stand_in, open_conn):
+    server = stand_in()
+    conn = open_conn(server)
+    atoms = AtomTable(conn)
+    names = ['WM_PROTOCOLS', 'WM_DELETE_WINDOW', '_NET_WM_NAME', 'UTF8_STRING']
+    result = atoms.intern_many(names + ['WM_NAME'])
+    assert result['WM_NAME'] == PREDEFINED_ATOMS.index('WM_NAME') + 1
+    assert len(set(result.values())) == 5
+    assert server.stats['requests']['InternAtom'] == 4
+    assert atoms.name(result['UTF8_STRING']) == 'UTF8_STRING'
+    # Known both ways now, and for other tables on the same server
+    assert AtomTable(open_conn(server))['WM_PROTOCOLS'] == result['WM_PROTOCOLS']
+    assert server.stats['requests']['InternAtom'] == 4
+    assert server.stats['requests']['GetAtomName'] == 0
+
+def test_only_if_exists(stand_in, open_conn):
+    atoms = AtomTable(open_conn(stand_in()))
+    assert atoms.intern('NOT_YET', only_if_exists=True) is None
+    atom = atoms.intern('NOT_YET')
+    assert atoms.intern('NOT_YET', only_if_exists=True) == atom
+
+def test_atoms_on_disk_are_confirmed(stand_in, open_conn, tmp_path):
+    server = stand_in()
+    conn = open_conn(server)
+    stored = AtomTable(conn, SetupCache(str(tmp_path))).intern_many(['A', 'B'])
+
+    # A new process with the same server: the stored atoms are used and
+    # checked with one GetAtomName in the same flight
+    AtomTable._servers.clear()
+    atoms = AtomTable(open_conn(server), SetupCache(str(tmp_path)))
+    assert atoms.intern_many(['A', 'B', 'C'])['B'] == stored['B']
+    assert server.stats['requests']['InternAtom'] == 3
+    assert server.stats['requests']['GetAtomName'] == 1
+
+def test_stale_atoms_on_disk_are_dropped(stand_in, open_conn, tmp_path):
+    server = stand_in()
+    AtomTable(open_conn(server), SetupCache(str(tmp_path))).intern_many(['A', 'B'])
+
+    # The server restarts and hands out atoms in another order
+    server.stop()
+    restarted = MockXServer(server.display).start()
+    try:
+        AtomTable._servers.clear()
+        atoms = AtomTable(open_conn(restarted), SetupCache(str(tmp_path)))
+        fresh = atoms.intern_many(['C', 'B', 'A'])
+        assert atoms.name(fresh['A']) == 'A'
+        assert atoms.name(fresh['B']) == 'B'
+        assert len(set(fresh.values())) == 3
+        assert restarted.stats['requests']['GetAtomName'] == 1
+        assert restarted.stats['requests']['InternAtom'] == 3
+    finally:
+        restarted.stop()
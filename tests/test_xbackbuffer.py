@@ -0,0 +1,97 @@
+import asyncio
+import time
+
+from conftest import create_window
+from xasync import open_connection
+from xbackbuffer import BackBuffer, FramePacer
+from xdamage import Region
+from xids import IdAllocator
+
+def _wait_for(condition, timeout=1.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.001)
+    return condition()
+
+def test_every_frame_reaches_the_server_before_the_pacer_sleeps(stand_in, open_conn):
+    server = stand_in()
+    conn = open_conn(server)
+    ids = IdAllocator(conn)
+    window = create_window(conn, ids)
+    back = BackBuffer(conn, window, 100, 100, ids)
+    conn.sync()
+    pacer = FramePacer(50)
+    seen = []
+
+    def render():
+        if pacer.frames:
+            # The previous frame was sent before the pacer slept
+            assert _wait_for(lambda: server.stats['copies'] == pacer.frames)
+            seen.append(server.stats['copies'])
+        back.present()
+
+    pacer.run(render, 5, conn)
+    assert seen == [1, 2, 3, 4]
+    assert _wait_for(lambda: server.stats['copies'] == 5)
+    assert len(conn.out) == 0
+
+def test_present_writes_without_waiting_for_a_reply(stand_in, open_conn):
+    server = stand_in()
+    conn = open_conn(server)
+    ids = IdAllocator(conn)
+    back = BackBuffer(conn, create_window(conn, ids), 100, 100, ids)
+    back.present()
+    assert len(conn.out) == 0
+    assert _wait_for(lambda: server.stats['copies'] == 1)
+
+def test_present_on_the_asyncio_connection(stand_in):
+    server = stand_in()
+
+    async def run():
+        conn = await open_connection(server.host, server.display)
+        ids = IdAllocator(conn)
+        back = BackBuffer(conn, create_window(conn, ids), 100, 100, ids)
+        back.present()
+        await conn.sync(timeout=5)
+        await conn.close()
+
+    asyncio.run(run())
+    assert server.stats['copies'] == 1
+
+def test_present_copies_the_region_bounds(stand_in, open_conn):
+    server = stand_in()
+    conn = open_conn(server)
+    ids = IdAllocator(conn)
+    back = BackBuffer(conn, create_window(conn, ids), 100, 100, ids)
+    region = Region()
+    back.present(region)    # empty: nothing to copy
+    region.add(10, 10, 5, 5)
+    region.add(40, 20, 5, 5)
+    back.present(region)
+    conn.sync()
+    assert back.presents == 1
+    assert server.stats['copies'] == 1
+
+def test_configure_notify_resizes_the_pixmap(stand_in, open_conn):
+    server = stand_in()
+    conn = open_conn(server)
+    ids = IdAllocator(conn)
+    window = create_window(conn, ids, event_mask=0x20000)
+    back = BackBuffer(conn, window, 100, 100, ids)
+    conn.send_void(conn.proto.ConfigureWindow(window, 0xC, [200, 150]))
+    event = conn.next_event()
+    assert back.handle_event(event)
+    assert (back.width, back.height) == (200, 150)
+    assert not back.handle_event(event)
+    back.close()
+    conn.sync()
+    assert back.pixmap not in server.resources
+
+def test_pacer_skips_missed_slots():
+    now = [0.0]
+    pacer = FramePacer(10, clock=lambda: now[0])
+    assert abs(pacer._advance() - 0.1) < 1e-9
+    now[0] = 0.35    # the frame took three and a half slots
+    assert abs(pacer._advance() - 0.05) < 1e-9
+    assert pacer.dropped == 2
+    assert pacer.frames == 2
@@ -0,0 +1,47 @@
+import pytest
+
+from xconnection import XError
+
+BAD_ATOM = 5
+
+def test_widen_picks_the_latest_request_with_those_low_bits(stand_in, open_conn):
+    conn = open_conn(stand_in())
+    conn.sequence = 0x10005
+    assert conn._widen(0x0005) == 0x10005
+    assert conn._widen(0x0003) == 0x10003
+    assert conn._widen(0xFFFE) == 0xFFFE
+    assert conn._widen(0x0006) == 0x0006
+
+def test_sequence_numbers_survive_wraparound(stand_in, open_conn):
+    conn = open_conn(stand_in())
+    for _ in range(70000):
+        conn.send_void(conn.proto.NoOperation())
+    assert conn.sequence > 0x10000
+    atom = conn.send_request(conn.proto.InternAtom(0, b'WRAPPED'))
+    bad = conn.send_request(conn.proto.GetAtomName(0xFFFFFF))
+    assert conn.proto.replies.InternAtom(atom.result()).atom > 0
+    with pytest.raises(XError) as error:
+        bad.result()
+    assert error.value.code == BAD_ATOM
+    assert error.value.sequence == bad.sequence > 0x10000
+    assert not conn.pending
+
+def test_pipelined_futures_complete_in_any_order(stand_in, open_conn):
+    conn = open_conn(stand_in())
+    proto = conn.proto
+    first = conn.send_request(proto.InternAtom(0, b'FIRST'))
+    bad = conn.send_request(proto.GetAtomName(0xFFFFFF))
+    second = conn.send_request(proto.InternAtom(0, b'SECOND'))
+    focus = conn.send_request(proto.GetInputFocus())
+    # Waiting for the last reply reads all the earlier ones on the way
+    proto.replies.GetInputFocus(focus.result())
+    assert first.done() and bad.done() and second.done()
+    later = proto.replies.InternAtom(second.result()).atom
+    earlier = proto.replies.InternAtom(first.result()).atom
+    assert later == earlier + 1
+    with pytest.raises(XError) as error:
+        bad.result()
+    assert (error.value.code, error.value.sequence) == (BAD_ATOM, bad.sequence)
+    # An error for a request with a reply is not reported again by sync()
+    conn.sync()
+    assert not conn.errors
@@ -0,0 +1,37 @@
+import struct
+
+from conftest import RecordingConnection, create_window
+from xdamage import DamageTracker, Region
+from xids import IdAllocator
+
+def expose(byte_order, window, x, y, width, height, count):
+    return struct.pack(byte_order + 'BxHIHHHHH14x', 12, 1, window, x, y, width, height, count)
+
+def test_little_endian_expose_burst_is_one_redraw():
+    redraws = []
+    damage = DamageTracker(RecordingConnection(byte_order='<'),
+                           lambda window, region: redraws.append((window, list(region))))
+    assert damage.feed(expose('<', 0x200001, 0, 0, 50, 20, 2))
+    assert damage.feed(expose('<', 0x200001, 0, 20, 50, 30, 1))
+    assert not redraws
+    assert damage.feed(expose('<', 0x200001, 300, 200, 10, 10, 0))
+    assert redraws == [(0x200001, [(0, 0, 50, 50), (300, 200, 10, 10)])]
+    assert (damage.events, damage.redraws) == (3, 1)
+    assert not damage.feed(struct.pack('<B31x', 2))    # KeyPress
+
+def test_region_collapses_to_its_bounds():
+    region = Region(max_rects=2)
+    for x in (0, 20, 40):
+        region.add(x, 0, 10, 10)
+    assert list(region) == [(0, 0, 50, 10)]
+
+def test_expose_from_the_stand_in_in_server_order(stand_in, open_conn):
+    conn = open_conn(stand_in(), byte_order='<')
+    ids = IdAllocator(conn)
+    window = create_window(conn, ids, event_mask=0x8000, width=120, height=80)
+    redraws = []
+    damage = DamageTracker(conn, lambda window, region: redraws.append((window, region.bounds())))
+    conn.send_void(conn.proto.MapWindow(window))
+    while not redraws:
+        assert damage.feed(conn.next_event())
+    assert redraws == [(window, (0, 0, 120, 80))]
@@ -0,0 +1,56 @@
+import pytest
+
+from conftest import RecordingConnection, request_words
+from xdraw import DrawBatch
+
+def test_consecutive_primitives_share_a_request():
+    conn = RecordingConnection()
+    with DrawBatch(conn, 1, 2) as batch:
+        batch.fill_rectangle(0, 0, 10, 10)
+        batch.fill_rectangle(10, 0, 10, 10)
+        batch.line(0, 0, 5, 5)
+        batch.fill_rectangle(20, 0, 10, 10)
+    assert [request[0] for request in conn.requests] == [70, 66, 70]
+
+    conn = RecordingConnection()
+    with DrawBatch(conn, 1, 2, ordered=False) as batch:
+        batch.fill_rectangle(0, 0, 10, 10)
+        batch.line(0, 0, 5, 5)
+        batch.fill_rectangle(20, 0, 10, 10)
+    assert [request[0] for request in conn.requests] == [70, 66]
+
+@pytest.mark.parametrize('limit', [65535, 70000])
+def test_runs_fit_the_request_limit(limit):
+    # Above 65535 words the BIG-REQUESTS form adds a length word
+    conn = RecordingConnection(limit)
+    with DrawBatch(conn, 1, 2) as batch:
+        for index in range(limit + 10):
+            batch.point(index & 0x7FFF, 0)
+    words = [request_words(request) for request in conn.requests]
+    assert words[0] == limit
+    assert all(len(request) == count * 4 for request, count in zip(conn.requests, words))
+    assert sum(count - 3 - (count > 0xFFFF) for count in words) == limit + 10
+
+def test_text_on_one_baseline_is_one_request():
+    conn = RecordingConnection()
+    with DrawBatch(conn, 1, 2, text_width=lambda text: 6 * len(text)) as batch:
+        batch.text(10, 20, b'abc')
+        batch.text(100, 20, b'def')
+        batch.text(10, 40, b'ghi')
+    assert len(conn.requests) == 2
+    # 'abc' ends at 28, so 'def' moves the pen on by 72
+    assert conn.requests[0][16:] == b'\x03\x00abc\x03\x48def\0\0'
+
+def test_long_string_is_split_across_requests():
+    conn = RecordingConnection(100)
+    with DrawBatch(conn, 1, 2, text_width=lambda text: 6 * len(text)) as batch:
+        batch.text(10, 20, b'x' * 600)
+    assert all(request_words(request) <= 100 for request in conn.requests)
+    origins = [int.from_bytes(request[12:14], 'little') for request in conn.requests]
+    assert origins == [10, 10 + 254 * 6, 10 + 508 * 6]
+    assert sum(request.count(b'x') for request in conn.requests) == 600
+
+def test_long_string_without_widths_is_refused():
+    with pytest.raises(ValueError):
+        with DrawBatch(RecordingConnection(100), 1, 2) as batch:
+            batch.text(10, 20, b'x' * 600)
@@ -0,0 +1,33 @@
+from xextensions import ExtensionRegistry, enable_big_requests
+
+def test_probe_queries_each_extension_once(stand_in, open_conn):
+    server = stand_in()
+    conn = open_conn(server)
+    registry = ExtensionRegistry(conn)
+    names = registry.list()
+    assert 'BIG-REQUESTS' in names and 'RANDR' in names
+    extensions = registry.probe(names + ['NOT-THERE'])
+    assert extensions['RANDR'].present
+    assert not extensions['NOT-THERE'].present
+    requests = server.stats['requests']['QueryExtension']
+    assert requests == len(names) + 1
+
+    # A second registry for the same server asks nothing
+    again = ExtensionRegistry(open_conn(server))
+    assert again.major_opcode('RANDR') == 140
+    assert again.get('NOT-THERE') is None
+    assert server.stats['requests']['QueryExtension'] == requests
+    assert server.stats['requests']['ListExtensions'] == 1
+
+def test_event_and_error_owners(stand_in, open_conn):
+    registry = ExtensionRegistry(open_conn(stand_in()))
+    registry.probe()
+    assert registry.event_owner(89) == ('RANDR', 0)
+    assert registry.event_owner(66 | 0x80) == ('XInputExtension', 0)
+    assert registry.event_owner(12) is None
+    assert registry.error_owner(148) == ('RANDR', 1)
+
+def test_big_requests_raise_the_request_limit(stand_in, open_conn):
+    conn = open_conn(stand_in())
+    assert enable_big_requests(conn)
+    assert conn.max_request_length == 4194303
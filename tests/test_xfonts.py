@@ -0,0 +1,53 @@
+from xfonts import FontCache
+from xids import IdAllocator
+from xsetup import SetupCache
+
+def _fonts(conn, **options):
+    return FontCache(conn, IdAllocator(conn), **options)
+
+def test_metrics_from_one_query(stand_in, open_conn):
+    server = stand_in()
+    conn = open_conn(server)
+    fonts = _fonts(conn)
+    opened = fonts.open_many(['fixed', '6x13', 'fixed'])
+    font_id, metrics = opened['fixed']
+    assert server.stats['requests']['OpenFont'] == 2
+    assert server.stats['requests']['QueryFont'] == 2
+    assert (metrics.ascent, metrics.descent, metrics.height) == (11, 2, 13)
+    assert metrics.width(b'hello') == 30
+    assert metrics('hello') == 30
+    extents = metrics.extents(b'gap')
+    assert (extents.width, extents.ascent, extents.descent) == (18, 9, 2)
+    assert (extents.left_bearing, extents.right_bearing) == (0, 18)
+    # Control characters have no glyph and default_char 0 has none either
+    assert metrics.width(b'a\x01b') == 12
+
+def test_fit_truncate_and_wrap(stand_in, open_conn):
+    metrics = _fonts(open_conn(stand_in())).metrics('fixed')
+    assert metrics.fit(b'abcdefghij', 40) == 6
+    assert metrics.truncate(b'abcdefghij', 60) == b'abcdefghij'
+    assert metrics.truncate(b'abcdefghij', 36) == b'abc...'
+    assert metrics.wrap(b'hello world foo', 66) == [b'hello world', b'foo']
+    assert metrics.wrap(b'one two\nthree', 60) == [b'one two', b'three']
+    # A word longer than the line is broken inside it
+    assert metrics.wrap(b'abcdefgh', 18) == [b'abc', b'def', b'gh']
+    assert all(metrics.width(line) <= 60 for line in metrics.wrap(b'a b c d e f g h i j k', 60))
+
+def test_metrics_on_disk_need_no_query(stand_in, open_conn, tmp_path):
+    server = stand_in()
+    _fonts(open_conn(server), cache=SetupCache(str(tmp_path))).open('fixed')
+    assert server.stats['requests']['QueryFont'] == 1
+
+    # A new process: the font is opened but not queried again
+    FontCache._servers.clear()
+    conn = open_conn(server)
+    fonts = _fonts(conn, cache=SetupCache(str(tmp_path)))
+    font_id, metrics = fonts.open('fixed')
+    conn.sync()
+    assert metrics.width(b'abc') == 18
+    assert fonts.queries == 0
+    assert server.stats['requests']['QueryFont'] == 1
+    assert server.stats['requests']['OpenFont'] == 2
+    fonts.close('fixed')
+    conn.sync()
+    assert font_id not in server.resources
@@ -0,0 +1,71 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from conftest import QueueingConnection, RecordingConnection
+from xframediff import FrameDiffer, dirty_tiles, merge_tiles
+from xmockserver import build_setup
+from xsetup import parse_setup
+
+def _differ():
+    conn = RecordingConnection(setup=parse_setup(build_setup('<', 0x200000), '<'))
+    return conn, FrameDiffer(conn, gc=2, tile=16)
+
+def test_merge_tiles_into_rectangles():
+    dirty = np.zeros((4, 4), bool)
+    dirty[0:2, 1:3] = True
+    dirty[3, 0] = True
+    assert sorted(merge_tiles(dirty)) == [(0, 1, 2, 2), (3, 0, 1, 1)]
+    frame = np.zeros((20, 20, 3), np.uint8)
+    changed = frame.copy()
+    changed[19, 19] = 1
+    assert dirty_tiles(frame, changed, 16).tolist() == [[False, False], [False, True]]
+
+def test_only_changed_tiles_are_sent():
+    conn, differ = _differ()
+    frame = np.zeros((64, 64, 3), np.uint8)
+    first = differ.send(1, frame)
+    assert first.rects == 1 and first.saved_bytes == 0
+    frame[20, 40] = 255
+    second = differ.send(1, frame)
+    assert second.rects == 1
+    assert second.sent_bytes == 16 * 16 * 4 + 24
+    assert second.saved_bytes > 0
+    assert differ.send(1, frame).requests == 0
+
+def test_scrolling_is_one_copy_and_the_new_rows():
+    conn, differ = _differ()
+    rng = np.random.default_rng(1)
+    frame = rng.integers(0, 255, (128, 64, 3), np.uint8)
+    differ.send(1, frame)
+    scrolled = np.concatenate([frame[16:], rng.integers(0, 255, (16, 64, 3), np.uint8)])
+    stats = differ.send(1, scrolled)
+    assert stats.copies == 1
+    copy = [request for request in conn.requests if request[0] == 62]
+    assert len(copy) == 1
+    assert stats.sent_bytes < stats.full_bytes // 4
+
+def test_forget_sends_the_next_frame_in_full():
+    conn, differ = _differ()
+    frame = np.zeros((32, 32, 3), np.uint8)
+    differ.send(1, frame)
+    differ.forget(1)
+    assert differ.send(1, frame).saved_bytes == 0
+
+def test_reused_frame_buffer_keeps_queued_regions():
+    conn = QueueingConnection(setup=parse_setup(build_setup('<', 0x200000), '<'))
+    differ = FrameDiffer(conn, gc=2, tile=16)
+    # Pixel values already in the server's format are not converted, so the
+    # full-width upload is a slice of the caller's frame
+    frame = np.zeros((32, 16), '<u4')
+    differ.send(1, frame)
+    frame[:] = 0x00ABCDEF
+    assert bytes(conn.requests[0][1]) == bytes(32 * 16 * 4)
+
+def test_rows_wider_than_a_request_are_refused_not_divided_by():
+    conn = RecordingConnection(max_request_length=16,
+                               setup=parse_setup(build_setup('<', 0x200000), '<'))
+    differ = FrameDiffer(conn, gc=2)
+    assert differ._image_bytes(64, 3) == 64 * 4 * 3 + 24 * 3
+    with pytest.raises(ValueError):
+        differ.send(1, np.zeros((3, 64, 3), np.uint8))
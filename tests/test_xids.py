@@ -0,0 +1,62 @@
+import pytest
+
+from conftest import create_window
+from xconnection import XError
+from xids import IdAllocator
+
+def test_ids_come_from_the_client_range_and_are_reused(stand_in, open_conn):
+    conn = open_conn(stand_in())
+    ids = IdAllocator(conn)
+    first, second = ids(), ids()
+    assert first != second
+    assert ids.owns(first) and ids.owns(second)
+    ids.free(first)
+    assert ids() == first
+    assert ids.reused == 1
+
+def test_server_accepts_allocated_ids(stand_in, open_conn):
+    server = stand_in()
+    conn = open_conn(server)
+    ids = IdAllocator(conn)
+    window = create_window(conn, ids)
+    conn.send_void(conn.proto.CreatePixmap(24, ids(), window, 10, 10))
+    conn.send_void(conn.proto.CreateGC(ids(), window, 0, []))
+    conn.sync()
+    assert len(server.resources) == 3
+
+def test_foreign_id_is_rejected(stand_in, open_conn):
+    conn = open_conn(stand_in())
+    ids = IdAllocator(conn)
+    window = create_window(conn, ids)
+    conn.send_void(conn.proto.CreatePixmap(24, ids.base ^ (1 << 29) | 1, window, 10, 10))
+    with pytest.raises(XError) as error:
+        conn.sync()
+    assert error.value.code == 14    # BadIDChoice
+
+def test_exhausted_range_falls_back_to_xc_misc(stand_in, open_conn):
+    server = stand_in(id_mask=0xF)
+    conn = open_conn(server)
+    ids = IdAllocator(conn)
+    window = create_window(conn, ids)
+    pixmaps = [ids() for _ in range(14)]
+    for pixmap in pixmaps:
+        conn.send_void(conn.proto.CreatePixmap(24, pixmap, window, 1, 1))
+    assert ids.allocated == 15
+    # Two pixmaps freed without telling the allocator (say by another
+    # library), one freed through it
+    for pixmap in pixmaps[3:5] + pixmaps[8:9]:
+        conn.send_void(conn.proto.FreePixmap(pixmap))
+    ids.free(pixmaps[8])
+    conn.sync()
+
+    assert ids() == pixmaps[8]      # freed IDs come back first
+    assert ids.ranges_fetched == 0
+    fetched = [ids(), ids()]        # then the server's free range
+    assert fetched == pixmaps[3:5]
+    assert ids.ranges_fetched == 1
+    for pixmap in [pixmaps[8]] + fetched:
+        conn.send_void(conn.proto.CreatePixmap(24, pixmap, window, 1, 1))
+    conn.sync()
+    assert len(server.resources) == 15
+    with pytest.raises(RuntimeError):
+        ids()
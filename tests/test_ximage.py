@@ -0,0 +1,72 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from conftest import QueueingConnection, create_window
+from xids import IdAllocator
+from ximage import ImageFormat, image_format, put_image, to_server_rows
+from xmockserver import build_setup
+from xsetup import parse_setup
+
+def _format(bits_per_pixel=32, byte_order='<', masks=(0xFF0000, 0x00FF00, 0x0000FF)):
+    fmt = ImageFormat()
+    fmt.depth = 24 if bits_per_pixel > 16 else bits_per_pixel
+    fmt.bits_per_pixel = bits_per_pixel
+    fmt.scanline_pad = 32
+    fmt.byte_order = byte_order
+    fmt.red_mask, fmt.green_mask, fmt.blue_mask = masks
+    return fmt
+
+def test_format_from_the_setup_block():
+    fmt = image_format(parse_setup(build_setup('<', 0x200000), '<'))
+    assert (fmt.depth, fmt.bits_per_pixel, fmt.byte_order) == (24, 32, '<')
+    assert fmt.stride(3) == 12
+
+def test_rgb_to_true_color_pixels():
+    image = np.array([[[0x12, 0x34, 0x56], [0xFF, 0, 0]]], dtype=np.uint8)
+    assert to_server_rows(image, _format()).tobytes() == bytes(
+        [0x56, 0x34, 0x12, 0, 0, 0, 0xFF, 0])
+    assert to_server_rows(image, _format(byte_order='>')).tobytes() == bytes(
+        [0, 0x12, 0x34, 0x56, 0, 0xFF, 0, 0])
+    # 5-6-5 pixels, rows padded to 32 bits
+    rows = to_server_rows(image[:, :1], _format(16, '<', (0xF800, 0x07E0, 0x001F)))
+    assert rows.shape == (1, 4)
+    expected = (0x12 >> 3) << 11 | (0x34 >> 2) << 5 | 0x56 >> 3
+    assert int.from_bytes(rows.tobytes()[:2], 'little') == expected
+
+def test_rgb_needs_channel_masks():
+    with pytest.raises(ValueError):
+        to_server_rows(np.zeros((2, 2, 3), np.uint8), _format(8, masks=(0, 0, 0)))
+    # Pixel values (colormap indices) are fine
+    assert to_server_rows(np.full((2, 2), 7, np.uint8), _format(8, masks=(0, 0, 0))).shape == (2, 4)
+
+def test_large_images_are_sent_in_bands(stand_in, open_conn):
+    server = stand_in()
+    conn = open_conn(server)
+    ids = IdAllocator(conn)
+    window = create_window(conn, ids, width=640, height=480)
+    gc = ids()
+    conn.send_void(conn.proto.CreateGC(gc, window, 0, []))
+    image = np.zeros((480, 640, 3), np.uint8)
+    requests = put_image(conn, window, gc, image)
+    conn.sync()
+    assert requests == -(-480 // ((65535 * 4 - 28) // (640 * 4)))
+    assert server.stats['image_bytes'] == 640 * 480 * 4
+
+def test_reused_frame_buffer_does_not_change_queued_pixels():
+    conn = QueueingConnection()
+    frame = np.full((4, 8), 0x00112233, dtype='<u4')
+    put_image(conn, 1, 2, frame, fmt=_format())
+    frame[:] = 0x00FFFFFF
+    assert bytes(conn.requests[0][1]) == bytes([0x33, 0x22, 0x11, 0]) * 32
+
+def test_copy_false_sends_the_caller_buffer():
+    conn = QueueingConnection()
+    frame = bytearray(4 * 8 * 4)
+    put_image(conn, 1, 2, frame, width=8, height=4, fmt=_format(), copy=False)
+    frame[:4] = b'\xff' * 4
+    assert bytes(conn.requests[0][1])[:4] == b'\xff' * 4
+    # Immutable bytes are never copied
+    pixels = bytes(4 * 8 * 4)
+    put_image(conn, 1, 2, pixels, width=8, height=4, fmt=_format())
+    assert conn.requests[1][1].obj is pixels
@@ -0,0 +1,57 @@
+from conftest import create_window
+from xids import IdAllocator
+from xinput import (BUTTON_PRESS, KEY_PRESS, LOCK_MASK, MOTION_NOTIFY, SHIFT_MASK,
+                    ButtonEvent, InputDecoder, Keymap, KeyEvent, MotionEvent, keysym_to_text)
+
+def test_keymap_fetched_once_per_server(stand_in, open_conn):
+    server = stand_in()
+    keymap = Keymap(open_conn(server))
+    assert keymap.keysym(38) == ord('a')
+    assert keymap.keysym(38, SHIFT_MASK) == ord('A')
+    assert keymap.keysym(38, LOCK_MASK) == ord('A')
+    assert keymap.keysym(10, SHIFT_MASK) == ord('!')
+    assert keymap.keycodes(ord('a')) == [38]
+    assert Keymap(open_conn(server)).keysym(39) == ord('s')
+    assert server.stats['requests']['GetKeyboardMapping'] == 1
+
+def test_mapping_notify_drops_the_keymap(stand_in, open_conn):
+    server = stand_in()
+    keymap = Keymap(open_conn(server))
+    keymap.load()
+    assert keymap.feed(bytes((34, 0, 0, 0, 1)) + bytes(27))
+    keymap.load()
+    assert server.stats['requests']['GetKeyboardMapping'] == 2
+
+def test_decoder_merges_queued_motion(stand_in, open_conn):
+    server = stand_in()
+    conn = open_conn(server)
+    ids = IdAllocator(conn)
+    window = create_window(conn, ids, event_mask=0x2004D)    # key, button, motion
+    conn.send_void(conn.proto.MapWindow(window))
+    conn.sync()
+    server.press_key(38, window, SHIFT_MASK)
+    for x in range(10, 60, 10):
+        server.send_input(MOTION_NOTIFY, 0, x, 20, window=window)
+    server.send_input(BUTTON_PRESS, 1, 50, 20, window=window)
+    server.send_input(MOTION_NOTIFY, 0, 70, 25, window=window)
+    conn.sync()    # every event is in before the reply
+
+    decoder = InputDecoder(conn)
+    records = []
+    while conn.events:
+        record = decoder.feed(conn.events.popleft())
+        if record is not None:
+            records.append(record)
+    key, motion, button, last = records
+    assert isinstance(key, KeyEvent) and key.code == KEY_PRESS
+    assert key.keysym == ord('A') and key.text == 'A'
+    assert isinstance(motion, MotionEvent)
+    assert (motion.x, motion.y, motion.merged) == (50, 20, 4)
+    assert isinstance(button, ButtonEvent) and button.button == 1 and button.pressed
+    assert (last.x, last.merged) == (70, 0)
+    assert decoder.merged == 4
+
+def test_keysym_to_text():
+    assert keysym_to_text(ord('q')) == 'q'
+    assert keysym_to_text(0xFF0D) == ''
+    assert keysym_to_text(0x010020AC) == '€'
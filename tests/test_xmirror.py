@@ -0,0 +1,99 @@
+import asyncio
+import struct
+
+from xconnection import connect
+from xdraw import DrawBatch
+from xmirror import open_mirror
+
+def _mirror(targets, body, **options):
+    async def run():
+        session = await open_mirror(targets, **options)
+        try:
+            body(session)
+            errors = await session.sync(timeout=5)
+        finally:
+            await session.close()
+        return session, errors
+    return asyncio.run(run())
+
+def _ids(request, offsets, byte_order):
+    return [struct.unpack_from(byte_order + 'I', request, offset)[0] for offset in offsets]
+
+def test_ids_are_patched_for_a_display_with_another_base(stand_in):
+    first, second = stand_in(), stand_in()
+    # Another client first, so the second display gives out another range
+    other = connect(second.host, second.display)
+    try:
+        def body(session):
+            proto = session.proto
+            root = session.setup.screens[0].root
+            window = session.ids()
+            parent = session.ids()
+            gc = session.ids()
+            session.send_void(proto.CreateWindow(0, parent, root, 0, 0, 200, 200, 0, 1, 0, 0, []))
+            session.send_void(proto.CreateWindow(0, window, parent, 0, 0, 100, 100, 0, 1, 0,
+                                                 0, []))
+            session.send_void(proto.ChangeProperty(0, window, 39, 31, 8, 5, b'title'))
+            session.send_void(proto.CreateGC(gc, window, 0, []))
+            session.send_void(proto.MapWindow(window))
+            with session.frame():
+                with DrawBatch(session, window, gc) as batch:
+                    batch.fill_rectangle(0, 0, 10, 10)
+            # DeleteProperty (19): window, property
+            session.send_void(struct.pack(session.byte_order + 'BxHII', 19, 3, window, 39))
+            session.send_void(proto.DestroyWindow(window))
+
+        session, errors = _mirror([(first.host, first.display), (second.host, second.display)],
+                                  body)
+    finally:
+        other.close()
+    assert errors == {}
+    assert not session.displays[1].same
+    assert session.headers_patched == 8
+    assert first.stats['primitives'] == second.stats['primitives'] == 1
+
+def test_id_offsets_of_requests_with_ids(stand_in):
+    first = stand_in()
+
+    def body(session):
+        pass
+
+    session, _ = _mirror([(first.host, first.display)], body)
+    proto = session.proto
+    order = session.byte_order
+    base = session.setup.resource_id_base
+    window, sibling, gc = base | 1, base | 2, base | 3
+    cases = [
+        (proto.ChangeProperty(0, window, 39, 31, 8, 1, b'x'), [window]),
+        (struct.pack(order + 'BxHIIhh', 7, 4, window, sibling, 0, 0), [window, sibling]),
+        (struct.pack(order + 'BxHI', 11, 2, window), [window]),                   # UnmapSubwindows
+        (struct.pack(order + 'BBHII', 42, 1, 3, window, 0), [window]),           # SetInputFocus
+        (struct.pack(order + 'BxHIHH', 58, 3, gc, 0, 0), [gc]),                  # SetDashes
+        (struct.pack(order + 'BBHII', 25, 0, 11, window, 0) +
+         struct.pack(order + 'B3xI', 33, window) + bytes(24), [window, window]),  # SendEvent
+        (proto.ConfigureWindow(window, 0x60, [sibling, 0]), [window, sibling]),
+        (proto.CreateGC(gc, window, 0x4000, [base | 4]), [gc, window, base | 4]),
+    ]
+    for request, ids in cases:
+        assert _ids(request, session._id_offsets(request), order) == ids
+
+def test_a_display_behind_skips_drawing_but_not_state(stand_in):
+    server = stand_in()
+
+    def body(session):
+        proto = session.proto
+        window = session.ids()
+        gc = session.ids()
+        session.send_void(proto.CreateWindow(0, window, session.setup.screens[0].root,
+                                             0, 0, 100, 100, 0, 1, 0, 0, []))
+        session.send_void(proto.CreateGC(gc, window, 0, []))
+        with session.frame():
+            session.send_void(proto.PolyFillRectangle(window, gc, [(0, 0, 5, 5)]))
+            session.send_void(proto.ChangeGC(gc, 0x4, [0xFF0000]))
+
+    # Below zero every display counts as behind
+    session, errors = _mirror([(server.host, server.display)], body, high_water=-1)
+    assert errors == {}
+    assert session.displays[0].dropped_frames == 1
+    assert server.stats['primitives'] == 0
+    assert server.stats['requests']['ChangeGC'] == 1
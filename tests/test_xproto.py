@@ -0,0 +1,32 @@
+import struct
+
+import pytest
+
+from xproto import protocol, text_items
+
+@pytest.mark.parametrize('order', '<>')
+@pytest.mark.parametrize('name', [b'', b'a', b'abc', b'abcd', b'RENDER', b'x' * 255])
+def test_string_requests_match_the_wire_format(order, name):
+    proto = protocol(order)
+    pad = bytes(-len(name) % 4)
+    words = (len(name) + 3) // 4
+    assert proto.QueryExtension(name) == (
+        struct.pack(order + 'BxHH2x', 98, 2 + words, len(name)) + name + pad)
+    assert proto.InternAtom(1, name) == (
+        struct.pack(order + 'BBHH2x', 16, 1, 2 + words, len(name)) + name + pad)
+    assert proto.OpenFont(0x200001, name) == (
+        struct.pack(order + 'BxHIH2x', 45, 3 + words, 0x200001, len(name)) + name + pad)
+    assert proto.ImageText8(5, 6, 7, 8, name) == (
+        struct.pack(order + 'BBHIIhh', 76, len(name), 4 + words, 5, 6, 7, 8) + name + pad)
+
+def test_long_payloads_use_big_requests_form():
+    proto = protocol('<')
+    request = proto.PutImage(2, 1, 2, 1, 1, 0, 0, 0, 24, bytes(0x40000 * 4))
+    assert request[2:4] == b'\0\0'
+    assert struct.unpack_from('<I', request, 4)[0] * 4 == len(request)
+
+def test_text_items_split_every_254_bytes():
+    items = text_items(b'x' * 300, delta=3)
+    assert items[:2] == bytes((254, 3))
+    assert items[256:258] == bytes((46, 0))
+    assert len(items) == 300 + 4
@@ -0,0 +1,64 @@
+import os
+import struct
+
+from xmockserver import build_setup
+from xsetup import SetupCache, parse_setup
+
+class CountingCache(SetupCache):
+    def __init__(self, directory):
+        super().__init__(directory)
+        self.puts = 0
+
+    def put(self, key, digest, tables):
+        self.puts += 1
+        super().put(key, digest, tables)
+
+def _first_screen_offset(data):
+    vendor_len = struct.unpack_from('<H', data, 24)[0]
+    return 40 + vendor_len + (-vendor_len % 4) + data[29] * 8
+
+def test_setup_parses_screens_and_visuals():
+    setup = parse_setup(build_setup('<', 0x200000), '<')
+    screen = setup.screens[0]
+    assert setup.resource_id_base == 0x200000
+    assert (screen.width_pixels, screen.height_pixels, screen.root_depth) == (800, 480, 24)
+    assert setup.visuals[screen.root_visual].red_mask == 0xFF0000
+    assert setup.formats_by_depth[24].bits_per_pixel == 32
+
+def test_cache_ignores_root_input_masks_and_size(tmp_path):
+    first = parse_setup(build_setup('<', 0x200000), '<', CountingCache(str(tmp_path)), ('h', 0))
+
+    # Another client selected events on the root, and RandR resized it
+    data = bytearray(build_setup('<', 0x400000))
+    offset = _first_screen_offset(data)
+    struct.pack_into('<IHH', data, offset + 16, 0x80000, 1024, 600)
+    cache = CountingCache(str(tmp_path))
+    second = parse_setup(bytes(data), '<', cache, ('h', 0))
+
+    assert cache.puts == 0
+    screen = second.screens[0]
+    assert screen.current_input_masks == 0x80000
+    assert (screen.width_pixels, screen.height_pixels) == (1024, 600)
+    assert second.resource_id_base == 0x400000
+    # The cached screen objects are copies, the first setup is unchanged
+    assert first.screens[0].width_pixels == 800
+    assert first.screens[0].current_input_masks == 0
+
+def test_cache_misses_when_the_static_tables_change(tmp_path):
+    parse_setup(build_setup('<', 0x200000), '<', CountingCache(str(tmp_path)), ('h', 0))
+    data = bytearray(build_setup('<', 0x200000))
+    struct.pack_into('<I', data, _first_screen_offset(data) + 8, 0x123456)    # white pixel
+    cache = CountingCache(str(tmp_path))
+    setup = parse_setup(bytes(data), '<', cache, ('h', 0))
+    assert cache.puts == 1
+    assert setup.screens[0].white_pixel == 0x123456
+
+def test_unreadable_cache_file_is_a_miss_and_removed(tmp_path):
+    cache = SetupCache(str(tmp_path))
+    cache.put(('h', 0), 'digest', 'tables')
+    path = cache._path(('h', 0))
+    for junk in (b'', b'\x80\x04\x95garbage', b'cnot_a_module\nThing\n.', b'\x80\x04K\x01h\x05.'):
+        with open(path, 'wb') as f:
+            f.write(junk)
+        assert SetupCache(str(tmp_path)).get(('h', 0), 'digest') is None
+        assert not os.path.exists(path)
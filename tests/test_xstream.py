@@ -0,0 +1,81 @@
+import struct
+
+import pytest
+
+from xstream import MessageReader
+
+def reply(sequence, extra=b''):
+    # A reply with len(extra) (a multiple of 4) bytes past the 32-byte frame
+    return struct.pack('<BBHI24x', 1, 0, sequence, len(extra) // 4) + extra
+
+def event(code, sequence):
+    return struct.pack('<BBH28x', code, 0, sequence)
+
+class ChunkSocket:
+    # recv_into() hands out the data a chunk at a time
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+
+    def recv_into(self, view):
+        if not self.chunks:
+            return 0
+        chunk = self.chunks.pop(0)
+        assert len(chunk) <= len(view)
+        view[:len(chunk)] = chunk
+        return len(chunk)
+
+def collecting_reader(**options):
+    seen = []
+    reader = MessageReader('<', on_reply=lambda m: seen.append(('reply', bytes(m))),
+                           on_event=lambda m: seen.append(('event', bytes(m))),
+                           on_error=lambda m: seen.append(('error', bytes(m))), **options)
+    return reader, seen
+
+def test_message_split_across_reads():
+    data = reply(1, bytes(range(8))) + event(12, 1)
+    reader, seen = collecting_reader()
+    sock = ChunkSocket([data[:5], data[5:37], data[37:50], data[50:]])
+    counts = []
+    for _ in range(4):
+        reader.fill(sock)
+        counts.append(reader.dispatch())
+    assert counts == [0, 0, 1, 1]
+    assert seen == [('reply', data[:40]), ('event', data[40:])]
+    assert len(reader) == 0
+    with pytest.raises(ConnectionError):
+        reader.fill(sock)
+
+def test_long_reply_past_the_frame():
+    extra = bytes(range(256)) * 4
+    data = reply(7, extra)
+    reader, seen = collecting_reader(size=64)
+    reader.feed(data[:40])
+    assert reader.dispatch() == 0
+    # The rest of the reply is reserved so one recv_into() can take all of it
+    assert len(reader._buf) - reader._end >= len(data) - 40
+    reader.feed(data[40:])
+    assert reader.dispatch() == 1
+    assert seen == [('reply', data)]
+
+def test_growth_keeps_earlier_views_valid():
+    reader = MessageReader('<', size=64)
+    first = event(2, 1)
+    reader.feed(first + event(3, 2)[:16])
+    view = reader.next_message()
+    size = len(reader._buf)
+    reader._reserve(1000)
+    assert len(reader._buf) >= size * 2 and len(reader._buf) - reader._end >= 1000
+    # Only the unfinished tail moves to the new buffer
+    assert len(reader) == 16 and reader._start == 0
+    reader.feed(event(3, 2)[16:])
+    assert bytes(reader.next_message()) == event(3, 2)
+    assert bytes(view) == first
+
+def test_read_exact_and_error_dispatch():
+    error = struct.pack('<BBHIHB21x', 0, 5, 3, 0xFFFFFF, 0, 17)
+    reader, seen = collecting_reader()
+    sock = ChunkSocket([b'setup', b'-data', error[:10], error[10:]])
+    assert bytes(reader.read_exact(sock, 10)) == b'setup-data'
+    while not reader.dispatch():
+        reader.fill(sock)
+    assert seen == [('error', error)]
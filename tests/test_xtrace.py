@@ -0,0 +1,129 @@
+import logging
+import struct
+
+from xtrace import (MAGIC, RECORD, REQUEST, SERVER, SETUP, TRUNCATED, LazyHex, OpcodeStats,
+                    WireTrace, hexdump, read_capture)
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class TracedConnection:
+    byte_order = '<'
+    setup_data = b'setup block'
+    trace = None
+
+def reply(sequence, extra=b''):
+    return struct.pack('<BBHI24x', 1, 0, sequence, len(extra) // 4) + extra
+
+def test_ring_keeps_the_last_frames():
+    trace = WireTrace(frames=3, frame_bytes=8)
+    for sequence in range(1, 6):
+        trace.request(sequence, (bytes([127, 0, 1, 0]),), False)
+    assert [frame[2] for frame in trace.ring] == [3, 4, 5]
+    # Totals count every request, not just those still in the ring
+    assert trace.opcodes[127].requests == 5
+    assert trace.bytes_out == 20
+
+def test_frames_are_cut_without_joining_the_payload():
+    trace = WireTrace(frame_bytes=6)
+    payload = bytearray(range(100))
+    trace.request(1, (b'\x48\x02\x1a\x00', payload, b'\0'), False)
+    _, kind, _, length, data = trace.ring[0]
+    assert (kind, length, data) == (REQUEST, 105, b'\x48\x02\x1a\x00\x00\x01')
+
+def test_latency_runs_from_the_flush():
+    clock = FakeClock()
+    trace = WireTrace(clock=clock)
+    trace.request(1, (b'\x10\x00\x02\x00', b'ATOM'), True)
+    clock.now = 1.0         # queued for a second before the flush
+    trace.flushed()
+    clock.now = 1.0 + 300e-6
+    trace.message(1, reply(1))
+    stats = trace.opcodes[16]
+    assert (stats.replies, stats.reply_bytes) == (1, 32)
+    assert stats.histogram[(300).bit_length()] == 1
+    assert trace.summary()["opcodes"]["InternAtom"]["latency_us"]["p50"] == 512
+
+def test_still_queued_request_keeps_waiting_for_its_flush():
+    clock = FakeClock()
+    trace = WireTrace(clock=clock)
+    trace.request(1, (b'\x2b\x00\x01\x00',), True)
+    trace.request(2, (b'\x2b\x00\x01\x00',), True)
+    clock.now = 1.0
+    trace.flushed(queued=2)
+    assert trace._waiting[1][1] == 1.0 and trace._waiting[2][1] == 0.0
+    assert trace._unsent == [2]
+
+def test_percentiles_are_bucket_upper_bounds():
+    stats = OpcodeStats()
+    assert stats.latency_percentile(0.5) is None
+    stats.histogram[3] = 50      # below 8 us
+    stats.histogram[10] = 45     # below 1024 us
+    stats.histogram[20] = 5
+    assert stats.latency_percentile(0.5) == 8
+    assert stats.latency_percentile(0.51) == 1024
+    assert stats.latency_percentile(0.95) == 1024
+    assert stats.latency_percentile(0.99) == 1 << 20
+
+def test_errors_and_events_are_counted():
+    trace = WireTrace()
+    trace.request(1, (b'\x11\x00\x02\x00', b'\xff\xff\xff\x00'), True)
+    trace.flushed()
+    trace.message(1, struct.pack('<BBHIHB21x', 0, 5, 1, 0xFFFFFF, 0, 17))
+    trace.message(1, struct.pack('<B31x', 12 | 0x80))
+    assert trace.opcodes[17].errors == 1
+    assert trace.errors == {5: 1}
+    assert trace.events == {12: 1}
+    assert "error 5" in trace.dump() and "event 12" in trace.dump(last=1)
+
+def test_export_round_trips_through_read_capture(tmp_path):
+    clock = FakeClock()
+    conn = TracedConnection()
+    trace = WireTrace(frame_bytes=16, clock=clock).attach(conn)
+    assert conn.trace is trace
+    clock.now = 0.5
+    trace.request(1, (b'\x2b\x00\x01\x00',), True)
+    trace.flushed()
+    clock.now = 0.75
+    long_reply = reply(1, bytes(8))
+    trace.message(1, long_reply)
+    path = tmp_path / 'trace.xtrace'
+    trace.export(path)
+
+    data = path.read_bytes()
+    assert data[:16] == MAGIC + b'l' + bytes(7)
+    assert RECORD.unpack_from(data, 16) == (0.0, SETUP, 0, 0, 11, 11)
+    byte_order, records = read_capture(path)
+    assert byte_order == '<'
+    assert list(records) == [
+        (0.0, SETUP, 0, 0, 11, b'setup block'),
+        (0.5, REQUEST, 0, 1, 4, b'\x2b\x00\x01\x00'),
+        (0.75, SERVER, TRUNCATED, 1, 40, long_reply[:16]),
+    ]
+    trace.detach(conn)
+    assert conn.trace is None
+
+def test_hexdump_and_lazy_hex(caplog):
+    assert hexdump(b'0123456789abcdef\x00\xff', '  ').splitlines() == [
+        "  0000: 30 31 32 33 34 35 36 37 38 39 61 62 63 64 65 66  0123456789abcdef",
+        "  0010: " + "00 ff".ljust(48) + " ..",
+    ]
+
+    class Counting(bytes):
+        calls = 0
+
+        def hex(self):
+            Counting.calls += 1
+            return super().hex()
+
+    logger = logging.getLogger('xtrace-test')
+    with caplog.at_level(logging.INFO, 'xtrace-test'):
+        logger.debug("%s", LazyHex(Counting(b'\x01\x02')))
+        assert Counting.calls == 0
+        logger.info("%s", LazyHex(Counting(b'\x01\x02')))
+    assert Counting.calls > 0
+    assert caplog.records[-1].getMessage() == "0102"
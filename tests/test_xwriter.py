@@ -0,0 +1,75 @@
+from xconnection import Connection
+from xtrace import WireTrace
+from xwriter import LARGE_PAYLOAD, SENT_ALL, SENT_EARLIER, SENT_NOTHING, OutputBuffer
+
+class RecordingSocket:
+    def __init__(self):
+        self.sends = []
+
+    def sendall(self, data):
+        self.sends.append(bytes(data))
+
+    def sendmsg(self, buffers):
+        self.iov = list(buffers)
+        self.sends.append(b''.join(bytes(buffer) for buffer in buffers))
+        return len(self.sends[-1])
+
+    @property
+    def data(self):
+        return b''.join(self.sends)
+
+def test_requests_are_held_until_flush():
+    sock = RecordingSocket()
+    out = OutputBuffer(sock, delay=None)
+    assert out.write([b'a' * 8]) == SENT_NOTHING
+    assert out.write([b'b' * 4, b'c' * 4]) == SENT_NOTHING
+    assert sock.sends == [] and len(out) == 16
+    assert out.flush()
+    assert sock.data == b'a' * 8 + b'b' * 4 + b'c' * 4
+    assert not out.flush()
+
+def test_a_request_that_does_not_fit_waits_whole():
+    sock = RecordingSocket()
+    out = OutputBuffer(sock, size=LARGE_PAYLOAD, delay=None)
+    out.write([b'a' * 16000])
+    assert out.write([b'b' * 300, b'c' * 100]) == SENT_EARLIER
+    assert sock.data == b'a' * 16000
+    assert out.used == 400
+
+def test_large_payloads_go_out_uncopied_and_in_order():
+    sock = RecordingSocket()
+    out = OutputBuffer(sock, size=LARGE_PAYLOAD, delay=None)
+    payload = bytearray(b'P' * LARGE_PAYLOAD)
+    # Queued payloads as large as the buffer force a flush
+    assert out.write([b'head', payload, b'tail']) == SENT_ALL
+    assert sock.data == b'head' + payload + b'tail'
+    assert any(buffer.obj is payload for buffer in sock.iov)
+
+def test_delay_is_checked_when_the_next_request_is_queued():
+    now = [0.0]
+    sock = RecordingSocket()
+    out = OutputBuffer(sock, delay=0.005, clock=lambda: now[0])
+    assert out.write([b'first']) == SENT_NOTHING
+    now[0] = 0.004
+    assert out.write([b'second']) == SENT_NOTHING
+    now[0] = 0.006
+    assert out.write([b'third']) == SENT_ALL
+    assert sock.data == b'firstsecondthird'
+
+def test_trace_stamps_only_requests_that_were_sent():
+    now = [0.0]
+    sock = RecordingSocket()
+    conn = Connection(sock, '<', buffer_size=LARGE_PAYLOAD, flush_delay=None)
+    trace = WireTrace(clock=lambda: now[0]).attach(conn)
+    conn.send_void(bytes(16000))
+    # Does not fit: the void request goes out, this one stays queued
+    now[0] = 1.0
+    sequence = conn.send_request(conn.proto.InternAtom(0, b'x' * 400)).sequence
+    assert len(sock.sends) == 1
+    now[0] = 2.0
+    conn.flush()
+    now[0] = 2.001
+    reply = bytes((1, 0)) + sequence.to_bytes(2, 'little') + bytes(28)
+    trace.message(sequence, reply)
+    # Latency measured from the flush at 2.0, not from 1.0
+    assert trace.opcodes[16].latency_percentile(1.0) <= 2048
@@ -0,0 +1,232 @@
+import asyncio
+import collections
+import struct
+
+from xconnection import XError
+from xproto import protocol
+from xsetup import SERVER_ORDER, parse_setup, remember_server_order, server_byte_order
+from xstream import MessageReader
+
+# asyncio X11 connection.
+#
+# Same model as xconnection.Connection (pipelined requests, replies matched
+# by sequence number) but replies are asyncio futures, events come out of an
+# async iterator and one event loop can drive any number of displays.
+#
+# Requests queued during one pass of the event loop are written together on
+# the next pass. A reply future that is cancelled or times out just stops
+# waiting: the reply is still consumed when it arrives, so later replies keep
+# matching up.
+
+class AsyncConnection:
+    def __init__(self, reader, writer, byte_order='>'):
+        self.reader = reader
+        self.writer = writer
+        self.byte_order = byte_order
+        self.proto = protocol(byte_order)
+        self.setup_data = b''
+        self.setup = None
+        self.max_request_length = 65535   # in 4-byte units
+        self.sequence = 0
+        self.last_sequence = 0
+        self.pending = {}
+        self.errors = collections.deque()
+        self.closed = False
+        self._events = asyncio.Queue()
+        self._out = []
+        self._flush_scheduled = False
+        self.trace = None
+        self._header = struct.Struct(byte_order + 'BBH')
+        self._error = struct.Struct(byte_order + 'BBHIHB')
+        self._messages = MessageReader(byte_order, on_reply=self._on_reply,
+                                       on_event=self._on_event, on_error=self._on_error)
+        self._read_task = None
+
+    def start(self):
+        self._read_task = asyncio.get_running_loop().create_task(self._read_loop())
+
+    def _queue(self, buffers, has_reply=False):
+        self._out.extend(buffers)
+        self.sequence += 1
+        if self.trace is not None:
+            self.trace.request(self.sequence, buffers, has_reply)
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            asyncio.get_running_loop().call_soon(self._flush)
+
+    def _flush(self):
+        self._flush_scheduled = False
+        if self._out and not self.writer.is_closing():
+            self.writer.writelines(self._out)
+            if self.trace is not None:
+                self.trace.flushed()
+        self._out = []
+
+    def send_void(self, *buffers):
+        self._queue(buffers)
+        return self.sequence
+
+    def send_request(self, request):
+        self._queue((request,), True)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[self.sequence] = future
+        return future
+
+    async def request(self, request, timeout=None):
+        future = self.send_request(request)
+        if timeout is None:
+            return await future
+        return await asyncio.wait_for(future, timeout)
+
+    def write_buffer_size(self):
+        # Bytes queued or held by the transport, not yet taken by the socket
+        queued = 0
+        for buffer in self._out:
+            queued += len(buffer)
+        return queued + self.writer.transport.get_write_buffer_size()
+
+    async def flush(self):
+        # Writes anything queued and waits for the transport to drain
+        self._flush()
+        await self.writer.drain()
+
+    def flush_soon(self):
+        # Nothing to do: queued requests are written on the loop's next pass
+        pass
+
+    async def sync(self, timeout=None):
+        await self.request(self.proto.GetInputFocus(), timeout)
+        if self.errors:
+            raise self.errors.popleft()
+
+    async def next_event(self, timeout=None):
+        if timeout is None:
+            event = await self._events.get()
+        else:
+            event = await asyncio.wait_for(self._events.get(), timeout)
+        if event is None:
+            self._events.put_nowait(None)
+            raise ConnectionError("X server closed the connection")
+        return event
+
+    async def events(self):
+        # async for event in conn.events(): ... ends when the connection closes
+        while True:
+            event = await self._events.get()
+            if event is None:
+                self._events.put_nowait(None)
+                return
+            yield event
+
+    async def close(self):
+        if self.closed:
+            return
+        self._flush()
+        self.closed = True
+        if self._read_task is not None:
+            self._read_task.cancel()
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except (ConnectionError, OSError):
+            pass
+
+    def _widen(self, sequence):
+        return self.sequence - ((self.sequence - sequence) & 0xFFFF)
+
+    async def _read_loop(self):
+        failure = ConnectionError("X server closed the connection")
+        try:
+            while True:
+                data = await self.reader.read(65536)
+                if not data:
+                    break
+                self._messages.feed(data)
+                self._messages.dispatch()
+        except (ConnectionError, OSError) as e:
+            failure = e
+        except asyncio.CancelledError:
+            pass
+        finally:
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(failure)
+            self.pending.clear()
+            self._events.put_nowait(None)
+
+    def _on_error(self, data):
+        _, code, sequence, resource_id, minor, major = self._error.unpack_from(data)
+        sequence = self.last_sequence = self._widen(sequence)
+        if self.trace is not None:
+            self.trace.message(sequence, data)
+        error = XError(code, sequence, resource_id, minor, major)
+        future = self.pending.pop(sequence, None)
+        if future is None:
+            self.errors.append(error)
+        elif not future.done():
+            future.set_exception(error)
+
+    def _on_reply(self, data):
+        sequence = self.last_sequence = self._widen(self._header.unpack_from(data)[2])
+        if self.trace is not None:
+            self.trace.message(sequence, data)
+        future = self.pending.pop(sequence, None)
+        # A cancelled or timed-out future is simply dropped
+        if future is not None and not future.done():
+            future.set_result(data)
+
+    def _on_event(self, data):
+        if data[0] & 0x7F != 11:
+            self.last_sequence = self._widen(self._header.unpack_from(data)[2])
+        if self.trace is not None:
+            self.trace.message(self.last_sequence, data)
+        self._events.put_nowait(data)
+
+async def open_connection(host, display=0, byte_order='>', timeout=5.0,
+                          auth_name=b'', auth_data=b'', setup_cache=None,
+                          handshake_timeout=None):
+    # timeout covers the TCP connect; handshake_timeout (default: the same)
+    # covers the setup exchange. asyncio already sets TCP_NODELAY on the
+    # socket; byte_order='server' works as in xconnection.connect()
+    requested = byte_order
+    if byte_order == SERVER_ORDER:
+        byte_order = server_byte_order(host, display, setup_cache)
+    reader, writer = await asyncio.wait_for(
+        asyncio.open_connection(host, 6000 + display), timeout)
+    try:
+        order = ord('B') if byte_order == '>' else ord('l')
+        setup = struct.pack(byte_order + 'BxHHHH2x', order, 11, 0, len(auth_name), len(auth_data))
+        setup += auth_name + b'\0' * (-len(auth_name) % 4)
+        setup += auth_data + b'\0' * (-len(auth_data) % 4)
+        writer.write(setup)
+
+        async def handshake():
+            try:
+                head = await reader.readexactly(8)
+                extra = struct.unpack_from(byte_order + 'H', head, 6)[0]
+                return head + await reader.readexactly(extra * 4)
+            except asyncio.IncompleteReadError:
+                raise ConnectionError("X server closed the connection during setup") from None
+
+        data = await asyncio.wait_for(
+            handshake(), timeout if handshake_timeout is None else handshake_timeout)
+        if data[0] != 1:
+            reason = data[8:8 + data[1]].decode('ascii', errors='ignore')
+            raise ConnectionError(f"X server refused connection: {reason or data[0]}")
+        try:
+            setup = parse_setup(data, byte_order, setup_cache, (host, display))
+        except (struct.error, ValueError, IndexError):
+            # Some other service on the port answered
+            raise ConnectionError("not an X server: malformed setup reply") from None
+    except BaseException:
+        writer.close()
+        raise
+
+    conn = AsyncConnection(reader, writer, byte_order)
+    conn.setup_data = data
+    conn.setup = setup
+    conn.max_request_length = conn.setup.max_request_length
+    if requested == SERVER_ORDER:
+        remember_server_order(host, display, conn.setup, setup_cache)
+    conn.start()
+    return conn
@@ -0,0 +1,154 @@
+from xconnection import XError
+from xextensions import server_identity
+
+# Atom table.
+#
+# AtomTable interns any number of names in one flight: every InternAtom (or
+# GetAtomName) it needs is written back-to-back before the first reply is
+# awaited, so a window setup that needs WM_PROTOCOLS, WM_DELETE_WINDOW,
+# _NET_WM_NAME and friends costs one round trip instead of one per atom.
+# Name -> atom and atom -> name are cached together and memoized per server
+# identity for the life of the process, like ExtensionRegistry; the
+# predefined atoms are known without asking.
+#
+# With an xsetup.SetupCache the table is also kept on disk. Atom values only
+# hold for one run of the server, so a table read from disk is confirmed in
+# the next flight: a GetAtomName of its highest atom goes out with the other
+# requests, and if the server answers with another name (or BadAtom) it has
+# been restarted, the stored atoms are dropped and the names are asked again.
+
+PREDEFINED_ATOMS = [
+    'PRIMARY', 'SECONDARY', 'ARC', 'ATOM', 'BITMAP', 'CARDINAL', 'COLORMAP', 'CURSOR',
+    'CUT_BUFFER0', 'CUT_BUFFER1', 'CUT_BUFFER2', 'CUT_BUFFER3', 'CUT_BUFFER4', 'CUT_BUFFER5',
+    'CUT_BUFFER6', 'CUT_BUFFER7', 'DRAWABLE', 'FONT', 'INTEGER', 'PIXMAP', 'POINT', 'RECTANGLE',
+    'RESOURCE_MANAGER', 'RGB_COLOR_MAP', 'RGB_BEST_MAP', 'RGB_BLUE_MAP', 'RGB_DEFAULT_MAP',
+    'RGB_GRAY_MAP', 'RGB_GREEN_MAP', 'RGB_RED_MAP', 'STRING', 'VISUALID', 'WINDOW',
+    'WM_COMMAND', 'WM_HINTS', 'WM_CLIENT_MACHINE', 'WM_ICON_NAME', 'WM_ICON_SIZE', 'WM_NAME',
+    'WM_NORMAL_HINTS', 'WM_SIZE_HINTS', 'WM_ZOOM_HINTS', 'MIN_SPACE', 'NORM_SPACE', 'MAX_SPACE',
+    'END_SPACE', 'SUPERSCRIPT_X', 'SUPERSCRIPT_Y', 'SUBSCRIPT_X', 'SUBSCRIPT_Y',
+    'UNDERLINE_POSITION', 'UNDERLINE_THICKNESS', 'STRIKEOUT_ASCENT', 'STRIKEOUT_DESCENT',
+    'ITALIC_ANGLE', 'X_HEIGHT', 'QUAD_WIDTH', 'WEIGHT', 'POINT_SIZE', 'RESOLUTION', 'COPYRIGHT',
+    'NOTICE', 'FONT_NAME', 'FAMILY_NAME', 'FULL_NAME', 'CAP_HEIGHT', 'WM_CLASS',
+    'WM_TRANSIENT_FOR']
+
+# Bumped when the stored table layout changes
+_FORMAT = 1
+
+class _ServerAtoms:
+    __slots__ = ('atoms', 'names', 'unconfirmed')
+
+    def __init__(self):
+        self.atoms = {name: atom for atom, name in enumerate(PREDEFINED_ATOMS, 1)}
+        self.names = dict(enumerate(PREDEFINED_ATOMS, 1))
+        self.unconfirmed = None    # names read from disk, not checked yet
+
+class AtomTable:
+    _servers = {}
+
+    def __init__(self, conn, cache=None, identity=None):
+        self.conn = conn
+        self.cache = cache
+        if identity is None:
+            identity = server_identity(conn)
+        self._key = ('atoms', *identity)
+        server = self._servers.get(identity)
+        if server is None:
+            server = self._servers[identity] = _ServerAtoms()
+            if cache is not None:
+                self._load(server)
+        self._server = server
+        self.requests = 0
+
+    def __getitem__(self, name):
+        return self.intern(name)
+
+    def intern(self, name, only_if_exists=False):
+        return self.intern_many([name], only_if_exists)[name]
+
+    def intern_many(self, names, only_if_exists=False):
+        # Returns {name: atom}; with only_if_exists, names the server does
+        # not know map to None (and are not cached, they may appear later)
+        server = self._server
+        atoms = server.atoms
+        check = self._send_check()
+        encode = self.conn.proto.InternAtom
+        futures = [(name, self.conn.send_request(encode(only_if_exists, name.encode('latin-1'))))
+                   for name in dict.fromkeys(names) if name not in atoms]
+        self.requests += len(futures)
+        stale = not self._confirm(check)
+        if futures:
+            decode = self.conn.proto.replies.InternAtom
+            for name, future in futures:
+                atom = decode(future.result()).atom
+                if atom:
+                    atoms[name] = atom
+                    server.names[atom] = name
+            self._save()
+        if stale and any(name not in atoms for name in names):
+            return self.intern_many(names, only_if_exists)
+        return {name: atoms.get(name) for name in names}
+
+    def name(self, atom):
+        return self.names([atom])[atom]
+
+    def names(self, atoms):
+        # Returns {atom: name}; raises XError (BadAtom) for an unknown atom
+        server = self._server
+        names = server.names
+        check = self._send_check()
+        encode = self.conn.proto.GetAtomName
+        futures = [(atom, self.conn.send_request(encode(atom)))
+                   for atom in dict.fromkeys(atoms) if atom not in names]
+        self.requests += len(futures)
+        stale = not self._confirm(check)
+        if futures:
+            decode = self.conn.proto.replies.GetAtomName
+            for atom, future in futures:
+                reply = future.result()
+                name = str(reply[32:32 + decode(reply).name_len], 'latin-1')
+                names[atom] = name
+                server.atoms[name] = atom
+            self._save()
+        if stale and any(atom not in names for atom in atoms):
+            return self.names(atoms)
+        return {atom: names[atom] for atom in atoms}
+
+    def _send_check(self):
+        unconfirmed = self._server.unconfirmed
+        if not unconfirmed:
+            return None
+        atom = max(unconfirmed.values())
+        return atom, unconfirmed, self.conn.send_request(self.conn.proto.GetAtomName(atom))
+
+    def _confirm(self, check):
+        # False when the table on disk was from an earlier run of the server
+        if check is None:
+            return True
+        atom, unconfirmed, future = check
+        server = self._server
+        try:
+            reply = future.result()
+            length = self.conn.proto.replies.GetAtomName(reply).name_len
+            current = str(reply[32:32 + length], 'latin-1') == server.names.get(atom)
+        except XError:
+            current = False
+        server.unconfirmed = None
+        if not current:
+            for name, stored in unconfirmed.items():
+                if server.atoms.get(name) == stored:
+                    del server.atoms[name]
+                    del server.names[stored]
+        return current
+
+    def _load(self, server):
+        stored = self.cache.get(self._key, _FORMAT)
+        if stored:
+            server.atoms.update(stored)
+            server.names.update((atom, name) for name, atom in stored.items())
+            server.unconfirmed = dict(stored)
+
+    def _save(self):
+        if self.cache is not None:
+            server = self._server
+            self.cache.put(self._key, _FORMAT, {name: atom for name, atom in server.atoms.items()
+                                                if atom > len(PREDEFINED_ATOMS)})
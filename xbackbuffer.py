@@ -0,0 +1,130 @@
+import asyncio
+import struct
+import time
+
+from xdraw import DrawBatch
+
+# Double buffering.
+#
+# Drawing straight into a window makes the server repaint after every
+# primitive, which flickers and wastes work. A BackBuffer keeps a pixmap of
+# the window's size and depth; frames are drawn into it with DrawBatch and
+# shown with a single CopyArea. The window must select StructureNotify
+# (event mask 0x20000) so handle_event() sees ConfigureNotify and can follow
+# resizes. FramePacer paces a render loop to a target frame rate and counts
+# the frames that missed their slot.
+#
+# present() calls the connection's flush_soon(): a blocking Connection only
+# writes when a reply is needed, its buffer fills or a later request finds
+# its delay expired, so a frame left queued before the pacer sleeps would be
+# shown one frame late, and the last one never. The asyncio connection
+# writes on the loop's next pass anyway.
+
+CONFIGURE_NOTIFY = 22
+
+class BackBuffer:
+    def __init__(self, conn, window, width, height, new_id, depth=None, screen=0):
+        # new_id() returns a fresh resource ID; two are used, one for the
+        # pixmap and one for the GC that copies it to the window
+        self.conn = conn
+        self.window = window
+        self.width = width
+        self.height = height
+        self.depth = depth if depth is not None else conn.setup.screens[screen].root_depth
+        self.pixmap = new_id()
+        self.copy_gc = new_id()
+        self.presents = 0
+        self.resizes = 0
+        self._configure = struct.Struct(conn.byte_order + '4xII4xhhHH')
+        conn.send_void(conn.proto.CreatePixmap(self.depth, self.pixmap, window, width, height))
+        # graphics-exposures off: a CopyArea from a pixmap never needs
+        # GraphicsExpose/NoExpose events
+        conn.send_void(conn.proto.CreateGC(self.copy_gc, self.pixmap, 0x00010000, [0]))
+
+    def batch(self, gc, **options):
+        # DrawBatch drawing into the back buffer
+        return DrawBatch(self.conn, self.pixmap, gc, **options)
+
+    def present(self, region=None):
+        # Copies the back buffer (or the bounding box of region) to the window
+        if region is not None:
+            bounds = region.bounds()
+            if bounds is None:
+                return
+            x, y, width, height = bounds
+        else:
+            x, y, width, height = 0, 0, self.width, self.height
+        self.conn.send_void(self.conn.proto.CopyArea(self.pixmap, self.window, self.copy_gc,
+                                                     x, y, x, y, width, height))
+        self.presents += 1
+        self.conn.flush_soon()
+
+    def resize(self, width, height):
+        if (width, height) == (self.width, self.height):
+            return False
+        # The freed ID is immediately valid again, requests run in order
+        self.conn.send_void(self.conn.proto.FreePixmap(self.pixmap))
+        self.conn.send_void(self.conn.proto.CreatePixmap(self.depth, self.pixmap, self.window,
+                                                         width, height))
+        self.width = width
+        self.height = height
+        self.resizes += 1
+        return True
+
+    def handle_event(self, event):
+        # Returns True when a ConfigureNotify for the window changed its size;
+        # the new pixmap is empty and the whole frame has to be redrawn
+        if event[0] & 0x7F != CONFIGURE_NOTIFY:
+            return False
+        _, window, _, _, width, height = self._configure.unpack_from(event)
+        if window != self.window:
+            return False
+        return self.resize(width, height)
+
+    def close(self):
+        self.conn.send_void(self.conn.proto.FreeGC(self.copy_gc))
+        self.conn.send_void(self.conn.proto.FreePixmap(self.pixmap))
+
+class FramePacer:
+    def __init__(self, fps, clock=time.monotonic):
+        self.interval = 1.0 / fps
+        self.clock = clock
+        self.frames = 0
+        self.dropped = 0
+        self._next = None
+
+    def _advance(self):
+        # Seconds to wait until the next frame slot
+        now = self.clock()
+        self.frames += 1
+        if self._next is None:
+            self._next = now
+        self._next += self.interval
+        if now >= self._next:
+            # The frame overran: skip the slots it missed rather than
+            # rendering a burst of frames to catch up
+            missed = int((now - self._next) // self.interval) + 1
+            self.dropped += missed
+            self._next += missed * self.interval
+        return self._next - now
+
+    def wait(self, conn=None):
+        # Call once per presented frame; conn is flushed before sleeping
+        if conn is not None:
+            conn.flush()
+        time.sleep(self._advance())
+
+    async def wait_async(self):
+        await asyncio.sleep(self._advance())
+
+    def run(self, render, frames=None, conn=None):
+        # Calls render() once per slot until it returns False or frames have
+        # been rendered, flushing conn (if given) after each
+        while frames is None or self.frames < frames:
+            if render() is False:
+                break
+            self.wait(conn)
+
+    def __repr__(self):
+        return (f"<FramePacer fps={1 / self.interval:.0f} frames={self.frames} "
+                f"dropped={self.dropped}>")
@@ -0,0 +1,195 @@
+import collections
+import socket
+import struct
+
+from xproto import protocol
+from xsetup import SERVER_ORDER, parse_setup, remember_server_order, server_byte_order
+from xstream import MessageReader
+from xwriter import SENT_EARLIER, OutputBuffer
+
+# Pipelined X11 connection.
+#
+# Requests are queued instead of being sent one at a time. Void requests
+# (CreateWindow, MapWindow, OpenFont, CreateGC, ...) never wait for anything;
+# requests that have a reply hand back a ReplyFuture. Nothing touches the
+# network until a reply is actually needed (or the output buffer fills up or
+# has held requests for a few milliseconds, see xwriter), so a whole scene is
+# written in one go and costs a single round trip.
+#
+# connect(byte_order='server') talks to the server in its own byte order so
+# it never has to swap requests: the order the server used for images on an
+# earlier connection, remembered in memory and in the setup cache, or this
+# machine's order the first time.
+
+class XError(Exception):
+    def __init__(self, code, sequence, resource_id, minor_opcode, major_opcode):
+        super().__init__(f"X error {code} (request {major_opcode}.{minor_opcode}, "
+                         f"sequence {sequence}, resource 0x{resource_id:x})")
+        self.code = code
+        self.sequence = sequence
+        self.resource_id = resource_id
+        self.minor_opcode = minor_opcode
+        self.major_opcode = major_opcode
+
+class ReplyFuture:
+    __slots__ = ('conn', 'sequence', 'reply', 'error')
+
+    def __init__(self, conn, sequence):
+        self.conn = conn
+        self.sequence = sequence
+        self.reply = None
+        self.error = None
+
+    def done(self):
+        return self.reply is not None or self.error is not None
+
+    def result(self):
+        # Flushes whatever is queued and reads until our reply (or error) shows up
+        if not self.done():
+            self.conn.flush()
+            while not self.done():
+                self.conn.read_message()
+        if self.error is not None:
+            raise self.error
+        return self.reply
+
+class Connection:
+    def __init__(self, sock, byte_order='>', buffer_size=65536, flush_delay=0.005):
+        self.sock = sock
+        self.byte_order = byte_order
+        self.proto = protocol(byte_order)
+        self.setup_data = b''
+        self.setup = None
+        self.max_request_length = 65535   # in 4-byte units
+        self.sequence = 0          # sequence number of the last request queued
+        self.last_sequence = 0     # sequence number of the last message read
+        self.pending = {}          # sequence -> ReplyFuture
+        self.events = collections.deque()
+        self.errors = collections.deque()   # errors for void requests
+        self.out = OutputBuffer(sock, buffer_size, flush_delay)
+        self.trace = None          # xtrace.WireTrace, when attached
+        self._header = struct.Struct(byte_order + 'BBH')
+        self._error = struct.Struct(byte_order + 'BBHIHB')
+        self.reader = MessageReader(byte_order, on_reply=self._on_reply,
+                                    on_event=self._on_event, on_error=self._on_error)
+
+    def send_void(self, *buffers):
+        # A request may be passed in pieces (header, payload, padding) so big
+        # payloads are never copied into a joined bytes object
+        self.sequence += 1
+        if self.trace is not None:
+            self.trace.request(self.sequence, buffers, False)
+        sent = self.out.write(buffers)
+        if sent and self.trace is not None:
+            self.trace.flushed(self.sequence if sent == SENT_EARLIER else None)
+        return self.sequence
+
+    def send_request(self, request):
+        self.sequence += 1
+        if self.trace is not None:
+            self.trace.request(self.sequence, (request,), True)
+        sent = self.out.write((request,))
+        if sent and self.trace is not None:
+            self.trace.flushed(self.sequence if sent == SENT_EARLIER else None)
+        future = ReplyFuture(self, self.sequence)
+        self.pending[self.sequence] = future
+        return future
+
+    def flush(self):
+        if self.out.flush() and self.trace is not None:
+            self.trace.flushed()
+
+    def flush_soon(self):
+        # Gets queued requests onto the wire without waiting for a reply;
+        # the same call exists on AsyncConnection and MirrorSession
+        self.flush()
+
+    def sync(self):
+        # One round trip; raises the first error caused by an earlier void request
+        self.send_request(self.proto.GetInputFocus()).result()
+        if self.errors:
+            raise self.errors.popleft()
+
+    def next_event(self):
+        self.flush()
+        while not self.events:
+            self.read_message()
+        return self.events.popleft()
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self.sock.close()
+
+    def _widen(self, sequence):
+        # Servers answer in order, so the 16-bit value always refers to the
+        # most recent request with those low bits.
+        return self.sequence - ((self.sequence - sequence) & 0xFFFF)
+
+    def read_message(self):
+        # Reads whatever the socket has and dispatches every complete message
+        while not self.reader.dispatch():
+            self.reader.fill(self.sock)
+
+    def _on_error(self, data):
+        _, code, sequence, resource_id, minor, major = self._error.unpack_from(data)
+        sequence = self.last_sequence = self._widen(sequence)
+        if self.trace is not None:
+            self.trace.message(sequence, data)
+        error = XError(code, sequence, resource_id, minor, major)
+        future = self.pending.pop(sequence, None)
+        if future is not None:
+            future.error = error
+        else:
+            self.errors.append(error)
+
+    def _on_reply(self, data):
+        sequence = self.last_sequence = self._widen(self._header.unpack_from(data)[2])
+        if self.trace is not None:
+            self.trace.message(sequence, data)
+        future = self.pending.pop(sequence, None)
+        if future is not None:
+            future.reply = data
+
+    def _on_event(self, data):
+        # KeymapNotify carries no sequence number
+        if data[0] & 0x7F != 11:
+            self.last_sequence = self._widen(self._header.unpack_from(data)[2])
+        if self.trace is not None:
+            self.trace.message(self.last_sequence, data)
+        self.events.append(data)
+
+def connect(host, display=0, byte_order='>', auth_name=b'', auth_data=b'', setup_cache=None):
+    requested = byte_order
+    if byte_order == SERVER_ORDER:
+        byte_order = server_byte_order(host, display, setup_cache)
+    sock = socket.create_connection((host, 6000 + display))
+    # Requests are batched by the output buffer; Nagle would only hold the
+    # last segment of each flush back until the previous one is acknowledged
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    order = ord('B') if byte_order == '>' else ord('l')
+    setup = struct.pack(byte_order + 'BxHHHH2x', order, 11, 0, len(auth_name), len(auth_data))
+    setup += auth_name + b'\0' * (-len(auth_name) % 4)
+    setup += auth_data + b'\0' * (-len(auth_data) % 4)
+    sock.sendall(setup)
+
+    conn = Connection(sock, byte_order)
+    head = conn.reader.read_exact(sock, 8)
+    extra = struct.unpack_from(byte_order + 'H', head, 6)[0]
+    data = bytes(head) + bytes(conn.reader.read_exact(sock, extra * 4))
+    if data[0] != 1:
+        sock.close()
+        reason = data[8:8 + data[1]].decode('ascii', errors='ignore')
+        raise ConnectionError(f"X server refused connection: {reason or data[0]}")
+
+    try:
+        conn.setup = parse_setup(data, byte_order, setup_cache, (host, display))
+    except (struct.error, ValueError, IndexError):
+        sock.close()
+        raise ConnectionError("not an X server: malformed setup reply") from None
+    conn.setup_data = data
+    conn.max_request_length = conn.setup.max_request_length
+    if requested == SERVER_ORDER:
+        remember_server_order(host, display, conn.setup, setup_cache)
+    return conn
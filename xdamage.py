@@ -0,0 +1,130 @@
+import struct
+
+# Expose coalescing.
+#
+# The server reports an uncovered area as a burst of Expose (or
+# GraphicsExpose) events; the count field says how many more of the burst
+# follow. DamageTracker merges the rectangles of a burst into a Region and
+# calls the redraw callback once, when count reaches 0, with the window and
+# the damaged region. set_clip() turns the region into a GC clip so the
+# redraw only touches the dirty area.
+
+EXPOSE = 12
+GRAPHICS_EXPOSE = 13
+NO_EXPOSE = 14
+
+class Region:
+    __slots__ = ('rects', 'max_rects')
+
+    def __init__(self, max_rects=16):
+        self.rects = []
+        self.max_rects = max_rects
+
+    def __bool__(self):
+        return bool(self.rects)
+
+    def __iter__(self):
+        return iter(self.rects)
+
+    def __len__(self):
+        return len(self.rects)
+
+    def __repr__(self):
+        return f"<Region {self.rects}>"
+
+    def bounds(self):
+        if not self.rects:
+            return None
+        left = min(x for x, _, _, _ in self.rects)
+        top = min(y for _, y, _, _ in self.rects)
+        right = max(x + w for x, _, w, _ in self.rects)
+        bottom = max(y + h for _, y, _, h in self.rects)
+        return (left, top, right - left, bottom - top)
+
+    def add(self, x, y, width, height):
+        if width <= 0 or height <= 0:
+            return
+        rect = (x, y, width, height)
+        merged = True
+        while merged:
+            merged = False
+            for index, other in enumerate(self.rects):
+                if _contains(other, rect):
+                    return
+                combined = _merge(other, rect)
+                if combined is not None:
+                    # Absorb it and try again, the bigger rectangle may now
+                    # merge with others
+                    del self.rects[index]
+                    rect = combined
+                    merged = True
+                    break
+        self.rects.append(rect)
+        if len(self.rects) > self.max_rects:
+            # Too fragmented to be worth clipping precisely
+            self.rects = [self.bounds()]
+
+    def clear(self):
+        self.rects = []
+
+def _contains(outer, inner):
+    ox, oy, ow, oh = outer
+    ix, iy, iw, ih = inner
+    return ox <= ix and oy <= iy and ix + iw <= ox + ow and iy + ih <= oy + oh
+
+def _merge(a, b):
+    # Union of two rectangles when it is itself a rectangle: one contains the
+    # other, or they share a full edge span and touch or overlap
+    if _contains(b, a):
+        return b
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    if ax == bx and aw == bw and ay <= by + bh and by <= ay + ah:
+        top = min(ay, by)
+        return (ax, top, aw, max(ay + ah, by + bh) - top)
+    if ay == by and ah == bh and ax <= bx + bw and bx <= ax + aw:
+        left = min(ax, bx)
+        return (left, ay, max(ax + aw, bx + bw) - left, ah)
+    return None
+
+class DamageTracker:
+    def __init__(self, conn, redraw, max_rects=16):
+        # redraw(window, region) is called once per finished Expose burst;
+        # events are decoded in the connection's byte order
+        self.redraw = redraw
+        self.max_rects = max_rects
+        self.pending = {}
+        self.redraws = 0
+        self.events = 0
+        self._expose = struct.Struct(conn.byte_order + '4xIHHHHH')
+        self._graphics_expose = struct.Struct(conn.byte_order + '4xIHHHHHHB')
+
+    def feed(self, event):
+        # Returns True if the event was an exposure event and has been consumed
+        kind = event[0] & 0x7F
+        if kind == EXPOSE:
+            window, x, y, width, height, count = self._expose.unpack_from(event)
+        elif kind == GRAPHICS_EXPOSE:
+            window, x, y, width, height, _, count, _ = self._graphics_expose.unpack_from(event)
+        elif kind == NO_EXPOSE:
+            return True
+        else:
+            return False
+        self.events += 1
+        region = self.pending.get(window)
+        if region is None:
+            region = self.pending[window] = Region(self.max_rects)
+        region.add(x, y, width, height)
+        if count == 0:
+            del self.pending[window]
+            self.redraws += 1
+            self.redraw(window, region)
+        return True
+
+def set_clip(conn, gc, region, origin=(0, 0)):
+    # Restricts drawing with gc to the region (ordering UnSorted)
+    conn.send_void(conn.proto.SetClipRectangles(0, gc, origin[0], origin[1], list(region)))
+
+def clear_clip(conn, gc):
+    # clip-mask None
+    conn.send_void(conn.proto.ChangeGC(gc, 0x00080000, [0]))
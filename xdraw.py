@@ -0,0 +1,155 @@
+from xproto import text_items
+
+# Batched drawing.
+#
+# A DrawBatch collects primitives for one drawable/GC pair and turns them into
+# as few Poly* requests as possible when flushed. Consecutive primitives of
+# the same kind share a request, so painting order is kept; with
+# ordered=False every kind is merged into one run for the fewest requests.
+# Runs are split so that no request exceeds the connection's
+# max_request_length (which is larger once BIG-REQUESTS is enabled, see
+# xextensions.enable_big_requests).
+
+POINT = 'PolyPoint'
+SEGMENT = 'PolySegment'
+RECTANGLE = 'PolyRectangle'
+FILL_RECTANGLE = 'PolyFillRectangle'
+ARC = 'PolyArc'
+FILL_ARC = 'PolyFillArc'
+TEXT = 'PolyText8'
+
+# Fixed part and size of one item, in 4-byte units
+_HEADER_WORDS = {POINT: 3, SEGMENT: 3, RECTANGLE: 3, FILL_RECTANGLE: 3,
+                 ARC: 3, FILL_ARC: 3, TEXT: 4}
+_ITEM_WORDS = {POINT: 1, SEGMENT: 2, RECTANGLE: 2, FILL_RECTANGLE: 2, ARC: 3, FILL_ARC: 3}
+
+class DrawBatch:
+    def __init__(self, conn, drawable, gc, ordered=True, text_width=None):
+        self.conn = conn
+        self.drawable = drawable
+        self.gc = gc
+        self.ordered = ordered
+        # Callable returning the advance width of a byte string in the GC's
+        # font; without it every string is its own PolyText8 request
+        self.text_width = text_width
+        self._runs = []
+        self.requests_sent = 0
+
+    def _add(self, kind, item):
+        runs = self._runs
+        if runs and runs[-1][0] == kind:
+            runs[-1][1].append(item)
+            return
+        if not self.ordered:
+            for run in runs:
+                if run[0] == kind:
+                    run[1].append(item)
+                    return
+        runs.append((kind, [item]))
+
+    def point(self, x, y):
+        self._add(POINT, (x, y))
+
+    def line(self, x1, y1, x2, y2):
+        self._add(SEGMENT, (x1, y1, x2, y2))
+
+    def rectangle(self, x, y, width, height):
+        self._add(RECTANGLE, (x, y, width, height))
+
+    def fill_rectangle(self, x, y, width, height):
+        self._add(FILL_RECTANGLE, (x, y, width, height))
+
+    def arc(self, x, y, width, height, angle1=0, angle2=360 * 64):
+        self._add(ARC, (x, y, width, height, angle1, angle2))
+
+    def fill_arc(self, x, y, width, height, angle1=0, angle2=360 * 64):
+        self._add(FILL_ARC, (x, y, width, height, angle1, angle2))
+
+    def text(self, x, y, string):
+        if isinstance(string, str):
+            string = string.encode('latin-1', errors='replace')
+        self._add(TEXT, (x, y, string))
+
+    def __len__(self):
+        return sum(len(items) for _, items in self._runs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if exc_info[0] is None:
+            self.flush()
+
+    def flush(self):
+        limit = self.conn.max_request_length
+        # A request longer than 65535 words carries an extra length word
+        big = 1 if limit > 0xFFFF else 0
+        proto = self.conn.proto
+        for kind, items in self._runs:
+            if kind == TEXT:
+                self._flush_text(items, limit, big)
+                continue
+            encode = getattr(proto, kind)
+            per_request = (limit - _HEADER_WORDS[kind] - big) // _ITEM_WORDS[kind]
+            for start in range(0, len(items), per_request):
+                chunk = items[start:start + per_request]
+                if kind == POINT:
+                    request = encode(0, self.drawable, self.gc, chunk)
+                else:
+                    request = encode(self.drawable, self.gc, chunk)
+                self.conn.send_void(request)
+                self.requests_sent += 1
+        self._runs = []
+
+    def _flush_text(self, items, limit, big):
+        encode = self.conn.proto.PolyText8
+        max_bytes = (limit - _HEADER_WORDS[TEXT] - big) * 4
+        # Longest string that fits in one request: whole 254-byte items
+        max_string = max_bytes // 256 * 254 or max_bytes - 2
+        text_width = self.text_width
+        request_x = request_y = None
+        pen_x = 0
+        body = []
+        size = 0
+
+        def emit():
+            if body:
+                self.conn.send_void(encode(self.drawable, self.gc, request_x, request_y,
+                                           b''.join(body)))
+                self.requests_sent += 1
+
+        for x, y, string in items:
+            if text_width is not None and body and y == request_y:
+                # Same baseline: continue the current request, moving the pen
+                # with item deltas (chained through empty items when the gap
+                # does not fit in an INT8)
+                gap = x - pen_x
+                prefix = []
+                while not -128 <= gap <= 127:
+                    step = 127 if gap > 0 else -128
+                    prefix.append(bytes((0, step & 0xFF)))
+                    gap -= step
+                encoded = b''.join(prefix) + text_items(string, gap)
+                if size + len(encoded) <= max_bytes:
+                    body.append(encoded)
+                    size += len(encoded)
+                    pen_x = x + text_width(string)
+                    continue
+            emit()
+            request_x, request_y = x, y
+            if len(string) > max_string:
+                # Split over several requests, each starting where the text
+                # of the previous one ended
+                if text_width is None:
+                    raise ValueError(f"a {len(string)}-byte string needs several PolyText8 "
+                                     "requests, which needs text_width")
+                while len(string) > max_string:
+                    body = [text_items(string[:max_string])]
+                    emit()
+                    request_x += text_width(string[:max_string])
+                    string = string[max_string:]
+            encoded = text_items(string)
+            body = [encoded]
+            size = len(encoded)
+            pen_x = request_x + text_width(string) if text_width is not None else 0
+        emit()
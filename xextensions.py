@@ -0,0 +1,134 @@
+import bisect
+import struct
+
+from xproto import parse_str_list
+
+# Extension discovery.
+#
+# ExtensionRegistry writes every QueryExtension it needs back-to-back and only
+# then waits for the replies, so probing any number of extensions costs one
+# round trip (two if the names come from ListExtensions first). Results are
+# memoized per server identity for the life of the process, so later
+# registries for the same server, opcode lookups and event/error decoding
+# never touch the network.
+
+class Extension:
+    __slots__ = ('name', 'present', 'major_opcode', 'first_event', 'first_error')
+
+    def __init__(self, name, present, major_opcode, first_event, first_error):
+        self.name = name
+        self.present = present
+        self.major_opcode = major_opcode if present else None
+        self.first_event = first_event if present else None
+        self.first_error = first_error if present else None
+
+    def __repr__(self):
+        if not self.present:
+            return f"<Extension {self.name} absent>"
+        return (f"<Extension {self.name} opcode={self.major_opcode} "
+                f"event={self.first_event} error={self.first_error}>")
+
+class _ServerExtensions:
+    __slots__ = ('names', 'extensions', 'event_bases', 'error_bases')
+
+    def __init__(self):
+        self.names = None
+        self.extensions = {}
+        self.event_bases = None
+        self.error_bases = None
+
+def server_identity(conn):
+    try:
+        peer = conn.sock.getpeername()
+    except (OSError, AttributeError):
+        peer = None
+    setup = conn.setup
+    if setup is None:
+        return (peer,)
+    return (peer, setup.vendor, setup.release)
+
+class ExtensionRegistry:
+    _servers = {}
+
+    def __init__(self, conn, identity=None):
+        self.conn = conn
+        if identity is None:
+            identity = server_identity(conn)
+        server = self._servers.get(identity)
+        if server is None:
+            server = self._servers[identity] = _ServerExtensions()
+        self._server = server
+
+    def list(self):
+        server = self._server
+        if server.names is None:
+            reply = self.conn.send_request(self.conn.proto.ListExtensions()).result()
+            count = self.conn.proto.replies.ListExtensions(reply).names_len
+            server.names = parse_str_list(reply, 32, count)
+        return server.names
+
+    def probe(self, names=None):
+        # Queries every name that is not known yet in a single flight
+        if names is None:
+            names = self.list()
+        extensions = self._server.extensions
+        proto = self.conn.proto
+        futures = [(name, self.conn.send_request(proto.QueryExtension(name.encode('ascii'))))
+                   for name in dict.fromkeys(names) if name not in extensions]
+        if futures:
+            decode = proto.replies.QueryExtension
+            for name, future in futures:
+                extensions[name] = Extension(name, *decode(future.result()))
+            self._server.event_bases = self._server.error_bases = None
+        return {name: extensions[name] for name in names}
+
+    def get(self, name):
+        extension = self._server.extensions.get(name)
+        if extension is None:
+            extension = self.probe([name])[name]
+        return extension if extension.present else None
+
+    def major_opcode(self, name):
+        extension = self.get(name)
+        return extension.major_opcode if extension else None
+
+    def _bases(self, attribute):
+        bases = sorted((getattr(extension, attribute), extension.name)
+                       for extension in self._server.extensions.values()
+                       if extension.present and getattr(extension, attribute))
+        return [base for base, _ in bases], [name for _, name in bases]
+
+    def event_owner(self, code):
+        # Returns (extension name, offset from its first event) or None for core events
+        code &= 0x7F
+        server = self._server
+        if server.event_bases is None:
+            server.event_bases = self._bases('first_event')
+        return self._owner(server.event_bases, code)
+
+    def error_owner(self, code):
+        server = self._server
+        if server.error_bases is None:
+            server.error_bases = self._bases('first_error')
+        return self._owner(server.error_bases, code)
+
+    @staticmethod
+    def _owner(bases, code):
+        codes, names = bases
+        index = bisect.bisect_right(codes, code) - 1
+        if index < 0:
+            return None
+        return names[index], code - codes[index]
+
+def enable_big_requests(conn, registry=None):
+    # Switches the connection to BIG-REQUESTS if the server has it and
+    # records the new limit (in 4-byte units) on conn.max_request_length
+    if registry is None:
+        registry = ExtensionRegistry(conn)
+    major_opcode = registry.major_opcode('BIG-REQUESTS')
+    if major_opcode is None:
+        return False
+    request = struct.pack(conn.byte_order + 'BBH', major_opcode, 0, 1)  # BigReqEnable
+    reply = conn.send_request(request).result()
+    conn.max_request_length = struct.unpack_from(conn.byte_order + 'I', reply, 8)[0]
+    return True
@@ -0,0 +1,261 @@
+import array
+import bisect
+import collections
+import itertools
+import struct
+import sys
+
+from xextensions import server_identity
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Font metrics cache.
+#
+# Measuring text with QueryTextExtents costs a round trip per string.
+# FontCache asks QueryFont once per font instead and keeps the per-glyph
+# metrics as five 256-entry int16 tables indexed by the byte PolyText8
+# would send (advance width, left and right bearing, ascent, descent), with
+# missing glyphs already replaced by the font's default_char. Widths,
+# extents, line wrapping and truncation are then table lookups: NumPy
+# gathers and cumulative sums when it is installed, array lookups and
+# itertools.accumulate otherwise.
+#
+# Metrics are memoized per server identity for the life of the process, and
+# optionally on disk through an xsetup.SetupCache, so a later connection to
+# the same server opens its fonts without waiting for any reply. Only 8-bit
+# text is measured; for matrix (two-byte) fonts the first row is used, as
+# the server does for PolyText8.
+
+TextExtents = collections.namedtuple(
+    'TextExtents', 'width ascent descent left_bearing right_bearing')
+
+# Bumped when the pickled FontMetrics layout changes
+_FORMAT = 1
+
+_CHARINFO = 'hhhhhH'
+
+class FontMetrics:
+    __slots__ = ('name', 'ascent', 'descent', 'min_bounds', 'max_bounds', 'default_char',
+                 'widths', 'left_bearings', 'right_bearings', 'ascents', 'descents')
+
+    def __repr__(self):
+        return (f"<FontMetrics {self.name!r} ascent={self.ascent} descent={self.descent} "
+                f"max_width={self.max_bounds[2]}>")
+
+    @property
+    def height(self):
+        return self.ascent + self.descent
+
+    def width(self, text):
+        # Advance width of the string, what DrawBatch(text_width=...) expects
+        text = _bytes(text)
+        # Short strings are cheaper without the NumPy call overhead
+        if np is not None and len(text) > 16:
+            return int(_table(self.widths)[np.frombuffer(text, np.uint8)].sum())
+        return sum(map(self.widths.__getitem__, text))
+
+    __call__ = width
+
+    def extents(self, text):
+        # Same values as QueryTextExtents' overall fields (font ascent and
+        # descent are the attributes)
+        text = _bytes(text)
+        if not text:
+            return TextExtents(0, 0, 0, 0, 0)
+        if np is not None:
+            codes = np.frombuffer(text, np.uint8)
+            advances = _table(self.widths)[codes].astype(np.int64)
+            origins = np.cumsum(advances) - advances
+            return TextExtents(int(advances.sum()),
+                               int(_table(self.ascents)[codes].max()),
+                               int(_table(self.descents)[codes].max()),
+                               int((origins + _table(self.left_bearings)[codes]).min()),
+                               int((origins + _table(self.right_bearings)[codes]).max()))
+        widths = self.widths
+        origins = list(itertools.accumulate(map(widths.__getitem__, text), initial=0))
+        return TextExtents(origins[-1],
+                           max(map(self.ascents.__getitem__, text)),
+                           max(map(self.descents.__getitem__, text)),
+                           min(map(int.__add__, origins, map(self.left_bearings.__getitem__, text))),
+                           max(map(int.__add__, origins,
+                                   map(self.right_bearings.__getitem__, text))))
+
+    def fit(self, text, max_width):
+        # Number of leading bytes whose advance fits in max_width
+        return _fit(self._offsets(_bytes(text)), 0, max_width)
+
+    def truncate(self, text, max_width, ellipsis=b'...'):
+        text = _bytes(text)
+        offsets = self._offsets(text)
+        if offsets[-1] <= max_width:
+            return text
+        ellipsis = _bytes(ellipsis)
+        return text[:_fit(offsets, 0, max_width - self.width(ellipsis))] + ellipsis
+
+    def wrap(self, text, max_width):
+        # Breaks at spaces where possible, inside a word when it is longer
+        # than a line; newlines always break
+        lines = []
+        for paragraph in _bytes(text).split(b'\n'):
+            offsets = self._offsets(paragraph)
+            start = 0
+            end = len(paragraph)
+            while True:
+                cut = _fit(offsets, start, max_width)
+                if cut >= end:
+                    lines.append(paragraph[start:])
+                    break
+                space = paragraph.rfind(b' ', start, cut + 1)
+                if space > start:
+                    lines.append(paragraph[start:space].rstrip(b' '))
+                    cut = space
+                else:
+                    # Always at least one byte per line
+                    cut = max(cut, start + 1)
+                    lines.append(paragraph[start:cut])
+                while cut < end and paragraph[cut] == 0x20:
+                    cut += 1
+                if cut >= end:
+                    break
+                start = cut
+        return lines
+
+    def _offsets(self, text):
+        # Pen position before every byte plus the end position
+        if np is not None:
+            offsets = np.zeros(len(text) + 1, np.int64)
+            np.cumsum(_table(self.widths)[np.frombuffer(text, np.uint8)], out=offsets[1:])
+            return offsets
+        return list(itertools.accumulate(map(self.widths.__getitem__, text), initial=0))
+
+def _fit(offsets, start, max_width):
+    # Index of the last offset within max_width of offsets[start]
+    limit = offsets[start] + max_width
+    if np is not None and isinstance(offsets, np.ndarray):
+        return int(np.searchsorted(offsets, limit, 'right')) - 1
+    return bisect.bisect_right(offsets, limit) - 1
+
+def _bytes(text):
+    return text.encode('latin-1') if isinstance(text, str) else bytes(text)
+
+def _table(values):
+    # array('h') -> int16 ndarray sharing its memory
+    return np.frombuffer(values, np.int16)
+
+def parse_query_font(reply, byte_order='>', name=None):
+    min_bounds = struct.unpack_from(byte_order + _CHARINFO, reply, 8)
+    max_bounds = struct.unpack_from(byte_order + _CHARINFO, reply, 24)
+    (min_char, max_char, default_char, properties, _, min_byte1, _, _,
+     font_ascent, font_descent, count) = struct.unpack_from(byte_order + 'HHHHBBBBhhI', reply, 40)
+    offset = 60 + properties * 8
+    # CHARINFOs as rows of six int16s (attributes read as signed, unused)
+    if count:
+        infos = array.array('h', bytes(reply[offset:offset + count * 12]))
+        if (byte_order == '>') != (sys.byteorder == 'big'):
+            infos.byteswap()
+    else:
+        infos = None
+
+    def glyph(code):
+        # CHARINFO of an 8-bit code (byte1 0, so row 0 of a matrix font),
+        # None when the font has no such glyph
+        if min_byte1 != 0 or not min_char <= code <= max_char:
+            return None
+        if infos is None:
+            return max_bounds
+        index = (code - min_char) * 6
+        info = infos[index:index + 6]
+        if len(info) < 6 or not any(info[:5]):
+            return None
+        return info
+
+    fallback = glyph(default_char & 0xFF) if default_char >> 8 == 0 else None
+    tables = [array.array('h', bytes(512)) for _ in range(5)]
+    for code in range(256):
+        info = glyph(code) or fallback
+        if info is not None:
+            for table, value in zip(tables, info):
+                table[code] = value
+
+    metrics = FontMetrics()
+    metrics.name = name
+    metrics.ascent = font_ascent
+    metrics.descent = font_descent
+    metrics.min_bounds = min_bounds
+    metrics.max_bounds = max_bounds
+    metrics.default_char = default_char
+    (metrics.left_bearings, metrics.right_bearings, metrics.widths,
+     metrics.ascents, metrics.descents) = tables
+    return metrics
+
+class FontCache:
+    _servers = {}
+
+    def __init__(self, conn, ids, cache=None, identity=None):
+        # ids allocates font IDs (an xids.IdAllocator or any callable);
+        # cache is an optional xsetup.SetupCache for metrics on disk
+        self.conn = conn
+        self.ids = ids
+        self.cache = cache
+        if identity is None:
+            identity = server_identity(conn)
+        self.identity = identity
+        self._metrics = self._servers.setdefault(identity, {})
+        self._fonts = {}
+        self.queries = 0
+
+    def open(self, name):
+        # Returns (font ID, FontMetrics); the font is opened on this
+        # connection once
+        return self.open_many([name])[name]
+
+    def open_many(self, names):
+        # Opens every font that is not open yet and queries those with no
+        # known metrics, all in a single flight
+        conn = self.conn
+        futures = []
+        for name in dict.fromkeys(names):
+            if name in self._fonts:
+                continue
+            font_id = self.ids()
+            conn.send_void(conn.proto.OpenFont(font_id, name.encode('latin-1')))
+            self._fonts[name] = font_id
+            if self._lookup(name) is None:
+                futures.append((name, conn.send_request(conn.proto.QueryFont(font_id))))
+        for name, future in futures:
+            metrics = parse_query_font(future.result(), conn.byte_order, name)
+            self.queries += 1
+            self._metrics[name] = metrics
+            if self.cache is not None:
+                self.cache.put(self._key(name), _FORMAT, metrics)
+        return {name: (self._fonts[name], self._metrics[name]) for name in names}
+
+    def metrics(self, name):
+        metrics = self._lookup(name)
+        if metrics is None:
+            metrics = self.open(name)[1]
+        return metrics
+
+    def close(self, name):
+        font_id = self._fonts.pop(name, None)
+        if font_id is not None:
+            self.conn.send_void(self.conn.proto.CloseFont(font_id))
+            free = getattr(self.ids, 'free', None)
+            if free is not None:
+                free(font_id)
+
+    def _key(self, name):
+        # Tagged so a SetupCache shared with the connection setup never
+        # mixes the two kinds of entry
+        return ('font', *self.identity, name)
+
+    def _lookup(self, name):
+        metrics = self._metrics.get(name)
+        if metrics is None and self.cache is not None:
+            metrics = self.cache.get(self._key(name), _FORMAT)
+            if metrics is not None:
+                self._metrics[name] = metrics
+        return metrics
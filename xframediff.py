@@ -0,0 +1,179 @@
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from ximage import image_format, put_image
+
+# Frame differencing for streamed frames.
+#
+# FrameDiffer remembers the last frame sent to each window. A new frame is
+# compared with it tile by tile (one vectorized comparison for the whole
+# frame), dirty tiles are merged into rectangles and only those are uploaded
+# with PutImage. When a band of the frame has simply moved up or down
+# (scrolling), it is first shifted on the server with one CopyArea and the
+# comparison is made against the shifted frame, so only the newly revealed
+# rows are sent. send() reports how many bytes that saved.
+
+class FrameStats:
+    __slots__ = ('full_bytes', 'sent_bytes', 'rects', 'copies', 'requests')
+
+    def __init__(self, full_bytes):
+        self.full_bytes = full_bytes
+        self.sent_bytes = 0
+        self.rects = 0
+        self.copies = 0
+        self.requests = 0
+
+    @property
+    def saved_bytes(self):
+        return self.full_bytes - self.sent_bytes
+
+    def __repr__(self):
+        return (f"<FrameStats sent={self.sent_bytes} saved={self.saved_bytes} "
+                f"rects={self.rects} copies={self.copies}>")
+
+def dirty_tiles(previous, current, tile):
+    # Boolean (rows, columns) array of tiles whose pixels differ
+    changed = previous != current
+    if changed.ndim == 3:
+        changed = changed.any(axis=2)
+    height, width = changed.shape
+    rows = -(-height // tile)
+    columns = -(-width // tile)
+    if rows * tile != height or columns * tile != width:
+        padded = np.zeros((rows * tile, columns * tile), dtype=bool)
+        padded[:height, :width] = changed
+        changed = padded
+    return changed.reshape(rows, tile, columns, tile).any(axis=(1, 3))
+
+def merge_tiles(dirty):
+    # Merges dirty tiles into (row, column, rows, columns) rectangles: runs
+    # along each tile row, extended downwards while the run below is identical
+    open_rects = {}
+    rects = []
+    for row in range(dirty.shape[0]):
+        line = np.concatenate(([False], dirty[row], [False]))
+        edges = np.flatnonzero(line[1:] != line[:-1])
+        runs = set(zip(edges[0::2].tolist(), edges[1::2].tolist()))
+        still_open = {}
+        for run, rect in open_rects.items():
+            if run in runs:
+                rect[2] += 1
+                still_open[run] = rect
+                runs.discard(run)
+            else:
+                rects.append(rect)
+        for start, end in runs:
+            still_open[(start, end)] = [row, start, 1, end - start]
+        open_rects = still_open
+    rects.extend(open_rects.values())
+    return [tuple(rect) for rect in rects]
+
+def find_scroll(previous, current, min_rows):
+    # Looks for a vertical shift dy such that a band of at least min_rows
+    # rows of the new frame equals the old frame moved by dy. Returns
+    # (dy, first_row, rows) or None.
+    height = current.shape[0]
+    row_bytes = current[0].nbytes
+    old_rows = np.ascontiguousarray(previous).reshape(height, -1).view(
+        np.dtype((np.void, row_bytes))).ravel()
+    new_rows = np.ascontiguousarray(current).reshape(height, -1).view(
+        np.dtype((np.void, row_bytes))).ravel()
+    positions = {}
+    for y in range(height):
+        positions.setdefault(old_rows[y].tobytes(), y)
+    shifts = np.zeros(height, dtype=np.int64)
+    found = np.zeros(height, dtype=bool)
+    for y in range(height):
+        source = positions.get(new_rows[y].tobytes())
+        if source is not None and source != y:
+            shifts[y] = y - source
+            found[y] = True
+    if found.sum() < min_rows:
+        return None
+    values, counts = np.unique(shifts[found], return_counts=True)
+    dy = int(values[np.argmax(counts)])
+
+    # Longest run of rows that match the old frame shifted by dy
+    first = max(0, dy)
+    last = min(height, height + dy)
+    matches = np.zeros(height + 2, dtype=bool)
+    matches[first + 1:last + 1] = (previous[first - dy:last - dy] ==
+                                   current[first:last]).reshape(last - first, -1).all(axis=1)
+    edges = np.flatnonzero(matches[1:] != matches[:-1])
+    if not len(edges):
+        return None
+    lengths = edges[1::2] - edges[0::2]
+    best = int(np.argmax(lengths))
+    if lengths[best] < min_rows:
+        return None
+    return dy, int(edges[2 * best]), int(lengths[best])
+
+class FrameDiffer:
+    def __init__(self, conn, gc, tile=32, fmt=None, detect_scroll=True):
+        if np is None:
+            raise RuntimeError("frame differencing requires NumPy")
+        self.conn = conn
+        self.gc = gc
+        self.tile = tile
+        self.fmt = fmt if fmt is not None else image_format(conn.setup)
+        self.detect_scroll = detect_scroll
+        self.frames = {}
+        self.total_saved = 0
+
+    def forget(self, window):
+        # Next frame for this window is sent in full (e.g. after a resize)
+        self.frames.pop(window, None)
+
+    def _image_bytes(self, width, height):
+        # Pixel data plus the 24-byte header of every PutImage band; a row
+        # too wide for one request is counted as a band of its own (put_image
+        # refuses to send it)
+        stride = self.fmt.stride(width)
+        rows_per_band = max(1, (self.conn.max_request_length * 4 - 28) // stride)
+        return stride * height + 24 * -(-height // rows_per_band)
+
+    def _upload(self, window, frame, x, y, width, height, stats):
+        # put_image copies the region if it is still the caller's memory, so
+        # the frame buffer can be reused as soon as send() returns
+        region = frame[y:y + height, x:x + width]
+        requests = put_image(self.conn, window, self.gc, region, x, y, fmt=self.fmt)
+        stats.requests += requests
+        stats.sent_bytes += self.fmt.stride(width) * height + 24 * requests
+        stats.rects += 1
+
+    def send(self, window, frame):
+        frame = np.asarray(frame)
+        height, width = frame.shape[:2]
+        stats = FrameStats(self._image_bytes(width, height))
+        previous = self.frames.get(window)
+        if previous is None or previous.shape != frame.shape:
+            self._upload(window, frame, 0, 0, width, height, stats)
+            self.frames[window] = frame.copy()
+            return stats
+
+        tile = self.tile
+        dirty = dirty_tiles(previous, frame, tile)
+        if self.detect_scroll and dirty.mean() > 0.25:
+            scroll = find_scroll(previous, frame, 2 * tile)
+            if scroll is not None:
+                dy, first, rows = scroll
+                self.conn.send_void(self.conn.proto.CopyArea(
+                    window, window, self.gc, 0, first - dy, 0, first, width, rows))
+                stats.copies += 1
+                stats.requests += 1
+                stats.sent_bytes += 28
+                # What the window shows now
+                previous = previous.copy()
+                previous[first:first + rows] = self.frames[window][first - dy:first - dy + rows]
+                dirty = dirty_tiles(previous, frame, tile)
+
+        for row, column, rows, columns in merge_tiles(dirty):
+            x = column * tile
+            y = row * tile
+            self._upload(window, frame, x, y, min(columns * tile, width - x),
+                         min(rows * tile, height - y), stats)
+        self.frames[window] = frame.copy()
+        self.total_saved += stats.saved_bytes
+        return stats
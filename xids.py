@@ -0,0 +1,71 @@
+import struct
+
+from xextensions import ExtensionRegistry
+
+# Resource ID allocation.
+#
+# The server gives every client its own ID range in the setup block:
+# resource_id_base with any combination of the resource_id_mask bits set.
+# IdAllocator hands out IDs from that range in O(1): freed IDs are reused
+# first (last freed, first reused), otherwise the next unused value is
+# taken. The server processes requests in order, so an ID may be allocated
+# again right after its Free*/Destroy* request has been queued. When the
+# range is used up, XC-MISC GetXIDRange asks the server for a block of IDs
+# it knows to be free; that fallback waits for a reply, so it needs a
+# blocking xconnection.Connection.
+
+XC_MISC = 'XC-MISC'
+GET_XID_RANGE = 1
+
+class IdAllocator:
+    def __init__(self, conn, registry=None):
+        setup = conn.setup
+        self.conn = conn
+        self.registry = registry
+        self.base = setup.resource_id_base
+        self.mask = setup.resource_id_mask
+        # Consecutive IDs differ by the lowest mask bit
+        self.step = self.mask & -self.mask
+        self._next = self.step
+        self._limit = self.mask
+        self._free = []
+        self.allocated = 0
+        self.reused = 0
+        self.ranges_fetched = 0
+
+    def owns(self, resource_id):
+        return resource_id & ~self.mask == self.base
+
+    def allocate(self):
+        if self._free:
+            self.reused += 1
+            return self._free.pop()
+        if self._next > self._limit:
+            self._fetch_range()
+        value = self._next
+        self._next += self.step
+        self.allocated += 1
+        return self.base | value
+
+    __call__ = allocate
+
+    def free(self, resource_id):
+        # Call after queueing the request that destroys the resource
+        if self.owns(resource_id):
+            self._free.append(resource_id)
+
+    def _fetch_range(self):
+        if self.registry is None:
+            self.registry = ExtensionRegistry(self.conn)
+        major_opcode = self.registry.major_opcode(XC_MISC)
+        if major_opcode is None:
+            raise RuntimeError("resource IDs exhausted and the server has no XC-MISC")
+        request = struct.pack(self.conn.byte_order + 'BBH', major_opcode, GET_XID_RANGE, 1)
+        reply = self.conn.send_request(request).result()
+        start_id, count = struct.unpack_from(self.conn.byte_order + 'II', reply, 8)
+        if not count:
+            raise RuntimeError("the X server has no free resource IDs left for this client")
+        self.ranges_fetched += 1
+        # The range is contiguous in ID space; keep allocating by step from it
+        self._next = start_id & self.mask
+        self._limit = self._next + (count - 1) * self.step
@@ -0,0 +1,148 @@
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# PutImage uploads.
+#
+# put_image() takes either a NumPy array (H x W x 3/4 uint8 RGB(A), or H x W
+# pixel values wider than 8 bits) or any buffer-protocol object that already
+# holds pixels in the server's ZPixmap layout. Arrays are converted to the server's
+# pixel format with vectorized NumPy operations, using depth, bits-per-pixel,
+# scanline pad and image byte order from the setup block and the channel
+# masks of the visual. The image is then sent as row bands that each fit in
+# one request; every band is a memoryview slice of the converted rows, so the
+# pixels are never copied again.
+#
+# Bands stay queued by reference until the connection writes them (large
+# ones go to sendmsg() as they are, see xwriter). When nothing had to be
+# converted the rows are the caller's own memory, and a frame buffer reused
+# for the next frame would change pixels that have not been sent yet, so
+# put_image() copies them once unless they are immutable bytes. Callers that
+# leave the buffer alone until the connection has been flushed can pass
+# copy=False to skip that.
+
+Z_PIXMAP = 2
+
+class ImageFormat:
+    __slots__ = ('depth', 'bits_per_pixel', 'scanline_pad', 'byte_order',
+                 'red_mask', 'green_mask', 'blue_mask')
+
+    def __repr__(self):
+        return (f"<ImageFormat depth={self.depth} bpp={self.bits_per_pixel} "
+                f"pad={self.scanline_pad} order={self.byte_order!r}>")
+
+    def stride(self, width):
+        # Bytes per scanline, padded to scanline_pad bits
+        pad = self.scanline_pad
+        return (width * self.bits_per_pixel + pad - 1) // pad * pad // 8
+
+def image_format(setup, depth=None, visual=None, screen=0):
+    screen = setup.screens[screen]
+    if depth is None:
+        depth = screen.root_depth
+    if visual is None:
+        if depth == screen.root_depth:
+            visual = setup.visuals[screen.root_visual]
+        else:
+            visual = screen.visuals_by_depth[depth][0]
+    pixmap_format = setup.formats_by_depth[depth]
+    fmt = ImageFormat()
+    fmt.depth = depth
+    fmt.bits_per_pixel = pixmap_format.bits_per_pixel
+    fmt.scanline_pad = pixmap_format.scanline_pad
+    fmt.byte_order = '>' if setup.image_byte_order == 1 else '<'
+    fmt.red_mask = visual.red_mask
+    fmt.green_mask = visual.green_mask
+    fmt.blue_mask = visual.blue_mask
+    return fmt
+
+def _channel(values, mask):
+    # Scales an 8-bit channel to the width of mask and moves it into place
+    shift = (mask & -mask).bit_length() - 1
+    bits = bin(mask).count('1')
+    if bits < 8:
+        values = values >> (8 - bits)
+    elif bits > 8:
+        values = values << (bits - 8)
+    return values << shift
+
+def to_server_rows(image, fmt):
+    # Returns a C-contiguous uint8 array of shape (height, stride)
+    if np is None:
+        raise RuntimeError("converting images requires NumPy")
+    array = np.asarray(image)
+    if array.ndim == 3 and array.shape[2] in (3, 4):
+        if not (fmt.red_mask and fmt.green_mask and fmt.blue_mask):
+            # PseudoColor, StaticGray, ...: pixels are colormap indices
+            raise ValueError("RGB arrays need a TrueColor or DirectColor visual; "
+                             "pass an H x W array of pixel values for this one")
+        channels = array.astype(np.uint32, copy=False)
+        pixels = (_channel(channels[..., 0], fmt.red_mask)
+                  | _channel(channels[..., 1], fmt.green_mask)
+                  | _channel(channels[..., 2], fmt.blue_mask))
+    elif array.ndim == 2:
+        pixels = array
+    else:
+        raise ValueError(f"expected an H x W x 3/4 RGB(A) or H x W pixel array, "
+                         f"got shape {array.shape}")
+
+    height, width = pixels.shape
+    bpp = fmt.bits_per_pixel
+    if bpp == 24:
+        # Packed 3-byte pixels: build 32-bit values and drop the unused byte
+        quads = pixels.astype(fmt.byte_order + 'u4', copy=False).view(np.uint8)
+        quads = quads.reshape(height, width, 4)
+        packed = quads[..., :3] if fmt.byte_order == '<' else quads[..., 1:]
+        rows = packed.reshape(height, width * 3)
+    elif bpp in (8, 16, 32):
+        dtype = np.dtype(fmt.byte_order + f'u{bpp // 8}')
+        rows = pixels.astype(dtype, copy=False).view(np.uint8).reshape(height, -1)
+    else:
+        raise ValueError(f"unsupported bits per pixel: {bpp}")
+
+    stride = fmt.stride(width)
+    if rows.shape[1] != stride:
+        padded = np.zeros((height, stride), dtype=np.uint8)
+        padded[:, :rows.shape[1]] = rows
+        rows = padded
+    return np.ascontiguousarray(rows)
+
+def put_image(conn, drawable, gc, image, x=0, y=0, width=None, height=None, fmt=None,
+              copy=True):
+    # Returns the number of PutImage requests queued
+    if fmt is None:
+        fmt = image_format(conn.setup)
+    if np is not None and (isinstance(image, np.ndarray) and
+                           (image.ndim == 3 or image.dtype != np.uint8)):
+        rows = to_server_rows(image, fmt)
+        height, width = image.shape[0], image.shape[1]
+        data = memoryview(rows).cast('B')
+        borrowed = np.may_share_memory(rows, image)
+    else:
+        if width is None or height is None:
+            raise ValueError("width and height are required for raw pixel buffers")
+        data = memoryview(image).cast('B')
+        borrowed = not isinstance(image, bytes)
+    stride = fmt.stride(width)
+    if data.nbytes < stride * height:
+        raise ValueError(f"image buffer holds {data.nbytes} bytes, "
+                         f"{stride * height} needed for {width}x{height}")
+    if borrowed and copy:
+        data = memoryview(data[:stride * height].tobytes())
+
+    # 24-byte header plus the extra length word of a BIG-REQUESTS request
+    max_bytes = conn.max_request_length * 4 - 28
+    rows_per_band = max_bytes // stride
+    if rows_per_band < 1:
+        raise ValueError(f"a {width}-pixel row does not fit in one request")
+
+    encode = conn.proto.parts.PutImage
+    requests = 0
+    for row in range(0, height, rows_per_band):
+        rows = min(rows_per_band, height - row)
+        band = data[row * stride:(row + rows) * stride]
+        conn.send_void(*encode(Z_PIXMAP, drawable, gc, width, rows, x, y + row, 0,
+                               fmt.depth, band))
+        requests += 1
+    return requests
@@ -0,0 +1,202 @@
+import array
+import collections
+import struct
+import sys
+
+from xextensions import server_identity
+
+# Input events.
+#
+# InputDecoder turns the raw 32-byte KeyPress/KeyRelease, ButtonPress/
+# ButtonRelease and MotionNotify events into small __slots__ records, with
+# keycodes translated to keysyms through a Keymap. The keyboard mapping is
+# fetched with one GetKeyboardMapping for the whole keycode range the first
+# time it is needed, memoized per server identity and dropped again when a
+# MappingNotify says it changed.
+#
+# Dragging on a touch screen produces MotionNotify events much faster than a
+# redraw can follow. When the decoder is given the connection's event queue
+# (xconnection.Connection.events), a motion event that is followed by more
+# motion for the same window already waiting in the queue is skipped in
+# favour of the newest one; the record says how many were merged. Only a run
+# of consecutive motion events is merged, so ordering against button and key
+# events is kept.
+
+KEY_PRESS = 2
+KEY_RELEASE = 3
+BUTTON_PRESS = 4
+BUTTON_RELEASE = 5
+MOTION_NOTIFY = 6
+MAPPING_NOTIFY = 34
+
+SHIFT_MASK = 0x0001
+LOCK_MASK = 0x0002
+CONTROL_MASK = 0x0004
+BUTTON1_MASK = 0x0100
+BUTTON_MASKS = 0x1F00
+
+NO_SYMBOL = 0
+
+class InputEvent:
+    __slots__ = ('code', 'detail', 'time', 'root', 'window', 'child', 'root_x', 'root_y',
+                 'x', 'y', 'state', 'same_screen')
+
+    @property
+    def pressed(self):
+        return self.code in (KEY_PRESS, BUTTON_PRESS)
+
+    def __repr__(self):
+        return (f"<{type(self).__name__} {self.code} detail={self.detail} "
+                f"window=0x{self.window:x} at {self.x},{self.y} state=0x{self.state:x}>")
+
+class KeyEvent(InputEvent):
+    __slots__ = ('keysym',)
+
+    @property
+    def keycode(self):
+        return self.detail
+
+    @property
+    def text(self):
+        return keysym_to_text(self.keysym)
+
+class ButtonEvent(InputEvent):
+    __slots__ = ()
+
+    @property
+    def button(self):
+        return self.detail
+
+class MotionEvent(InputEvent):
+    __slots__ = ('merged',)    # older queued motion events skipped for this one
+
+    @property
+    def is_hint(self):
+        return self.detail == 1
+
+_CLASSES = {KEY_PRESS: KeyEvent, KEY_RELEASE: KeyEvent, BUTTON_PRESS: ButtonEvent,
+            BUTTON_RELEASE: ButtonEvent, MOTION_NOTIFY: MotionEvent}
+
+class Keymap:
+    _servers = {}
+
+    def __init__(self, conn, identity=None):
+        self.conn = conn
+        if identity is None:
+            identity = server_identity(conn)
+        self.identity = identity
+        self.fetches = 0
+
+    def load(self):
+        # (first keycode, keysyms per keycode, keysyms), fetched once
+        table = self._servers.get(self.identity)
+        if table is None:
+            conn = self.conn
+            first = conn.setup.min_keycode
+            count = conn.setup.max_keycode - first + 1
+            reply = conn.send_request(conn.proto.GetKeyboardMapping(first, count)).result()
+            per_keycode = conn.proto.replies.GetKeyboardMapping(reply).keysyms_per_keycode
+            keysyms = array.array('I', bytes(reply[32:32 + count * per_keycode * 4]))
+            if (conn.byte_order == '>') != (sys.byteorder == 'big'):
+                keysyms.byteswap()
+            table = self._servers[self.identity] = (first, per_keycode, keysyms)
+            self.fetches += 1
+        return table
+
+    def keysym(self, keycode, state=0):
+        # The core protocol rules for group 1: Shift selects the second
+        # keysym, Lock (as Caps Lock) upper-cases the first, a missing second
+        # keysym of a letter is its other case
+        first, per_keycode, keysyms = self.load()
+        index = (keycode - first) * per_keycode
+        if not 0 <= index < len(keysyms):
+            return NO_SYMBOL
+        lower = keysyms[index]
+        upper = keysyms[index + 1] if per_keycode > 1 else NO_SYMBOL
+        if upper == NO_SYMBOL:
+            lower, upper = _cases(lower)
+        if state & SHIFT_MASK:
+            return _cases(upper)[1] if state & LOCK_MASK else upper
+        if state & LOCK_MASK:
+            return _cases(lower)[1]
+        return lower
+
+    def keycodes(self, keysym):
+        # Every keycode with keysym in any column, lowest first
+        first, per_keycode, keysyms = self.load()
+        return sorted({first + index // per_keycode
+                       for index, value in enumerate(keysyms) if value == keysym})
+
+    def feed(self, event):
+        # Forgets the mapping after a keyboard MappingNotify; returns True if
+        # the event was one
+        if event[0] & 0x7F != MAPPING_NOTIFY:
+            return False
+        if event[4] == 1:    # request Keyboard
+            self._servers.pop(self.identity, None)
+        return True
+
+def _cases(keysym):
+    # (lower, upper) of a Latin-1 letter keysym, (keysym, keysym) otherwise
+    if 0x41 <= keysym <= 0x5A or (0xC0 <= keysym <= 0xDE and keysym != 0xD7):
+        return keysym + 0x20, keysym
+    if 0x61 <= keysym <= 0x7A or (0xE0 <= keysym <= 0xFE and keysym != 0xF7):
+        return keysym, keysym - 0x20
+    return keysym, keysym
+
+def keysym_to_text(keysym):
+    # The character a keysym types, '' for function and modifier keys
+    if 0x20 <= keysym <= 0x7E or 0xA0 <= keysym <= 0xFF:
+        return chr(keysym)
+    if 0x01000100 <= keysym <= 0x0110FFFF:    # Unicode keysyms
+        return chr(keysym & 0x00FFFFFF)
+    return ''
+
+class InputDecoder:
+    def __init__(self, conn, keymap=None, pending=None):
+        # pending is the queue of raw events still to be handled, for motion
+        # compression; by default the blocking connection's event deque
+        self.keymap = keymap if keymap is not None else Keymap(conn)
+        if pending is None:
+            events = getattr(conn, 'events', None)
+            pending = events if isinstance(events, collections.deque) else None
+        self.pending = pending
+        self._device = struct.Struct(conn.byte_order + 'xBxxIIIIhhhhHB')
+        self.decoded = 0
+        self.merged = 0
+
+    def feed(self, event):
+        # Returns the record for an input event and None for anything else
+        # (a MappingNotify is consumed by the keymap)
+        code = event[0] & 0x7F
+        cls = _CLASSES.get(code)
+        if cls is None:
+            if code == MAPPING_NOTIFY:
+                self.keymap.feed(event)
+            return None
+        record = cls.__new__(cls)
+        if code == MOTION_NOTIFY:
+            event, record.merged = self._newest_motion(event)
+        record.code = code
+        (record.detail, record.time, record.root, record.window, record.child, record.root_x,
+         record.root_y, record.x, record.y, record.state,
+         same_screen) = self._device.unpack_from(event)
+        record.same_screen = bool(same_screen)
+        if cls is KeyEvent:
+            record.keysym = self.keymap.keysym(record.detail, record.state)
+        self.decoded += 1
+        return record
+
+    def _newest_motion(self, event):
+        pending = self.pending
+        merged = 0
+        if pending:
+            window = event[12:16]
+            while pending:
+                following = pending[0]
+                if following[0] & 0x7F != MOTION_NOTIFY or following[12:16] != window:
+                    break
+                event = pending.popleft()
+                merged += 1
+            self.merged += merged
+        return event, merged
@@ -0,0 +1,253 @@
+import asyncio
+import contextlib
+import socket
+import struct
+
+from xasync import open_connection
+from xids import IdAllocator
+from xsetup import SERVER_ORDER, server_byte_order
+
+# Mirroring one client onto many displays.
+#
+# open_mirror() connects to every display at once and returns a
+# MirrorSession, which stands in for a connection: DrawBatch, put_image()
+# and plain send_void() calls work on it unchanged. Requests are encoded
+# once, in one byte order for all displays, with the resource IDs and root
+# window of the first display; every other display gets the same bytes.
+# Where a display's resource-id-base or root differs, only the request's
+# first piece (the header, where the IDs are) is copied and patched, payloads
+# such as PutImage data are shared. IDs are recognised in the fixed fields
+# and value lists of the core requests that create, use or free windows,
+# pixmaps, GCs, fonts, colormaps and cursors; extension requests, atoms and
+# IDs inside property data are sent as they are.
+# The displays must share the pixel format of the first one; the others are
+# left out (see MirrorSession.failed).
+#
+# A display that cannot keep up must not hold back the others. Drawing is
+# grouped in frames (with session.frame(): ...); a display whose unsent
+# output is above high_water bytes when a frame starts skips that frame's
+# drawing requests (Poly*, PutImage, CopyArea, text, ClearArea). The kernel
+# send buffer of each socket is capped at send_buffer bytes, otherwise
+# megabytes could queue up there unseen before any frame is skipped. Requests
+# that create or free resources and change state always go out, so a
+# display that skipped frames is consistent again after the next full
+# redraw.
+
+# Offsets of resource IDs in a core request without BIG-REQUESTS, by opcode.
+# SendEvent's 16 is the window field most events carry at their offset 4.
+_ID_FIELDS = {1: (4, 8), 7: (4, 8), 25: (4, 16), 26: (4, 12, 16), 28: (4, 12, 16),
+              40: (4, 8), 41: (4, 8), 53: (4, 8), 55: (4, 8), 57: (4, 8), 62: (4, 8, 12),
+              63: (4, 8, 12), 72: (4, 8), 74: (4, 8), 75: (4, 8), 76: (4, 8), 77: (4, 8),
+              78: (4, 8), 80: (4, 8), 93: (4, 8, 12), 94: (4, 8, 12)}
+# Window, pixmap, GC, font, colormap and cursor as the first field
+_ID_FIELDS.update(dict.fromkeys(
+    [2, 3, 4, 5, 6, 8, 9, 10, 11, 12, 13, 14, 15, 18, 19, 20, 21, 22, 24, 29, 30, 31, 33,
+     34, 38, 39, 42, 45, 46, 47, 48, 54, 56, 58, 59, 60, 61, 73, 79, 81, 82, 83,
+     *range(84, 93), 95, 96, 97], (4,)))
+_ID_FIELDS.update(dict.fromkeys(range(64, 72), (4, 8)))    # Poly*
+
+# Value lists holding IDs: offset of the value-mask, offset of the values,
+# the mask bits whose values are IDs (background and border pixmap,
+# colormap, cursor; sibling; tile, stipple, font, clip-mask) and the size of
+# the mask in bytes
+_WINDOW_ID_BITS = 0x00006005
+_GC_ID_BITS = 0x00084C00
+_VALUE_LISTS = {1: (28, 32, _WINDOW_ID_BITS, 4), 2: (8, 12, _WINDOW_ID_BITS, 4),
+                12: (8, 12, 0x0020, 2), 55: (12, 16, _GC_ID_BITS, 4), 56: (8, 12, _GC_ID_BITS, 4)}
+
+# Requests a display may skip while it is behind
+DRAWING_OPCODES = frozenset([61, 62, 63, 72, 74, 75, 76, 77, *range(64, 72)])
+
+class MirrorDisplay:
+    __slots__ = ('host', 'display', 'conn', 'base', 'mask', 'root', 'same',
+                 'frames', 'dropped_frames', 'dropping')
+
+    def __init__(self, host, display, conn, primary):
+        setup = conn.setup
+        self.host = host
+        self.display = display
+        self.conn = conn
+        self.base = setup.resource_id_base
+        self.mask = setup.resource_id_mask
+        self.root = setup.screens[0].root
+        # Whether requests encoded for the primary display are valid here as is
+        primary_setup = primary.setup
+        self.same = (self.base == primary_setup.resource_id_base and
+                     self.root == primary_setup.screens[0].root)
+        self.frames = 0
+        self.dropped_frames = 0
+        self.dropping = False
+
+    def __repr__(self):
+        return (f"<MirrorDisplay {self.host}:{self.display} frames={self.frames} "
+                f"dropped={self.dropped_frames}>")
+
+class MirrorSession:
+    def __init__(self, displays, high_water=1 << 20):
+        # displays is a list of MirrorDisplay, the first is the primary
+        primary = displays[0].conn
+        self.displays = displays
+        self.setup = primary.setup
+        self.byte_order = primary.byte_order
+        self.proto = primary.proto
+        self.max_request_length = min(display.conn.max_request_length for display in displays)
+        self.high_water = high_water
+        # IDs are allocated in the primary display's range and translated
+        self.ids = IdAllocator(primary)
+        self.failed = {}
+        self.sequence = 0
+        self.headers_patched = 0
+        self._base = self.setup.resource_id_base
+        self._mask = self.setup.resource_id_mask
+        self._root = self.setup.screens[0].root
+        self._id = struct.Struct(self.byte_order + 'I')
+        self._card16 = struct.Struct(self.byte_order + 'H')
+        self._in_frame = False
+
+    def send_void(self, *buffers):
+        header = buffers[0]
+        droppable = self._in_frame and header[0] in DRAWING_OPCODES
+        offsets = None
+        for display in self.displays:
+            if droppable and display.dropping:
+                continue
+            if display.same:
+                display.conn.send_void(*buffers)
+                continue
+            if offsets is None:
+                offsets = self._id_offsets(header)
+            display.conn.send_void(self._patch(display, header, offsets), *buffers[1:])
+        self.sequence += 1
+        return self.sequence
+
+    def begin_frame(self):
+        for display in self.displays:
+            display.dropping = display.conn.write_buffer_size() > self.high_water
+            if display.dropping:
+                display.dropped_frames += 1
+            else:
+                display.frames += 1
+        self._in_frame = True
+
+    def end_frame(self):
+        self._in_frame = False
+
+    def flush_soon(self):
+        for display in self.displays:
+            display.conn.flush_soon()
+
+    @contextlib.contextmanager
+    def frame(self):
+        self.begin_frame()
+        try:
+            yield self
+        finally:
+            self.end_frame()
+
+    async def sync(self, timeout=None):
+        # One round trip on every display at once; returns {display: error}
+        # for those that failed it
+        results = await asyncio.gather(*(display.conn.sync(timeout) for display in self.displays),
+                                       return_exceptions=True)
+        return {display: result for display, result in zip(self.displays, results)
+                if isinstance(result, Exception)}
+
+    async def close(self):
+        await asyncio.gather(*(display.conn.close() for display in self.displays),
+                             return_exceptions=True)
+
+    def stats(self):
+        return [{"host": display.host, "display": display.display, "frames": display.frames,
+                 "dropped_frames": display.dropped_frames,
+                 "unsent_bytes": display.conn.write_buffer_size()}
+                for display in self.displays]
+
+    def _id_offsets(self, header):
+        fields = _ID_FIELDS.get(header[0])
+        if fields is None:
+            return ()
+        # A zero length field means a BIG-REQUESTS request with 4 more bytes
+        shift = 4 if header[2] == 0 and header[3] == 0 else 0
+        offsets = [offset + shift for offset in fields]
+        value_list = _VALUE_LISTS.get(header[0])
+        if value_list is not None and len(header) >= value_list[0] + shift + 4:
+            mask_offset, values_offset, id_bits, mask_size = value_list
+            mask = self._id if mask_size == 4 else self._card16
+            value_mask = mask.unpack_from(header, mask_offset + shift)[0]
+            bits = value_mask & id_bits
+            while bits:
+                bit = bits & -bits
+                index = bin(value_mask & (bit - 1)).count('1')
+                offsets.append(values_offset + shift + index * 4)
+                bits &= bits - 1
+        return offsets
+
+    def _patch(self, display, header, offsets):
+        patched = None
+        for offset in offsets:
+            if offset + 4 > len(header):
+                continue
+            value = self._id.unpack_from(header, offset)[0]
+            if value == self._root:
+                new = display.root
+            elif value & ~self._mask == self._base:
+                new = display.base | (value & self._mask)
+            else:
+                continue
+            if new != value:
+                if patched is None:
+                    patched = bytearray(header)
+                self._id.pack_into(patched, offset, new)
+        if patched is None:
+            return header
+        self.headers_patched += 1
+        return patched
+
+def _compatible(setup, primary):
+    # Same pixel layout and ID mask, so the primary's encoding works unchanged
+    screen = setup.screens[0]
+    primary_screen = primary.screens[0]
+    if setup.resource_id_mask != primary.resource_id_mask:
+        return "resource-id-mask differs"
+    if (screen.root_depth != primary_screen.root_depth or
+            setup.image_byte_order != primary.image_byte_order or
+            setup.formats_by_depth[screen.root_depth].bits_per_pixel !=
+            primary.formats_by_depth[primary_screen.root_depth].bits_per_pixel):
+        return "pixel format differs"
+    return None
+
+async def open_mirror(targets, byte_order=SERVER_ORDER, timeout=5.0, setup_cache=None,
+                      high_water=1 << 20, send_buffer=1 << 18):
+    # targets is a list of (host, display); those that cannot be reached or
+    # do not match the first reachable one end up in session.failed
+    targets = list(targets)
+    if byte_order == SERVER_ORDER:
+        # One byte order for all, or the bytes could not be shared
+        byte_order = server_byte_order(*targets[0], setup_cache)
+    results = await asyncio.gather(*(open_connection(host, display, byte_order, timeout,
+                                                     setup_cache=setup_cache)
+                                     for host, display in targets),
+                                   return_exceptions=True)
+    displays = []
+    failed = {}
+    for (host, display), result in zip(targets, results):
+        if isinstance(result, Exception):
+            failed[(host, display)] = result
+            continue
+        sock = result.writer.get_extra_info('socket')
+        if sock is not None and send_buffer:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, send_buffer)
+        if displays:
+            reason = _compatible(result.setup, displays[0].conn.setup)
+            if reason is not None:
+                failed[(host, display)] = ValueError(reason)
+                await result.close()
+                continue
+            displays.append(MirrorDisplay(host, display, result, displays[0].conn))
+        else:
+            displays.append(MirrorDisplay(host, display, result, result))
+    if not displays:
+        raise ConnectionError(f"no display could be opened: {failed}")
+    session = MirrorSession(displays, high_water)
+    session.failed = failed
+    return session
@@ -0,0 +1,692 @@
+import argparse
+import collections
+import queue
+import socket
+import struct
+import threading
+import time
+
+from xatoms import PREDEFINED_ATOMS
+from xproto import REQUEST_NAMES
+
+# Stand-in X server for tests and benchmarks.
+#
+# MockXServer listens on TCP port 6000+display and speaks enough of the core
+# protocol for the scripts in this repository: the setup handshake (with a
+# setup block shaped like XSDL's: one 24-bit TrueColor screen, LSBFirst
+# images), ListExtensions, QueryExtension, BIG-REQUESTS, XC-MISC and the
+# QueryVersion request of every listed extension, window, pixmap, font and
+# GC lifetime, QueryFont (one fixed 6x13 font whatever the name),
+# InternAtom/GetAtomName, ChangeProperty/DeleteProperty (the window is
+# checked, nothing is stored), GetInputFocus, GetKeyboardMapping, PutImage
+# and the Poly* drawing requests. Resource IDs are checked like a real server does
+# (BadIDChoice outside the client's range or already in use), unknown
+# opcodes get BadRequest. Mapping a window that selected Exposure sends an
+# Expose event; press_key() (or key_after) sends KeyPress and send_input()
+# any key, button or motion event, translated by a US keyboard mapping.
+#
+# The link to a handset can be imitated: latency delays everything the server
+# sends (so each round trip gets that much longer), bandwidth caps both
+# directions in bytes per second and split writes the server's output in
+# segments of at most that many bytes. stats counts requests per name and the
+# bytes, primitives and image data received. The tests in tests/ run
+# against it.
+#
+#   python xmockserver.py --display 1 --latency 40 --bandwidth 2000000
+
+EXTENSIONS = [('BIG-REQUESTS', 133), ('XC-MISC', 134), ('SHAPE', 129), ('MIT-SHM', 130),
+              ('XInputExtension', 131), ('RENDER', 139), ('RANDR', 140)]
+FIRST_EVENTS = {'SHAPE': 64, 'MIT-SHM': 65, 'XInputExtension': 66, 'RANDR': 89}
+FIRST_ERRORS = {'MIT-SHM': 128, 'XInputExtension': 129, 'RENDER': 142, 'RANDR': 147}
+VERSIONS = {'SHAPE': (1, 1), 'MIT-SHM': (1, 2), 'XInputExtension': (2, 3), 'RENDER': (0, 11),
+            'RANDR': (1, 5), 'XC-MISC': (1, 1)}
+MAX_REQUEST_LENGTH = 65535
+BIG_REQUEST_LENGTH = 4194303
+
+ROOT = 0x000001E6
+ROOT_VISUAL = 0x21
+COLORMAP = 0x20
+ID_MASK = 0x001FFFFF
+
+EXPOSURE_MASK = 0x00008000
+KEY_PRESS_MASK = 0x00000001
+POINTER_MOTION_MASK = 0x00000040
+BUTTON_MOTION_MASK = 0x00002000
+STRUCTURE_NOTIFY_MASK = 0x00020000
+
+KEY_PRESS = 2
+MOTION_NOTIFY = 6
+_INPUT_MASKS = {2: KEY_PRESS_MASK, 3: 0x00000002, 4: 0x00000004, 5: 0x00000008,
+                6: POINTER_MOTION_MASK}
+
+BAD_REQUEST = 1
+BAD_VALUE = 2
+BAD_WINDOW = 3
+BAD_ATOM = 5
+BAD_FONT = 7
+BAD_DRAWABLE = 9
+BAD_GC = 13
+BAD_ID_CHOICE = 14
+BAD_IMPLEMENTATION = 17
+
+def _us_keysyms():
+    # Keyboard mapping (unshifted, shifted keysym) by keycode: a US layout on
+    # evdev keycodes, everything else NoSymbol
+    keysyms = {9: (0xFF1B, 0), 22: (0xFF08, 0), 23: (0xFF09, 0), 36: (0xFF0D, 0),
+               50: (0xFFE1, 0), 62: (0xFFE2, 0), 65: (0x20, 0)}
+    shifted = dict(zip(b"1234567890-=[];'`\\,./", b'!@#$%^&*()_+{}:"~|<>?'))
+    for row, first in ((b'1234567890-=', 10), (b'qwertyuiop[]', 24), (b"asdfghjkl;'`", 38),
+                       (b'\\zxcvbnm,./', 51)):
+        for offset, char in enumerate(row):
+            upper = char - 0x20 if 0x61 <= char <= 0x7A else shifted.get(char, 0)
+            keysyms[first + offset] = (char, upper)
+    return keysyms
+
+KEYSYMS = _us_keysyms()
+
+# Core requests that have a reply; unimplemented ones get BadImplementation so
+# the client does not wait forever, every other core request is accepted
+_REPLY_OPCODES = {3, 14, 15, 16, 17, 20, 21, 23, 26, 31, 38, 39, 40, 43, 44, 47, 48, 49, 50,
+                  52, 73, 83, 84, 85, 86, 87, 91, 92, 97, 98, 99, 101, 103, 106, 108, 110,
+                  116, 117, 118, 119}
+
+# Bytes per item of the Poly* requests, for primitive counting
+_ITEM_SIZES = {64: 4, 65: 4, 66: 8, 67: 8, 68: 12, 69: 4, 70: 8, 71: 12}
+
+def build_setup(byte_order, resource_id_base, width=800, height=480,
+                vendor=b'The X.Org Foundation', release=11906000, id_mask=ID_MASK):
+    o = byte_order
+    visual = o + 'IBBHIII4x'
+    body = struct.pack(o + 'IIIIHHBBBBBBBB4x', release, resource_id_base, id_mask, 256,
+                       len(vendor), MAX_REQUEST_LENGTH, 1, 3,
+                       0,  # image byte order LSBFirst
+                       0,  # bitmap bit order LeastSignificant
+                       32, 32, 8, 255)
+    body += vendor + bytes(-len(vendor) % 4)
+    for depth, bits_per_pixel in ((1, 1), (24, 32), (32, 32)):
+        body += struct.pack(o + 'BBB5x', depth, bits_per_pixel, 32)
+    # Screen: root, colormap, white, black, input masks, size in pixels and mm
+    # (at about 160 dpi), installed maps, root visual, backing stores, save
+    # unders, root depth, number of depths
+    body += struct.pack(o + 'IIIIIHHHHHHIBBBB', ROOT, COLORMAP, 0xFFFFFF, 0x000000, 0,
+                        width, height, width * 254 // 1600, height * 254 // 1600,
+                        1, 1, ROOT_VISUAL, 0, 0, 24, 3)
+    body += struct.pack(o + 'BxH4x', 1, 0)
+    body += struct.pack(o + 'BxH4x', 24, 2)
+    body += struct.pack(visual, ROOT_VISUAL, 4, 8, 256, 0xFF0000, 0x00FF00, 0x0000FF)
+    body += struct.pack(visual, ROOT_VISUAL + 1, 5, 8, 256, 0xFF0000, 0x00FF00, 0x0000FF)
+    body += struct.pack(o + 'BxH4x', 32, 1)
+    body += struct.pack(visual, ROOT_VISUAL + 2, 4, 8, 256, 0xFF0000, 0x00FF00, 0x0000FF)
+    return struct.pack(o + 'BxHHH', 1, 11, 0, len(body) // 4) + body
+
+def font_info(byte_order):
+    # QueryFont reply after the length field for every font: a 6x13 cell
+    # like misc-fixed, glyphs for printable Latin-1, default_char 0 (which
+    # has none, so other codes draw nothing)
+    o = byte_order
+    infos = []
+    for code in range(256):
+        if 32 <= code < 127 or code >= 160:
+            descent = 2 if code in b'gjpqy,;' else 0
+            infos.append(struct.pack(o + 'hhhhhH', 0, 6, 6, 9, descent, 0))
+        else:
+            infos.append(bytes(12))
+    return (struct.pack(o + 'hhhhhH4xhhhhhH4x', 0, 6, 6, 9, 0, 0, 0, 6, 6, 9, 2, 0)
+            + struct.pack(o + 'HHHHBBBBhhI', 0, 255, 0, 0, 0, 0, 0, 0, 11, 2, len(infos))
+            + b''.join(infos))
+
+class _Link:
+    # Output side of one client connection, with the configured impairments
+
+    def __init__(self, sock, latency, bandwidth, split):
+        self.sock = sock
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.split = split
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+        self._queue = None
+        if latency or bandwidth or split:
+            self._queue = queue.Queue()
+            threading.Thread(target=self._writer, daemon=True).start()
+
+    def send(self, data):
+        if self._queue is not None:
+            self._queue.put((time.monotonic() + self.latency, data))
+            return
+        with self._lock:
+            try:
+                self.sock.sendall(data)
+            except OSError:
+                return
+            self.bytes_sent += len(data)
+
+    def close(self):
+        if self._queue is not None:
+            self._queue.put(None)
+
+    def _writer(self):
+        segment = self.split or 4096
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            due, data = item
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            try:
+                for start in range(0, len(data), segment):
+                    chunk = data[start:start + segment]
+                    self.sock.sendall(chunk)
+                    self.bytes_sent += len(chunk)
+                    if self.bandwidth:
+                        time.sleep(len(chunk) / self.bandwidth)
+            except OSError:
+                return
+
+class _Client:
+    def __init__(self, server, sock, index):
+        self.server = server
+        self.sock = sock
+        self.resource_id_base = (index + 1) << 21
+        self.byte_order = '>'
+        self.sequence = 0
+        self.big_requests = False
+        self.link = _Link(sock, server.latency, server.bandwidth, server.split)
+
+    # Message encoding
+
+    def send_reply(self, data_byte, body=b'', extra=b''):
+        # body fills the 24 bytes after the length field, extra follows them
+        # and is padded to 4 bytes
+        extra += bytes(-len(extra) % 4)
+        header = struct.pack(self.byte_order + 'BBHI', 1, data_byte, self.sequence & 0xFFFF,
+                             len(extra) // 4)
+        self.link.send(header + body.ljust(24, b'\0') + extra)
+
+    def send_error(self, code, bad_value=0, major=0, minor=0):
+        self.link.send(struct.pack(self.byte_order + 'BBHIHB21x', 0, code, self.sequence & 0xFFFF,
+                                   bad_value, minor, major))
+
+    def send_event(self, event):
+        # event is 32 bytes with the sequence field left as zero
+        self.link.send(event[:2] + struct.pack(self.byte_order + 'H', self.sequence & 0xFFFF)
+                       + event[4:32])
+
+    # Connection
+
+    def run(self):
+        try:
+            self._serve()
+        except (OSError, struct.error):
+            pass
+        finally:
+            self.link.close()
+            self.server._forget(self)
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+
+    def _recv(self, size):
+        if self.server.bandwidth:
+            size = min(size, 4096)
+        data = self.sock.recv(size)
+        if not data:
+            raise ConnectionResetError
+        self.server.stats['bytes_in'] += len(data)
+        if self.server.bandwidth:
+            time.sleep(len(data) / self.server.bandwidth)
+        return data
+
+    def _serve(self):
+        buffer = bytearray()
+        while len(buffer) < 12:
+            buffer += self._recv(12 - len(buffer))
+        self.byte_order = '>' if buffer[0] == 0x42 else '<'
+        name_len, data_len = struct.unpack_from(self.byte_order + 'HH', buffer, 6)
+        needed = 12 + name_len + (-name_len % 4) + data_len + (-data_len % 4)
+        while len(buffer) < needed:
+            buffer += self._recv(needed - len(buffer))
+        del buffer[:needed]
+        server = self.server
+        self.link.send(build_setup(self.byte_order, self.resource_id_base, server.width,
+                                   server.height, id_mask=server.id_mask))
+        server._connected(self)
+
+        length_field = struct.Struct(self.byte_order + 'H')
+        big_length = struct.Struct(self.byte_order + 'I')
+        while True:
+            if len(buffer) < 4:
+                buffer += self._recv(65536)
+                continue
+            length = length_field.unpack_from(buffer, 2)[0]
+            offset = 4
+            if length == 0 and self.big_requests:
+                if len(buffer) < 8:
+                    buffer += self._recv(65536)
+                    continue
+                length = big_length.unpack_from(buffer, 4)[0]
+                offset = 8
+            size = length * 4
+            if size < offset:
+                # Not even a header: a real server closes the connection here
+                return
+            while len(buffer) < size:
+                buffer += self._recv(max(65536, size - len(buffer)))
+            request = bytes(buffer[:size])
+            del buffer[:size]
+            self.sequence += 1
+            self._dispatch(request, offset)
+
+    # Requests
+
+    def _dispatch(self, request, offset):
+        opcode = request[0]
+        stats = self.server.stats
+        name = REQUEST_NAMES.get(opcode)
+        if name is None:
+            name = self.server.extension_names.get(opcode, f'opcode {opcode}')
+        stats['requests'][name] += 1
+        handler = getattr(self, f'_request_{opcode}', None)
+        if handler is None:
+            if opcode in self.server.extension_names:
+                self._extension_request(request)
+            elif opcode == 0 or opcode > 127:
+                self.send_error(BAD_REQUEST, major=opcode)
+            elif opcode in _REPLY_OPCODES:
+                self.send_error(BAD_IMPLEMENTATION, major=opcode)
+            return
+        # Parameters after the header (and the BIG-REQUESTS length)
+        handler(request, memoryview(request)[offset:])
+
+    def _new_id(self, resource_id, kind, value=None, opcode=0):
+        server = self.server
+        if (resource_id & ~server.id_mask != self.resource_id_base
+                or resource_id in server.resources):
+            self.send_error(BAD_ID_CHOICE, resource_id, opcode)
+            return False
+        server.resources[resource_id] = (kind, value)
+        return True
+
+    def _lookup(self, resource_id, kinds, code, opcode):
+        if resource_id == ROOT and 'window' in kinds:
+            return ('window', self.server.root)
+        resource = self.server.resources.get(resource_id)
+        if resource is None or resource[0] not in kinds:
+            self.send_error(code, resource_id, opcode)
+            return None
+        return resource
+
+    def _free(self, resource_id, kinds, code, opcode):
+        if self._lookup(resource_id, kinds, code, opcode) is not None:
+            del self.server.resources[resource_id]
+
+    def _request_1(self, request, params):  # CreateWindow
+        wid, parent, x, y, width, height, _, _, _, value_mask = \
+            struct.unpack_from(self.byte_order + 'IIhhHHHHII', params)
+        if self._lookup(parent, ('window',), BAD_WINDOW, 1) is None:
+            return
+        event_mask = 0
+        if value_mask & 0x800:
+            index = bin(value_mask & 0x7FF).count('1')
+            event_mask = struct.unpack_from(self.byte_order + 'I', params, 28 + index * 4)[0]
+        self._new_id(wid, 'window', _Window(self, wid, x, y, width, height, event_mask), 1)
+
+    def _request_2(self, request, params):  # ChangeWindowAttributes
+        window, value_mask = struct.unpack_from(self.byte_order + 'II', params)
+        resource = self._lookup(window, ('window',), BAD_WINDOW, 2)
+        if resource is not None and value_mask & 0x800:
+            index = bin(value_mask & 0x7FF).count('1')
+            resource[1].event_mask = struct.unpack_from(self.byte_order + 'I', params,
+                                                        8 + index * 4)[0]
+            resource[1].client = self
+
+    def _request_4(self, request, params):  # DestroyWindow
+        self._free(struct.unpack_from(self.byte_order + 'I', params)[0], ('window',),
+                   BAD_WINDOW, 4)
+
+    def _request_8(self, request, params):  # MapWindow
+        resource = self._lookup(struct.unpack_from(self.byte_order + 'I', params)[0],
+                                ('window',), BAD_WINDOW, 8)
+        if resource is None:
+            return
+        window = resource[1]
+        if window.mapped:
+            return
+        window.mapped = True
+        if window.event_mask & EXPOSURE_MASK:
+            self.send_event(struct.pack(self.byte_order + 'B3xIHHHHH14x', 12, window.wid, 0, 0,
+                                        window.width, window.height, 0))
+        self.server._mapped(window)
+
+    def _request_12(self, request, params):  # ConfigureWindow
+        wid, value_mask = struct.unpack_from(self.byte_order + 'IH', params)
+        resource = self._lookup(wid, ('window',), BAD_WINDOW, 12)
+        if resource is None:
+            return
+        window = resource[1]
+        values = struct.unpack_from(self.byte_order + f'{bin(value_mask).count("1")}i', params, 8)
+        fields = ['x', 'y', 'width', 'height']
+        index = 0
+        for bit, field in enumerate(fields):
+            if value_mask & (1 << bit):
+                setattr(window, field, values[index])
+                index += 1
+        if window.event_mask & STRUCTURE_NOTIFY_MASK:
+            self.send_event(struct.pack(self.byte_order + 'B3xIIIhhHHHB5x', 22, wid, wid, 0,
+                                        window.x, window.y, window.width, window.height, 0, 0))
+            if window.mapped and window.event_mask & EXPOSURE_MASK and value_mask & 0xC:
+                self.send_event(struct.pack(self.byte_order + 'B3xIHHHHH14x', 12, wid, 0, 0,
+                                            window.width, window.height, 0))
+
+    def _request_14(self, request, params):  # GetGeometry
+        drawable = struct.unpack_from(self.byte_order + 'I', params)[0]
+        resource = self._lookup(drawable, ('window', 'pixmap'), BAD_DRAWABLE, 14)
+        if resource is None:
+            return
+        value = resource[1]
+        self.send_reply(value.depth, struct.pack(self.byte_order + 'IhhHHH', ROOT, value.x,
+                                                 value.y, value.width, value.height, 0))
+
+    def _request_16(self, request, params):  # InternAtom
+        only_if_exists = request[1]
+        name_len = struct.unpack_from(self.byte_order + 'H', params)[0]
+        name = bytes(params[4:4 + name_len])
+        atoms = self.server.atoms
+        atom = atoms.get(name)
+        if atom is None and not only_if_exists:
+            atom = atoms[name] = len(self.server.atom_names) + 1
+            self.server.atom_names.append(name)
+        self.send_reply(0, struct.pack(self.byte_order + 'I', atom or 0))
+
+    def _request_17(self, request, params):  # GetAtomName
+        atom = struct.unpack_from(self.byte_order + 'I', params)[0]
+        names = self.server.atom_names
+        if not 1 <= atom <= len(names):
+            self.send_error(BAD_ATOM, atom, 17)
+            return
+        name = names[atom - 1]
+        self.send_reply(0, struct.pack(self.byte_order + 'H', len(name)), name)
+
+    def _request_18(self, request, params):  # ChangeProperty
+        window = struct.unpack_from(self.byte_order + 'I', params)[0]
+        self._lookup(window, ('window',), BAD_WINDOW, 18)
+
+    def _request_19(self, request, params):  # DeleteProperty
+        window = struct.unpack_from(self.byte_order + 'I', params)[0]
+        self._lookup(window, ('window',), BAD_WINDOW, 19)
+
+    def _request_43(self, request, params):  # GetInputFocus
+        self.send_reply(1, struct.pack(self.byte_order + 'I', self.server.focus))
+
+    def _request_45(self, request, params):  # OpenFont
+        fid, name_len = struct.unpack_from(self.byte_order + 'IH', params)
+        self._new_id(fid, 'font', bytes(params[8:8 + name_len]), 45)
+
+    def _request_46(self, request, params):  # CloseFont
+        self._free(struct.unpack_from(self.byte_order + 'I', params)[0], ('font',),
+                   BAD_FONT, 46)
+
+    def _request_47(self, request, params):  # QueryFont
+        fontable = struct.unpack_from(self.byte_order + 'I', params)[0]
+        if self._lookup(fontable, ('font', 'gc'), BAD_FONT, 47) is not None:
+            reply = font_info(self.byte_order)
+            self.send_reply(0, reply[:24], reply[24:])
+
+    def _request_53(self, request, params):  # CreatePixmap
+        pid, drawable, width, height = struct.unpack_from(self.byte_order + 'IIHH', params)
+        if self._lookup(drawable, ('window', 'pixmap'), BAD_DRAWABLE, 53) is not None:
+            self._new_id(pid, 'pixmap', _Drawable(request[1], width, height), 53)
+
+    def _request_54(self, request, params):  # FreePixmap
+        self._free(struct.unpack_from(self.byte_order + 'I', params)[0], ('pixmap',),
+                   BAD_DRAWABLE, 54)
+
+    def _request_55(self, request, params):  # CreateGC
+        cid, drawable = struct.unpack_from(self.byte_order + 'II', params)
+        if self._lookup(drawable, ('window', 'pixmap'), BAD_DRAWABLE, 55) is not None:
+            self._new_id(cid, 'gc', None, 55)
+
+    def _request_60(self, request, params):  # FreeGC
+        self._free(struct.unpack_from(self.byte_order + 'I', params)[0], ('gc',), BAD_GC, 60)
+
+    def _request_62(self, request, params):  # CopyArea
+        self.server.stats['copies'] += 1
+
+    def _request_72(self, request, params):  # PutImage
+        self.server.stats['image_bytes'] += len(params) - 20
+
+    def _poly(self, request, params):
+        header = 12 if request[0] == 69 else 8
+        self.server.stats['primitives'] += (len(params) - header) // _ITEM_SIZES[request[0]]
+
+    _request_64 = _request_65 = _request_66 = _request_67 = _poly
+    _request_68 = _request_69 = _request_70 = _request_71 = _poly
+
+    def _request_101(self, request, params):  # GetKeyboardMapping
+        first, count = struct.unpack_from('BB', params)
+        if first < 8 or first + count > 256:
+            self.send_error(BAD_VALUE, first, 101)
+            return
+        keysyms = []
+        for keycode in range(first, first + count):
+            keysyms.extend(KEYSYMS.get(keycode, (0, 0)))
+        self.send_reply(2, b'', struct.pack(self.byte_order + f'{len(keysyms)}I', *keysyms))
+
+    def _request_98(self, request, params):  # QueryExtension
+        name_len = struct.unpack_from(self.byte_order + 'H', params)[0]
+        name = str(params[4:4 + name_len], 'ascii', errors='ignore')
+        opcode = self.server.extension_opcodes.get(name)
+        if opcode is None:
+            self.send_reply(0, bytes(4))
+            return
+        self.send_reply(0, struct.pack(self.byte_order + 'BBBB', 1, opcode,
+                                       FIRST_EVENTS.get(name, 0), FIRST_ERRORS.get(name, 0)))
+
+    def _request_99(self, request, params):  # ListExtensions
+        names = [name.encode('ascii') for name, _ in EXTENSIONS]
+        self.send_reply(len(names), b'', b''.join(bytes((len(name),)) + name for name in names))
+
+    def _extension_request(self, request):
+        name = self.server.extension_names[request[0]]
+        minor = request[1]
+        o = self.byte_order
+        if name == 'BIG-REQUESTS' and minor == 0:  # BigReqEnable
+            self.big_requests = True
+            self.send_reply(0, struct.pack(o + 'I', BIG_REQUEST_LENGTH))
+        elif name == 'XC-MISC' and minor == 1:  # GetXIDRange
+            # The lowest run of unused IDs, like the X server's search
+            mask = self.server.id_mask
+            used = sorted(resource_id & mask for resource_id in self.server.resources
+                          if resource_id & ~mask == self.resource_id_base)
+            start = 1
+            end = mask + 1
+            for value in used:
+                if value > start:
+                    end = value
+                    break
+                start = max(start, value + 1)
+            if start > mask:
+                self.send_reply(0, struct.pack(o + 'II', 0, 0))
+            else:
+                self.send_reply(0, struct.pack(o + 'II', self.resource_id_base | start,
+                                               end - start))
+        elif minor == 0:  # QueryVersion / GetVersion
+            major_version, minor_version = VERSIONS.get(name, (1, 0))
+            if name in ('XInputExtension', 'RENDER', 'RANDR'):
+                self.send_reply(0, struct.pack(o + 'II', major_version, minor_version))
+            else:
+                self.send_reply(0, struct.pack(o + 'HH', major_version, minor_version))
+        else:
+            self.send_error(BAD_REQUEST, major=request[0], minor=minor)
+
+class _Drawable:
+    __slots__ = ('depth', 'x', 'y', 'width', 'height')
+
+    def __init__(self, depth, width, height, x=0, y=0):
+        self.depth = depth
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+
+class _Window(_Drawable):
+    __slots__ = ('client', 'wid', 'event_mask', 'mapped')
+
+    def __init__(self, client, wid, x, y, width, height, event_mask):
+        super().__init__(24, width, height, x, y)
+        self.client = client
+        self.wid = wid
+        self.event_mask = event_mask
+        self.mapped = False
+
+class MockXServer:
+    def __init__(self, display=0, host='127.0.0.1', latency=0.0, bandwidth=None, split=None,
+                 width=800, height=480, key_after=None, id_mask=ID_MASK):
+        # latency in seconds, bandwidth in bytes per second, split in bytes;
+        # key_after sends a KeyPress that many seconds after each window with
+        # KeyPress selected is mapped; id_mask (low bits only) is the
+        # resource_id_mask every client gets
+        self.display = display
+        self.host = host
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.split = split
+        self.width = width
+        self.height = height
+        self.key_after = key_after
+        self.id_mask = id_mask
+        self.root = _Drawable(24, width, height)
+        self.focus = ROOT
+        self.resources = {}
+        self.atom_names = [name.encode('ascii') for name in PREDEFINED_ATOMS]
+        self.atoms = {name: atom for atom, name in enumerate(self.atom_names, 1)}
+        self.extension_opcodes = dict(EXTENSIONS)
+        self.extension_names = {opcode: name for name, opcode in EXTENSIONS}
+        self.stats = {'connections': 0, 'bytes_in': 0, 'image_bytes': 0, 'primitives': 0,
+                      'copies': 0, 'requests': collections.Counter()}
+        self.clients = []
+        self._listener = None
+        self._next_index = 0
+
+    @property
+    def port(self):
+        return 6000 + self.display
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if self.bandwidth:
+            # A slow link has little in flight; without this the kernel would
+            # buffer megabytes ahead of the bandwidth cap
+            listener.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 65536)
+        listener.bind((self.host, self.port))
+        listener.listen(64)
+        self._listener = listener
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._listener is not None:
+            # shutdown() wakes the accept thread, so the port is free on return
+            try:
+                self._listener.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self._listener.close()
+            self._listener = None
+        for client in list(self.clients):
+            try:
+                client.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def serve_forever(self):
+        self.start()
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def press_key(self, keycode=38, window=None, state=0):
+        # KeyPress to the given window, or to every mapped window selecting it
+        self.send_input(KEY_PRESS, keycode, state=state, window=window)
+
+    def send_input(self, code, detail, x=10, y=10, state=0, window=None):
+        # Key, button or motion event (code 2 to 6) at x, y in the window
+        if code == MOTION_NOTIFY and state & 0x1F00:
+            mask = POINTER_MOTION_MASK | BUTTON_MOTION_MASK
+        else:
+            mask = _INPUT_MASKS[code]
+        for resource_id, (kind, value) in list(self.resources.items()):
+            if kind != 'window' or (window is not None and resource_id != window):
+                continue
+            if value.mapped and value.event_mask & mask:
+                client = value.client
+                client.send_event(struct.pack(client.byte_order + 'BB2xIIIIhhhhHBx', code, detail,
+                                              int(time.monotonic() * 1000) & 0xFFFFFFFF, ROOT,
+                                              resource_id, 0, value.x + x, value.y + y, x, y,
+                                              state, 1))
+
+    def _accept_loop(self):
+        listener = self._listener
+        while True:
+            try:
+                sock, _ = listener.accept()
+            except OSError:
+                return
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            client = _Client(self, sock, self._next_index)
+            self._next_index = (self._next_index + 1) % 511
+            self.clients.append(client)
+            threading.Thread(target=client.run, daemon=True).start()
+
+    def _connected(self, client):
+        self.stats['connections'] += 1
+
+    def _forget(self, client):
+        if client in self.clients:
+            self.clients.remove(client)
+        base = client.resource_id_base
+        for resource_id in [resource_id for resource_id in self.resources
+                            if resource_id & ~ID_MASK == base]:
+            del self.resources[resource_id]
+
+    def _mapped(self, window):
+        if self.key_after is not None and window.event_mask & KEY_PRESS_MASK:
+            timer = threading.Timer(self.key_after, self.press_key, kwargs={'window': window.wid})
+            timer.daemon = True
+            timer.start()
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a stand-in X server on TCP 6000+N")
+    parser.add_argument("--display", type=int, default=1)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--latency", type=float, default=0.0, help="added delay in ms")
+    parser.add_argument("--bandwidth", type=float, help="bytes per second in each direction")
+    parser.add_argument("--split", type=int, help="largest segment the server writes, in bytes")
+    parser.add_argument("--size", default="800x480", help="screen size in pixels")
+    parser.add_argument("--key-after", type=float,
+                        help="press a key this many seconds after a window is mapped")
+    args = parser.parse_args()
+
+    width, height = (int(value) for value in args.size.split('x'))
+    server = MockXServer(args.display, args.host, args.latency / 1000, args.bandwidth,
+                         args.split, width, height, args.key_after)
+    print(f"Listening on {args.host}:{server.port}")
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
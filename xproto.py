@@ -0,0 +1,368 @@
+import collections
+import struct
+
+# Declarative table of the core X11 requests this project uses.
+#
+# Every request is described once: opcode, what goes in the header's data
+# byte, the fixed fields and the kind of variable-length tail. Protocol(order)
+# turns the table into encoder functions with precompiled struct.Struct
+# objects for that byte order, so building a request never parses a format
+# string and the length field (and any string-length field) is always
+# computed the same way.
+
+TYPES = {
+    'BOOL': 'B', 'CARD8': 'B', 'KEYCODE': 'B', 'INT8': 'b',
+    'CARD16': 'H', 'INT16': 'h',
+    'CARD32': 'I', 'INT32': 'i', 'BITMASK': 'I', 'TIMESTAMP': 'I',
+    'WINDOW': 'I', 'PIXMAP': 'I', 'DRAWABLE': 'I', 'GCONTEXT': 'I', 'FONT': 'I',
+    'FONTABLE': 'I', 'ATOM': 'I', 'VISUALID': 'I', 'COLORMAP': 'I', 'CURSOR': 'I',
+    'PAD1': 'x', 'PAD2': '2x', 'PAD3': '3x',
+    # Filled in from the length of the string tail
+    'STRLEN8': 'B', 'STRLEN16': 'H',
+}
+
+# Tail kinds
+VALUES = 'values'       # LISTofCARD32, e.g. the value-list of CreateWindow/CreateGC
+STRING = 'string'       # STRING8 whose length goes in the STRLEN field
+BYTES = 'bytes'         # caller-encoded bytes, padded to 4 (PutImage data, TEXTITEMs)
+POINTS = 'hh'           # LISTofPOINT
+SEGMENTS = 'hhhh'       # LISTofSEGMENT
+RECTANGLES = 'hhHH'     # LISTofRECTANGLE
+ARCS = 'hhHHhh'         # LISTofARC
+
+Request = collections.namedtuple('Request', 'name opcode data fields tail')
+Reply = collections.namedtuple('Reply', 'name data fields')
+
+REQUESTS = [
+    Request('CreateWindow', 1, ('depth', 'CARD8'),
+            [('wid', 'WINDOW'), ('parent', 'WINDOW'), ('x', 'INT16'), ('y', 'INT16'),
+             ('width', 'CARD16'), ('height', 'CARD16'), ('border_width', 'CARD16'),
+             ('window_class', 'CARD16'), ('visual', 'VISUALID'), ('value_mask', 'BITMASK')],
+            VALUES),
+    Request('ChangeWindowAttributes', 2, None,
+            [('window', 'WINDOW'), ('value_mask', 'BITMASK')], VALUES),
+    Request('DestroyWindow', 4, None, [('window', 'WINDOW')], None),
+    Request('MapWindow', 8, None, [('window', 'WINDOW')], None),
+    Request('UnmapWindow', 10, None, [('window', 'WINDOW')], None),
+    Request('ConfigureWindow', 12, None,
+            [('window', 'WINDOW'), ('value_mask', 'CARD16'), ('', 'PAD2')], VALUES),
+    Request('GetGeometry', 14, None, [('drawable', 'DRAWABLE')], None),
+    Request('InternAtom', 16, ('only_if_exists', 'BOOL'),
+            [('name_len', 'STRLEN16'), ('', 'PAD2')], STRING),
+    Request('GetAtomName', 17, None, [('atom', 'ATOM')], None),
+    Request('ChangeProperty', 18, ('mode', 'CARD8'),
+            [('window', 'WINDOW'), ('property', 'ATOM'), ('type', 'ATOM'),
+             ('format', 'CARD8'), ('', 'PAD3'), ('data_len', 'CARD32')], BYTES),
+    Request('GetProperty', 20, ('delete', 'BOOL'),
+            [('window', 'WINDOW'), ('property', 'ATOM'), ('type', 'ATOM'),
+             ('long_offset', 'CARD32'), ('long_length', 'CARD32')], None),
+    Request('GetInputFocus', 43, None, [], None),
+    Request('OpenFont', 45, None,
+            [('fid', 'FONT'), ('name_len', 'STRLEN16'), ('', 'PAD2')], STRING),
+    Request('CloseFont', 46, None, [('font', 'FONT')], None),
+    Request('QueryFont', 47, None, [('font', 'FONTABLE')], None),
+    Request('CreatePixmap', 53, ('depth', 'CARD8'),
+            [('pid', 'PIXMAP'), ('drawable', 'DRAWABLE'),
+             ('width', 'CARD16'), ('height', 'CARD16')], None),
+    Request('FreePixmap', 54, None, [('pixmap', 'PIXMAP')], None),
+    Request('CreateGC', 55, None,
+            [('cid', 'GCONTEXT'), ('drawable', 'DRAWABLE'), ('value_mask', 'BITMASK')],
+            VALUES),
+    Request('ChangeGC', 56, None, [('gc', 'GCONTEXT'), ('value_mask', 'BITMASK')], VALUES),
+    Request('SetClipRectangles', 59, ('ordering', 'CARD8'),
+            [('gc', 'GCONTEXT'), ('clip_x', 'INT16'), ('clip_y', 'INT16')], RECTANGLES),
+    Request('FreeGC', 60, None, [('gc', 'GCONTEXT')], None),
+    Request('ClearArea', 61, ('exposures', 'BOOL'),
+            [('window', 'WINDOW'), ('x', 'INT16'), ('y', 'INT16'),
+             ('width', 'CARD16'), ('height', 'CARD16')], None),
+    Request('CopyArea', 62, None,
+            [('src', 'DRAWABLE'), ('dst', 'DRAWABLE'), ('gc', 'GCONTEXT'),
+             ('src_x', 'INT16'), ('src_y', 'INT16'), ('dst_x', 'INT16'), ('dst_y', 'INT16'),
+             ('width', 'CARD16'), ('height', 'CARD16')], None),
+    Request('PolyPoint', 64, ('coordinate_mode', 'CARD8'),
+            [('drawable', 'DRAWABLE'), ('gc', 'GCONTEXT')], POINTS),
+    Request('PolyLine', 65, ('coordinate_mode', 'CARD8'),
+            [('drawable', 'DRAWABLE'), ('gc', 'GCONTEXT')], POINTS),
+    Request('PolySegment', 66, None,
+            [('drawable', 'DRAWABLE'), ('gc', 'GCONTEXT')], SEGMENTS),
+    Request('PolyRectangle', 67, None,
+            [('drawable', 'DRAWABLE'), ('gc', 'GCONTEXT')], RECTANGLES),
+    Request('PolyArc', 68, None,
+            [('drawable', 'DRAWABLE'), ('gc', 'GCONTEXT')], ARCS),
+    Request('FillPoly', 69, None,
+            [('drawable', 'DRAWABLE'), ('gc', 'GCONTEXT'), ('shape', 'CARD8'),
+             ('coordinate_mode', 'CARD8'), ('', 'PAD2')], POINTS),
+    Request('PolyFillRectangle', 70, None,
+            [('drawable', 'DRAWABLE'), ('gc', 'GCONTEXT')], RECTANGLES),
+    Request('PolyFillArc', 71, None,
+            [('drawable', 'DRAWABLE'), ('gc', 'GCONTEXT')], ARCS),
+    Request('PutImage', 72, ('format', 'CARD8'),
+            [('drawable', 'DRAWABLE'), ('gc', 'GCONTEXT'),
+             ('width', 'CARD16'), ('height', 'CARD16'), ('dst_x', 'INT16'), ('dst_y', 'INT16'),
+             ('left_pad', 'CARD8'), ('depth', 'CARD8'), ('', 'PAD2')], BYTES),
+    Request('GetImage', 73, ('format', 'CARD8'),
+            [('drawable', 'DRAWABLE'), ('x', 'INT16'), ('y', 'INT16'),
+             ('width', 'CARD16'), ('height', 'CARD16'), ('plane_mask', 'CARD32')], None),
+    Request('PolyText8', 74, None,
+            [('drawable', 'DRAWABLE'), ('gc', 'GCONTEXT'), ('x', 'INT16'), ('y', 'INT16')],
+            BYTES),
+    Request('ImageText8', 76, ('string_len', 'STRLEN8'),
+            [('drawable', 'DRAWABLE'), ('gc', 'GCONTEXT'), ('x', 'INT16'), ('y', 'INT16')],
+            STRING),
+    Request('QueryExtension', 98, None, [('name_len', 'STRLEN16'), ('', 'PAD2')], STRING),
+    Request('ListExtensions', 99, None, [], None),
+    Request('GetKeyboardMapping', 101, None,
+            [('first_keycode', 'KEYCODE'), ('count', 'CARD8'), ('', 'PAD2')], None),
+    Request('NoOperation', 127, None, [], None),
+]
+
+# Reply fields start at byte 8, after the sequence number and length words
+REPLIES = [
+    Reply('GetGeometry', ('depth', 'CARD8'),
+          [('root', 'WINDOW'), ('x', 'INT16'), ('y', 'INT16'), ('width', 'CARD16'),
+           ('height', 'CARD16'), ('border_width', 'CARD16')]),
+    Reply('InternAtom', None, [('atom', 'ATOM')]),
+    Reply('GetAtomName', None, [('name_len', 'CARD16')]),
+    Reply('GetProperty', ('format', 'CARD8'),
+          [('type', 'ATOM'), ('bytes_after', 'CARD32'), ('value_len', 'CARD32')]),
+    Reply('GetInputFocus', ('revert_to', 'CARD8'), [('focus', 'WINDOW')]),
+    Reply('GetImage', ('depth', 'CARD8'), [('visual', 'VISUALID')]),
+    Reply('QueryExtension', None,
+          [('present', 'BOOL'), ('major_opcode', 'CARD8'),
+           ('first_event', 'CARD8'), ('first_error', 'CARD8')]),
+    Reply('ListExtensions', ('names_len', 'CARD8'), []),
+    Reply('GetKeyboardMapping', ('keysyms_per_keycode', 'CARD8'), []),
+]
+
+REQUEST_NAMES = {request.opcode: request.name for request in REQUESTS}
+
+_PADDING = (b'', b'\0', b'\0\0', b'\0\0\0')
+
+def _make_encoder(order, request):
+    opcode = request.opcode
+    formats = ''.join(TYPES[kind] for _, kind in request.fields)
+    data_kind = request.data[1] if request.data else None
+    # Whether the caller passes the data byte as the first argument
+    has_data = data_kind is not None and data_kind != 'STRLEN8'
+    head = struct.Struct(order + 'BBH' + formats)
+    base = head.size // 4
+    pack = head.pack
+    tail = request.tail
+
+    # Encoders take the data byte (if any), the fixed fields in table order and
+    # finally the tail; length and string-length fields are never passed in
+    if tail is None:
+        if has_data:
+            def encode(data, *fields):
+                return pack(opcode, data, base, *fields)
+        else:
+            def encode(*fields):
+                return pack(opcode, 0, base, *fields)
+        return encode
+
+    if tail == STRING:
+        # Header and string in one Struct per padded string size, so the
+        # string is never concatenated (struct pads 's' with zero bytes)
+        strings = _StringPacker(order + 'BBH' + formats)
+        if data_kind == 'STRLEN8':
+            def encode(*args):
+                size = len(args[-1])
+                return strings.pack(size)(opcode, size, base + (size + 3) // 4, *args)
+            return encode
+
+        kinds = [kind for _, kind in request.fields if not kind.startswith('PAD')]
+        index = kinds.index('STRLEN16') + has_data
+        if index == 0:
+            def encode(*args):
+                size = len(args[-1])
+                return strings.pack(size)(opcode, 0, base + (size + 3) // 4, size, *args)
+        elif has_data:
+            def encode(*args):
+                size = len(args[-1])
+                return strings.pack(size)(opcode, args[0], base + (size + 3) // 4,
+                                          *args[1:index], size, *args[index:])
+        else:
+            def encode(*args):
+                size = len(args[-1])
+                return strings.pack(size)(opcode, 0, base + (size + 3) // 4,
+                                          *args[:index], size, *args[index:])
+        return encode
+
+    # Requests longer than 65535 words use the BIG-REQUESTS form: a zero
+    # length field followed by a CARD32 length that counts itself. Only send
+    # those after BigReqEnable.
+    pack_length = struct.Struct(order + 'I').pack
+
+    def big(header, length):
+        return header[:4] + pack_length(length + 1) + header[4:]
+
+    if tail == BYTES:
+        if has_data:
+            def encode(*args):
+                payload = args[-1]
+                size = len(payload)
+                length = base + (size + 3) // 4
+                if length > 0xFFFF:
+                    header = big(pack(opcode, args[0], 0, *args[1:-1]), length)
+                else:
+                    header = pack(opcode, args[0], length, *args[1:-1])
+                return header + payload + _PADDING[-size & 3]
+        else:
+            def encode(*args):
+                payload = args[-1]
+                size = len(payload)
+                length = base + (size + 3) // 4
+                if length > 0xFFFF:
+                    header = big(pack(opcode, 0, 0, *args[:-1]), length)
+                else:
+                    header = pack(opcode, 0, length, *args[:-1])
+                return header + payload + _PADDING[-size & 3]
+        return encode
+
+    # Value-lists and lists of fixed-size structures (points, rectangles, ...)
+    items = _ListPacker(order + ('I' if tail == VALUES else tail))
+    words = items.item_size // 4
+    pack_items = items.pack
+    if has_data:
+        def encode(*args):
+            entries = args[-1]
+            length = base + len(entries) * words
+            if length > 0xFFFF:
+                header = big(pack(opcode, args[0], 0, *args[1:-1]), length)
+            else:
+                header = pack(opcode, args[0], length, *args[1:-1])
+            return header + pack_items(entries)
+    else:
+        def encode(*args):
+            entries = args[-1]
+            length = base + len(entries) * words
+            if length > 0xFFFF:
+                header = big(pack(opcode, 0, 0, *args[:-1]), length)
+            else:
+                header = pack(opcode, 0, length, *args[:-1])
+            return header + pack_items(entries)
+    return encode
+
+class _ListPacker:
+    # Packs a list of equally shaped items with a single Struct per item count
+    def __init__(self, item_format):
+        self.order = item_format[0]
+        self.item_format = item_format[1:]
+        self.item = struct.Struct(item_format)
+        self.item_size = self.item.size
+        self.flat = len(self.item_format) == 1
+        self._cache = {}
+
+    def pack(self, items):
+        count = len(items)
+        packer = self._cache.get(count)
+        if packer is None:
+            if len(self._cache) > 256:
+                self._cache.clear()
+            packer = self._cache[count] = struct.Struct(
+                self.order + self.item_format * count)
+        if self.flat:
+            return packer.pack(*items)
+        return packer.pack(*[value for item in items for value in item])
+
+class _StringPacker:
+    # Packs a fixed header followed by a STRING8 padded to 4 bytes, with a
+    # single Struct per padded length
+    def __init__(self, head_format):
+        self.head_format = head_format
+        self._cache = {}
+
+    def pack(self, size):
+        padded = (size + 3) & ~3
+        packer = self._cache.get(padded)
+        if packer is None:
+            if len(self._cache) > 256:
+                self._cache.clear()
+            packer = self._cache[padded] = struct.Struct(f"{self.head_format}{padded}s").pack
+        return packer
+
+def _make_decoder(order, reply):
+    names = [reply.data[0]] if reply.data else []
+    formats = 'x' + (TYPES[reply.data[1]] if reply.data else 'x') + '6x'
+    for name, kind in reply.fields:
+        formats += TYPES[kind]
+        if not kind.startswith('PAD'):
+            names.append(name)
+    tuple_type = collections.namedtuple(reply.name + 'Reply', names)
+    unpack_from = struct.Struct(order + formats).unpack_from
+    make = tuple_type._make
+
+    def decode(data):
+        return make(unpack_from(data))
+    return decode
+
+def _make_parts_encoder(order, request):
+    # Like the BYTES encoder but returns (header, payload, padding) without
+    # joining them, so large payloads (image rows) can be written with
+    # scatter-gather I/O straight from the caller's buffer
+    formats = ''.join(TYPES[kind] for _, kind in request.fields)
+    head = struct.Struct(order + 'BBH' + formats)
+    base = head.size // 4
+    pack = head.pack
+    pack_length = struct.Struct(order + 'I').pack
+    opcode = request.opcode
+    has_data = request.data is not None
+
+    def encode(*args):
+        payload = args[-1]
+        size = len(payload) if not isinstance(payload, memoryview) else payload.nbytes
+        length = base + (size + 3) // 4
+        data, fields = (args[0], args[1:-1]) if has_data else (0, args[:-1])
+        if length > 0xFFFF:
+            header = pack(opcode, data, 0, *fields)
+            header = header[:4] + pack_length(length + 1) + header[4:]
+        else:
+            header = pack(opcode, data, length, *fields)
+        return header, payload, _PADDING[-size & 3]
+    return encode
+
+class _Namespace:
+    pass
+
+class Protocol:
+    def __init__(self, byte_order='>'):
+        if byte_order not in '<>' or len(byte_order) != 1:
+            raise ValueError(f"byte order must be '<' or '>', not {byte_order!r}")
+        self.byte_order = byte_order
+        for request in REQUESTS:
+            setattr(self, request.name, _make_encoder(byte_order, request))
+        self.parts = _Namespace()
+        for request in REQUESTS:
+            if request.tail == BYTES:
+                setattr(self.parts, request.name, _make_parts_encoder(byte_order, request))
+        self.replies = _Namespace()
+        for reply in REPLIES:
+            setattr(self.replies, reply.name, _make_decoder(byte_order, reply))
+
+_protocols = {}
+
+def protocol(byte_order='>'):
+    proto = _protocols.get(byte_order)
+    if proto is None:
+        proto = _protocols[byte_order] = Protocol(byte_order)
+    return proto
+
+def text_items(string, delta=0):
+    # LISTofTEXTITEM8 for PolyText8; strings longer than 254 bytes are split
+    # into several items that follow on from each other
+    items = []
+    for start in range(0, max(len(string), 1), 254):
+        chunk = string[start:start + 254]
+        items.append(bytes((len(chunk), delta & 0xFF)))
+        items.append(chunk)
+        delta = 0
+    return b''.join(items)
+
+def parse_str_list(data, offset, count):
+    # LISTofSTR: length byte followed by the name, packed without padding
+    names = []
+    for _ in range(count):
+        size = data[offset]
+        names.append(str(data[offset + 1:offset + 1 + size], 'ascii', errors='ignore'))
+        offset += 1 + size
+    return names
@@ -0,0 +1,269 @@
+import copy
+import hashlib
+import os
+import pickle
+import struct
+import sys
+
+# Connection setup block parser.
+#
+# parse_setup() walks the whole reply once: fixed header, vendor string,
+# pixmap formats, screens, allowed depths and visuals. The result is a tree of
+# small __slots__ objects with dictionaries for the lookups clients actually
+# do (visual by id, visuals by depth, pixmap format by depth).
+#
+# Everything after the vendor string is the same on every connection to a
+# given server, only the header (resource-id-base in particular) and each
+# root window's current-input-masks and size change. A SetupCache keeps the
+# parsed screens and formats in memory and on disk, keyed by host, display,
+# vendor and release, and checks a digest of the raw bytes (without those
+# root fields, which are read afresh) before reusing them. The same cache
+# remembers each server's image byte order for connect(byte_order='server').
+
+class Visual:
+    __slots__ = ('visual_id', 'visual_class', 'bits_per_rgb', 'colormap_entries',
+                 'red_mask', 'green_mask', 'blue_mask', 'depth')
+
+    def __repr__(self):
+        return f"<Visual 0x{self.visual_id:x} class={self.visual_class} depth={self.depth}>"
+
+class Depth:
+    __slots__ = ('depth', 'visuals')
+
+    def __repr__(self):
+        return f"<Depth {self.depth} visuals={len(self.visuals)}>"
+
+class PixmapFormat:
+    __slots__ = ('depth', 'bits_per_pixel', 'scanline_pad')
+
+    def __repr__(self):
+        return f"<PixmapFormat depth={self.depth} bpp={self.bits_per_pixel} pad={self.scanline_pad}>"
+
+class Screen:
+    __slots__ = ('root', 'default_colormap', 'white_pixel', 'black_pixel',
+                 'current_input_masks', 'width_pixels', 'height_pixels',
+                 'width_mm', 'height_mm', 'min_installed_maps', 'max_installed_maps',
+                 'root_visual', 'backing_stores', 'save_unders', 'root_depth',
+                 'depths', 'visuals', 'visuals_by_depth')
+
+    def __repr__(self):
+        return (f"<Screen root=0x{self.root:x} {self.width_pixels}x{self.height_pixels} "
+                f"depth={self.root_depth}>")
+
+class Setup:
+    __slots__ = ('protocol_major', 'protocol_minor', 'release', 'resource_id_base',
+                 'resource_id_mask', 'motion_buffer_size', 'max_request_length',
+                 'image_byte_order', 'bitmap_bit_order', 'scanline_unit', 'scanline_pad',
+                 'min_keycode', 'max_keycode', 'vendor', 'pixmap_formats', 'formats_by_depth',
+                 'screens', 'visuals')
+
+    def __repr__(self):
+        return (f"<Setup {self.vendor!r} release={self.release} "
+                f"screens={len(self.screens)}>")
+
+    def format_for_depth(self, depth):
+        return self.formats_by_depth[depth]
+
+    def visual(self, visual_id):
+        return self.visuals[visual_id]
+
+_structs = {}
+
+def _structs_for(order):
+    structs = _structs.get(order)
+    if structs is None:
+        structs = _structs[order] = (
+            struct.Struct(order + 'BxHHHIIIIHHBBBBBBBB4x'),     # header
+            struct.Struct(order + 'BBB5x'),                     # FORMAT
+            struct.Struct(order + 'IIIIIHHHHHHIBBBB'),          # SCREEN
+            struct.Struct(order + 'BxH4x'),                     # DEPTH
+            struct.Struct(order + 'IBBHIII4x'),                 # VISUALTYPE
+            struct.Struct(order + '16xIHHHH'),                  # SCREEN root fields
+        )
+    return structs
+
+def _static_tables(data, offset, num_formats, num_screens, order):
+    # The formats and screens from offset on, with each screen's
+    # current-input-masks and root size zeroed (they change while the server
+    # runs: event selection on the root window, RandR), for the cache
+    # digest; and the offset of every SCREEN
+    static = bytearray(data[offset:])
+    tables = offset
+    offset += num_formats * 8
+    screen_offsets = []
+    for _ in range(num_screens):
+        screen_offsets.append(offset)
+        static[offset - tables + 16:offset - tables + 28] = bytes(12)
+        num_depths = data[offset + 39]
+        offset += 40
+        for _ in range(num_depths):
+            offset += 8 + struct.unpack_from(order + 'H', data, offset + 2)[0] * 24
+    return static, screen_offsets
+
+def parse_setup(data, byte_order='>', cache=None, key=None):
+    (header, format_struct, screen_struct, depth_struct, visual_struct,
+     root_fields) = _structs_for(byte_order)
+    (status, protocol_major, protocol_minor, _, release, resource_id_base,
+     resource_id_mask, motion_buffer_size, vendor_len, max_request_length,
+     num_screens, num_formats, image_byte_order, bitmap_bit_order, scanline_unit,
+     scanline_pad, min_keycode, max_keycode) = header.unpack_from(data)
+    if status != 1:
+        raise ValueError(f"not a successful setup reply (status {status})")
+
+    setup = Setup()
+    setup.protocol_major = protocol_major
+    setup.protocol_minor = protocol_minor
+    setup.release = release
+    setup.resource_id_base = resource_id_base
+    setup.resource_id_mask = resource_id_mask
+    setup.motion_buffer_size = motion_buffer_size
+    setup.max_request_length = max_request_length
+    setup.image_byte_order = image_byte_order
+    setup.bitmap_bit_order = bitmap_bit_order
+    setup.scanline_unit = scanline_unit
+    setup.scanline_pad = scanline_pad
+    setup.min_keycode = min_keycode
+    setup.max_keycode = max_keycode
+    setup.vendor = str(data[40:40 + vendor_len], 'ascii', errors='ignore')
+
+    offset = 40 + vendor_len + (-vendor_len & 3)
+    digest = cache_key = None
+    if cache is not None and key is not None:
+        cache_key = (*key, setup.vendor, release)
+        static, screen_offsets = _static_tables(data, offset, num_formats, num_screens,
+                                                byte_order)
+        digest = hashlib.blake2b(static, digest_size=16).digest()
+        cached = cache.get(cache_key, digest)
+        if cached is not None:
+            setup.pixmap_formats, setup.formats_by_depth, screens, setup.visuals = cached
+            # Copies of the cached screens with this connection's root fields
+            setup.screens = []
+            for screen, screen_offset in zip(screens, screen_offsets):
+                screen = copy.copy(screen)
+                (screen.current_input_masks, screen.width_pixels, screen.height_pixels,
+                 screen.width_mm, screen.height_mm) = root_fields.unpack_from(data, screen_offset)
+                setup.screens.append(screen)
+            return setup
+
+    formats = []
+    for _ in range(num_formats):
+        pixmap_format = PixmapFormat()
+        (pixmap_format.depth, pixmap_format.bits_per_pixel,
+         pixmap_format.scanline_pad) = format_struct.unpack_from(data, offset)
+        formats.append(pixmap_format)
+        offset += 8
+
+    screens = []
+    all_visuals = {}
+    for _ in range(num_screens):
+        screen = Screen()
+        (screen.root, screen.default_colormap, screen.white_pixel, screen.black_pixel,
+         screen.current_input_masks, screen.width_pixels, screen.height_pixels,
+         screen.width_mm, screen.height_mm, screen.min_installed_maps,
+         screen.max_installed_maps, screen.root_visual, screen.backing_stores,
+         screen.save_unders, screen.root_depth, num_depths) = screen_struct.unpack_from(data, offset)
+        offset += 40
+        screen.depths = []
+        screen.visuals = {}
+        screen.visuals_by_depth = {}
+        for _ in range(num_depths):
+            depth = Depth()
+            depth.depth, num_visuals = depth_struct.unpack_from(data, offset)
+            offset += 8
+            depth.visuals = []
+            for _ in range(num_visuals):
+                visual = Visual()
+                (visual.visual_id, visual.visual_class, visual.bits_per_rgb,
+                 visual.colormap_entries, visual.red_mask, visual.green_mask,
+                 visual.blue_mask) = visual_struct.unpack_from(data, offset)
+                visual.depth = depth.depth
+                offset += 24
+                depth.visuals.append(visual)
+                screen.visuals[visual.visual_id] = visual
+            screen.depths.append(depth)
+            screen.visuals_by_depth[depth.depth] = depth.visuals
+        all_visuals.update(screen.visuals)
+        screens.append(screen)
+
+    setup.pixmap_formats = formats
+    setup.formats_by_depth = {pixmap_format.depth: pixmap_format for pixmap_format in formats}
+    setup.screens = screens
+    setup.visuals = all_visuals
+    if cache_key is not None:
+        cache.put(cache_key, digest, (setup.pixmap_formats, setup.formats_by_depth,
+                                      setup.screens, setup.visuals))
+    return setup
+
+# connect(byte_order=SERVER_ORDER): use the server's own byte order
+SERVER_ORDER = 'server'
+
+_server_orders = {}
+
+def server_byte_order(host, display, cache=None):
+    # The image byte order seen on an earlier connection to (host, display),
+    # which servers set to their native order, or this machine's order
+    key = ('byte-order', host, display)
+    order = _server_orders.get(key)
+    if order is None and cache is not None:
+        order = cache.get(key, 1)
+    if order is None:
+        order = '<' if sys.byteorder == 'little' else '>'
+    return order
+
+def remember_server_order(host, display, setup, cache=None):
+    key = ('byte-order', host, display)
+    order = '>' if setup.image_byte_order == 1 else '<'
+    if _server_orders.get(key) != order:
+        _server_orders[key] = order
+        if cache is not None:
+            cache.put(key, 1, order)
+
+def default_cache_dir():
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'xsdl')
+
+class SetupCache:
+    def __init__(self, directory=None):
+        self.directory = directory if directory is not None else default_cache_dir()
+        self._entries = {}
+
+    def _path(self, key):
+        name = hashlib.blake2b(repr(key).encode('utf-8'), digest_size=12).hexdigest()
+        return os.path.join(self.directory, f"setup-{name}.pickle")
+
+    def get(self, key, digest):
+        entry = self._entries.get(key)
+        if entry is None and self.directory:
+            path = self._path(key)
+            try:
+                with open(path, 'rb') as f:
+                    entry = pickle.load(f)
+            except OSError:
+                return None
+            except Exception:
+                # Truncated, corrupt or written by another version: whatever
+                # unpickling raises, the file is a miss and is removed
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                return None
+            self._entries[key] = entry
+        if entry is None or entry[0] != digest:
+            return None
+        return entry[1]
+
+    def put(self, key, digest, tables):
+        self._entries[key] = (digest, tables)
+        if not self.directory:
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = self._path(key)
+            # Write then rename so a concurrent reader never sees half a file
+            temp = f"{path}.{os.getpid()}.tmp"
+            with open(temp, 'wb') as f:
+                pickle.dump((digest, tables), f, pickle.HIGHEST_PROTOCOL)
+            os.replace(temp, path)
+        except OSError:
+            pass
@@ -0,0 +1,108 @@
+import struct
+
+# Length-framed reader for the server -> client byte stream.
+#
+# Bytes are received straight into a bytearray with recv_into() and every
+# complete message is handed out as a memoryview slice of that buffer, so
+# payloads are never copied. When the buffer runs out of room a fresh one is
+# allocated and only the unfinished tail is moved across; bytes that have
+# already been handed out are never overwritten, so a message view stays valid
+# for as long as the caller holds it (copy it with bytes() if it is kept for a
+# long time, since it pins the whole buffer).
+
+X_Error = 0
+X_Reply = 1
+GenericEvent = 35
+
+class MessageReader:
+    def __init__(self, byte_order='>', on_reply=None, on_event=None, on_error=None,
+                 size=65536):
+        self.on_reply = on_reply
+        self.on_event = on_event
+        self.on_error = on_error
+        self._length = struct.Struct(byte_order + 'I')
+        self._buf = bytearray(size)
+        self._view = memoryview(self._buf)
+        self._start = 0
+        self._end = 0
+
+    def __len__(self):
+        return self._end - self._start
+
+    def _reserve(self, size):
+        if len(self._buf) - self._end >= size:
+            return
+        pending = self._end - self._start
+        new_size = len(self._buf)
+        while new_size - pending < size:
+            new_size *= 2
+        buf = bytearray(new_size)
+        buf[:pending] = self._view[self._start:self._end]
+        self._buf = buf
+        self._view = memoryview(buf)
+        self._start = 0
+        self._end = pending
+
+    def fill(self, sock, size=4096):
+        self._reserve(size)
+        received = sock.recv_into(self._view[self._end:])
+        if not received:
+            raise ConnectionError("X server closed the connection")
+        self._end += received
+        return received
+
+    def feed(self, data):
+        # For callers that get their bytes from somewhere else (asyncio, captures)
+        size = len(data)
+        self._reserve(size)
+        self._view[self._end:self._end + size] = data
+        self._end += size
+
+    def take(self, size):
+        if self._end - self._start < size:
+            return None
+        view = self._view[self._start:self._start + size]
+        self._start += size
+        return view
+
+    def read_exact(self, sock, size):
+        while self._end - self._start < size:
+            self.fill(sock, size - (self._end - self._start))
+        return self.take(size)
+
+    def next_message(self):
+        available = self._end - self._start
+        if available < 32:
+            return None
+        kind = self._buf[self._start]
+        size = 32
+        if kind == X_Reply or kind & 0x7F == GenericEvent:
+            size += 4 * self._length.unpack_from(self._buf, self._start + 4)[0]
+            if available < size:
+                # Make sure the rest of a large reply fits in one recv_into()
+                self._reserve(size - available)
+                return None
+        view = self._view[self._start:self._start + size]
+        self._start += size
+        return view
+
+    def __iter__(self):
+        while True:
+            message = self.next_message()
+            if message is None:
+                return
+            yield message
+
+    def dispatch(self):
+        # Sends every complete message to its consumer; returns how many there were
+        count = 0
+        for message in self:
+            kind = message[0]
+            if kind == X_Error:
+                self.on_error(message)
+            elif kind == X_Reply:
+                self.on_reply(message)
+            else:
+                self.on_event(message)
+            count += 1
+        return count
@@ -0,0 +1,262 @@
+import collections
+import struct
+import time
+
+from xproto import REQUEST_NAMES
+
+# Wire tracing.
+#
+# A WireTrace attached to a connection (conn.trace) sees every request as it
+# is queued and every reply, event and error as it is dispatched. It keeps
+# the last `frames` frames in a ring buffer (each cut to `frame_bytes`, with
+# the real length kept), request/reply counts and byte totals per opcode and
+# a log2 histogram of request-to-reply latency, measured from the flush that
+# put the request on the wire. Recording copies raw bytes only; nothing is
+# formatted until dump(), summary() or str() is called, so logging a trace
+# with logger.debug("%s", trace) costs nothing when DEBUG is off.
+#
+# export() writes the ring to a capture file that read_capture() (and
+# decode-capture.py) can replay offline. The format is a 16-byte header, b'XTRACE1\0'
+# followed by the connection's byte order (b'B' or b'l') and 7 zero bytes,
+# then one record per frame: a little-endian header (time in seconds as a
+# double, kind, flags, sequence number, original length, stored length)
+# followed by the stored bytes.
+
+REQUEST = 0
+SERVER = 1      # reply, event or error
+SETUP = 2       # the server's connection setup block
+
+TRUNCATED = 1
+
+MAGIC = b'XTRACE1\0'
+RECORD = struct.Struct('<dBBxxIII')
+HISTOGRAM_BUCKETS = 32    # bucket n counts latencies below 2**n microseconds
+
+class OpcodeStats:
+    __slots__ = ('requests', 'request_bytes', 'replies', 'reply_bytes', 'errors', 'histogram')
+
+    def __init__(self):
+        self.requests = 0
+        self.request_bytes = 0
+        self.replies = 0
+        self.reply_bytes = 0
+        self.errors = 0
+        self.histogram = [0] * HISTOGRAM_BUCKETS
+
+    def latency_percentile(self, fraction):
+        # Upper bound in microseconds of the bucket holding that fraction of
+        # the replies, or None without replies
+        total = sum(self.histogram)
+        if not total:
+            return None
+        seen = 0
+        for bucket, count in enumerate(self.histogram):
+            seen += count
+            if seen >= fraction * total:
+                return 1 << bucket
+        return 1 << (HISTOGRAM_BUCKETS - 1)
+
+class WireTrace:
+    def __init__(self, frames=4096, frame_bytes=256, clock=time.perf_counter):
+        self.ring = collections.deque(maxlen=frames)
+        self.frame_bytes = frame_bytes
+        self.clock = clock
+        self.byte_order = '>'
+        self.setup_data = None
+        self.opcodes = {}
+        self.events = collections.Counter()
+        self.errors = collections.Counter()
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self._waiting = {}    # sequence -> [opcode, time sent]
+        self._unsent = []     # reply requests queued since the last flush
+
+    def attach(self, conn):
+        self.byte_order = conn.byte_order
+        self.setup_data = bytes(conn.setup_data)
+        conn.trace = self
+        return self
+
+    def detach(self, conn):
+        if conn.trace is self:
+            conn.trace = None
+
+    # Called by the connection
+
+    def request(self, sequence, buffers, has_reply):
+        now = self.clock()
+        opcode = buffers[0][0]
+        length = 0
+        for buffer in buffers:
+            length += len(buffer)
+        stats = self.opcodes.get(opcode)
+        if stats is None:
+            stats = self.opcodes[opcode] = OpcodeStats()
+        stats.requests += 1
+        stats.request_bytes += length
+        self.bytes_out += length
+        self.ring.append((now, REQUEST, sequence, length, _head(buffers, self.frame_bytes)))
+        if has_reply:
+            self._waiting[sequence] = [opcode, now]
+            self._unsent.append(sequence)
+
+    def flushed(self, queued=None):
+        # queued: sequence number of a request that is still in the buffer
+        if self._unsent:
+            now = self.clock()
+            waiting = self._waiting
+            kept = []
+            for sequence in self._unsent:
+                if sequence == queued:
+                    kept.append(sequence)
+                    continue
+                entry = waiting.get(sequence)
+                if entry is not None:
+                    entry[1] = now
+            self._unsent = kept
+
+    def message(self, sequence, data):
+        now = self.clock()
+        length = len(data)
+        self.bytes_in += length
+        self.ring.append((now, SERVER, sequence, length, bytes(data[:self.frame_bytes])))
+        kind = data[0]
+        if kind > 1:
+            self.events[kind & 0x7F] += 1
+            return
+        entry = self._waiting.pop(sequence, None)
+        if kind == 0:
+            self.errors[data[1]] += 1
+            if entry is not None:
+                self.opcodes[entry[0]].errors += 1
+            return
+        if entry is None:
+            return
+        stats = self.opcodes[entry[0]]
+        stats.replies += 1
+        stats.reply_bytes += length
+        bucket = int((now - entry[1]) * 1e6).bit_length()
+        stats.histogram[min(bucket, HISTOGRAM_BUCKETS - 1)] += 1
+
+    # Output, formatted only on demand
+
+    def summary(self):
+        opcodes = {}
+        for opcode, stats in sorted(self.opcodes.items()):
+            entry = {"requests": stats.requests, "bytes": stats.request_bytes}
+            if stats.replies:
+                entry["replies"] = stats.replies
+                entry["reply_bytes"] = stats.reply_bytes
+                entry["latency_us"] = {
+                    "p50": stats.latency_percentile(0.5),
+                    "p90": stats.latency_percentile(0.9),
+                    "p99": stats.latency_percentile(0.99),
+                    "histogram": {f"<{1 << bucket}": count
+                                  for bucket, count in enumerate(stats.histogram) if count},
+                }
+            if stats.errors:
+                entry["errors"] = stats.errors
+            opcodes[opcode_name(opcode)] = entry
+        return {"bytes_out": self.bytes_out, "bytes_in": self.bytes_in, "opcodes": opcodes,
+                "events": dict(self.events), "errors": dict(self.errors)}
+
+    def dump(self, last=None):
+        # Formats the ring (or its last frames) as hex dump lines
+        frames = list(self.ring)
+        if last is not None:
+            frames = frames[-last:]
+        lines = []
+        for when, kind, sequence, length, data in frames:
+            if kind == REQUEST:
+                title = f"-> #{sequence} {opcode_name(data[0])}"
+            elif data[0] == 0:
+                title = f"<- #{sequence} error {data[1]}"
+            elif data[0] == 1:
+                title = f"<- #{sequence} reply"
+            else:
+                title = f"<- #{sequence} event {data[0] & 0x7F}"
+            cut = f" (first {len(data)} bytes)" if len(data) < length else ""
+            lines.append(f"{when:.6f} {title}, {length} bytes{cut}")
+            lines.append(hexdump(data, '    '))
+        return '\n'.join(lines)
+
+    def __str__(self):
+        lines = [f"{self.bytes_out} bytes out, {self.bytes_in} bytes in"]
+        for name, entry in self.summary()["opcodes"].items():
+            line = f"  {name}: {entry['requests']} requests, {entry['bytes']} bytes"
+            if "latency_us" in entry:
+                latency = entry["latency_us"]
+                line += f", reply p50 < {latency['p50']} us, p99 < {latency['p99']} us"
+            lines.append(line)
+        return '\n'.join(lines)
+
+    def export(self, path):
+        with open(path, 'wb') as capture:
+            capture.write(MAGIC + (b'B' if self.byte_order == '>' else b'l') + bytes(7))
+            if self.setup_data is not None:
+                capture.write(RECORD.pack(0.0, SETUP, 0, 0, len(self.setup_data),
+                                          len(self.setup_data)))
+                capture.write(self.setup_data)
+            for when, kind, sequence, length, data in self.ring:
+                flags = TRUNCATED if len(data) < length else 0
+                capture.write(RECORD.pack(when, kind, flags, sequence, length, len(data)))
+                capture.write(data)
+
+def _head(buffers, limit):
+    # The first limit bytes of a request passed in pieces, without joining
+    # (and copying) a large payload
+    first = buffers[0]
+    if len(buffers) == 1 or len(first) >= limit:
+        return bytes(first[:limit])
+    parts = []
+    size = 0
+    for buffer in buffers:
+        part = bytes(buffer[:limit - size])
+        parts.append(part)
+        size += len(part)
+        if size >= limit:
+            break
+    return b''.join(parts)
+
+def read_capture(path):
+    # Returns the byte order and an iterator of
+    # (time, kind, flags, sequence, length, data) records
+    capture = open(path, 'rb')
+    header = capture.read(16)
+    if header[:8] != MAGIC:
+        capture.close()
+        raise ValueError(f"{path} is not a wire trace capture")
+
+    def records():
+        with capture:
+            while True:
+                record = capture.read(RECORD.size)
+                if len(record) < RECORD.size:
+                    return
+                when, kind, flags, sequence, length, stored = RECORD.unpack(record)
+                yield when, kind, flags, sequence, length, capture.read(stored)
+
+    return ('>' if header[8:9] == b'B' else '<'), records()
+
+def opcode_name(opcode):
+    return REQUEST_NAMES.get(opcode, f"opcode {opcode}")
+
+_PRINTABLE = bytes(byte if 32 <= byte < 127 else ord('.') for byte in range(256))
+
+def hexdump(data, prefix=''):
+    # Classic 16-bytes-per-line dump; the conversions run per line in C
+    data = bytes(data)
+    text = data.translate(_PRINTABLE).decode('ascii')
+    return '\n'.join(f"{prefix}{offset:04x}: {data[offset:offset + 16].hex(' '):<48} "
+                     f"{text[offset:offset + 16]}"
+                     for offset in range(0, len(data), 16))
+
+class LazyHex:
+    # Hex string of data, built only if the log record is actually emitted
+    __slots__ = ('data',)
+
+    def __init__(self, data):
+        self.data = data
+
+    def __str__(self):
+        return self.data.hex()
@@ -0,0 +1,127 @@
+import time
+
+# Buffered request output.
+#
+# OutputBuffer copies encoded requests into one preallocated bytearray and
+# writes everything queued with a single sendall(), or a single sendmsg()
+# when large payloads (PutImage data and the like) are queued: those are
+# never copied, they go out as their own iovecs straight from the caller's
+# memory, in order between the buffered bytes around them. A write happens
+# when the connection needs a reply (it calls flush()), when the next
+# request does not fit, or when a request is queued after the oldest unsent
+# one has waited `delay` seconds. There is no timer, so the delay is only
+# checked as requests are queued: a client that goes idle has to flush. The
+# blocking paths in this project do (reply waits, next_event(), close(),
+# xbackbuffer's present() and FramePacer.wait(conn)).
+
+LARGE_PAYLOAD = 16384
+_IOV_MAX = 1024
+
+# What OutputBuffer.write() sent
+SENT_NOTHING = 0
+SENT_EARLIER = 1    # the requests queued before this one, this one is queued
+SENT_ALL = 2        # everything, this request included
+
+class OutputBuffer:
+    def __init__(self, sock, size=65536, delay=0.005, clock=time.monotonic):
+        # delay None: only flush when full or asked to
+        self.sock = sock
+        self.buffer = bytearray(max(size, LARGE_PAYLOAD))
+        self.used = 0
+        self.delay = delay
+        self.clock = clock
+        self._payloads = []    # (offset in buffer, large payload)
+        self._payload_bytes = 0
+        self._deadline = None
+        self.flushes = 0
+        self.bytes_sent = 0
+
+    def __len__(self):
+        return self.used + self._payload_bytes
+
+    def write(self, buffers):
+        # Queues one request given in pieces; returns SENT_NOTHING,
+        # SENT_EARLIER or SENT_ALL
+        buffer = self.buffer
+        pieces = []
+        small = 0
+        for data in buffers:
+            if type(data) is not bytes:
+                data = memoryview(data).cast('B')
+            pieces.append(data)
+            if len(data) < LARGE_PAYLOAD:
+                small += len(data)
+        sent = SENT_NOTHING
+        if self.used + small > len(buffer):
+            # Whole requests only, so the request is either all queued or
+            # all sent
+            sent = SENT_EARLIER if self.flush() else SENT_NOTHING
+        for data in pieces:
+            size = len(data)
+            if size >= LARGE_PAYLOAD:
+                self._payloads.append((self.used, data))
+                self._payload_bytes += size
+                continue
+            if self.used + size > len(buffer):
+                # Small pieces larger than the whole buffer: send them as
+                # they come and the rest of the request below
+                self.flush()
+                sent = SENT_ALL
+            buffer[self.used:self.used + size] = data
+            self.used += size
+        if sent == SENT_ALL or self._payload_bytes >= len(buffer):
+            self.flush()
+            return SENT_ALL
+        if self.delay is not None:
+            now = self.clock()
+            if self._deadline is None:
+                self._deadline = now + self.delay
+            elif now >= self._deadline:
+                self.flush()
+                return SENT_ALL
+        return sent
+
+    def flush(self):
+        # Returns False if there was nothing to send
+        if not self.used and not self._payloads:
+            return False
+        view = memoryview(self.buffer)
+        if not self._payloads:
+            self.sock.sendall(view[:self.used])
+        else:
+            iov = []
+            start = 0
+            for offset, payload in self._payloads:
+                if offset > start:
+                    iov.append(view[start:offset])
+                    start = offset
+                iov.append(payload)
+            if self.used > start:
+                iov.append(view[start:self.used])
+            _send_iov(self.sock, iov)
+        self.bytes_sent += len(self)
+        self.flushes += 1
+        self.used = 0
+        self._payloads = []
+        self._payload_bytes = 0
+        self._deadline = None
+        return True
+
+def _send_iov(sock, iov):
+    if not hasattr(sock, 'sendmsg'):
+        for buffer in iov:
+            sock.sendall(buffer)
+        return
+    views = [memoryview(buffer) for buffer in iov]
+    first = 0
+    while first < len(views):
+        sent = sock.sendmsg(views[first:first + _IOV_MAX])
+        # Skip what went out and trim a partially sent buffer
+        while sent:
+            size = views[first].nbytes
+            if sent >= size:
+                sent -= size
+                first += 1
+            else:
+                views[first] = views[first][sent:]
+                sent = 0